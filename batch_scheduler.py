@@ -0,0 +1,98 @@
+"""Parallel, resource-aware scheduler of batch test cases.
+
+- At most `max_workers` jobs run at the same time.
+- At most N jobs use the same data source at the same time (`data_source_concurrency`,
+  1 by default), so tests of different data sources overlap, but don't disturb
+  each other's measurements.
+- `exclusive` jobs (throughput-sensitive tests) run alone.
+
+Jobs are started in their order. A waiting exclusive job is not overtaken
+by later jobs, so it isn't starved.
+Results are returned in the order of jobs regardless of the completion order.
+"""
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+
+class Job:
+    def __init__(self, run: Callable[[], Any], data_sources: FrozenSet[str], exclusive: bool = False):
+        """
+        Args:
+            run: Function that executes the job and returns its result.
+            data_sources: Names of data sources the job uses.
+            exclusive: If True, the job runs alone.
+        """
+        self.run = run
+        self.data_sources = data_sources
+        self.exclusive = exclusive
+
+
+class TestScheduler:
+    def __init__(self,
+                 max_workers: int = 1,
+                 data_source_concurrency: Optional[Dict[str, int]] = None,
+                 default_data_source_concurrency: int = 1):
+        self._max_workers = max_workers
+        self._data_source_concurrency = data_source_concurrency or {}
+        self._default_data_source_concurrency = default_data_source_concurrency
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._exclusive_running = False
+        self._data_source_usage: Dict[str, int] = {}
+        self._errors: List[BaseException] = []
+
+    def _get_cap(self, data_source: str) -> int:
+        return self._data_source_concurrency.get(data_source, self._default_data_source_concurrency)
+
+    def _can_start(self, job: Job) -> bool:
+        if self._running == 0:
+            return True
+        if job.exclusive or self._exclusive_running or self._running >= self._max_workers:
+            return False
+        return all(self._data_source_usage.get(ds, 0) < self._get_cap(ds) for ds in job.data_sources)
+
+    def _acquire(self, job: Job):
+        self._running += 1
+        self._exclusive_running = job.exclusive
+        for ds in job.data_sources:
+            self._data_source_usage[ds] = self._data_source_usage.get(ds, 0) + 1
+
+    def _release(self, job: Job):
+        self._running -= 1
+        if job.exclusive:
+            self._exclusive_running = False
+        for ds in job.data_sources:
+            self._data_source_usage[ds] -= 1
+
+    def _worker(self, idx: int, job: Job, results: list):
+        try:
+            results[idx] = job.run()
+        except BaseException as e:
+            with self._cond:
+                self._errors.append(e)
+        finally:
+            with self._cond:
+                self._release(job)
+                self._cond.notify()
+
+    def run(self, jobs: List[Job]) -> list:
+        """Runs all jobs and returns their results in the order of jobs."""
+        results = [None] * len(jobs)
+        pending = list(range(len(jobs)))
+
+        with self._cond:
+            while pending or self._running:
+                for idx in list(pending):
+                    job = jobs[idx]
+                    if self._can_start(job):
+                        self._acquire(job)
+                        pending.remove(idx)
+                        threading.Thread(target=self._worker, args=(idx, job, results), daemon=True).start()
+                    elif job.exclusive:
+                        break
+                self._cond.wait()
+
+        if self._errors:
+            raise self._errors[0]
+        return results
@@ -0,0 +1,92 @@
+"""Records/s of json line outputs: the old per-record `print(json.dumps(...))` vs buffered writers with every
+installed serializer.
+
+Run from the repo root:
+
+    python benchmarks/serializer_throughput.py -n 5
+    python benchmarks/serializer_throughput.py -n 5 --input messages.json   # records of `ds get messages -o`
+
+Output goes to os.devnull, so only encoding and writing are measured.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from th2_ds.cli_util import serializers, writers  # noqa: E402
+
+
+def _synthetic_messages(count: int) -> list:
+    return [{"timestamp": {"epochSecond": 1729691698 + i // 1000, "nano": i % 1000 * 1000},
+             "direction": "OUT" if i % 2 else "IN",
+             "sessionId": f"demo-conn{i % 4}",
+             "sessionGroup": f"demo-conn{i % 4}",
+             "messageId": f"test_book:demo-conn{i % 4}:2:20241023135458{i:09d}:{i}",
+             "attachedEventIds": [],
+             "body": [{"metadata": {"messageType": "NewOrderSingle", "id": {"sequence": i}},
+                       "fields": {"ClOrdID": str(i), "Price": f"{i * 0.25:.2f}", "OrderQty": i % 100,
+                                  "Side": "1", "Text": "", "Parties": [{"PartyID": "P1", "PartyRole": 3}]}}],
+             "bodyBase64": "AAAA"}
+            for i in range(count)]
+
+
+def _load(path: str) -> list:
+    with open(path, 'rb') as f:
+        return [json.loads(line) for line in f]
+
+
+def _print_baseline(records: list):
+    with open(os.devnull, 'w') as f:
+        for m in records:
+            print(json.dumps(m, separators=(",", ":")), file=f)
+
+
+def _buffered(encoder):
+    def run(records: list):
+        default = writers.encode_line
+        writers.encode_line = encoder  # write_lines looks the encoder up on every call.
+        try:
+            with open(os.devnull, 'wb') as f:
+                writers.write_lines(records, f)
+        finally:
+            writers.encode_line = default
+    return run
+
+
+def _measure(run, records: list, repetitions: int) -> list:
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        run(records)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+@click.command()
+@click.option("-n", "--repetitions", default=5, show_default=True, type=click.IntRange(1))
+@click.option("--records", "count", default=200_000, show_default=True, type=click.IntRange(1),
+              help="Number of synthetic messages.")
+@click.option("--input", "input_path", type=click.Path(exists=True, dir_okay=False),
+              help="json lines file with records instead of synthetic messages.")
+def main(repetitions: int, count: int, input_path: str):
+    records = _load(input_path) if input_path else _synthetic_messages(count)
+    runs = {'print(json.dumps)': _print_baseline}
+    for name, encoder in serializers.available().items():
+        runs[f'buffered {name}'] = _buffered(encoder)
+
+    print(f"{len(records)} records, repetitions: {repetitions}, default serializer: {serializers.NAME}")
+    baseline = None
+    for name, run in runs.items():
+        run(records[:1000])  # Warm-up.
+        median = statistics.median(_measure(run, records, repetitions))
+        rate = len(records) / median
+        baseline = baseline or rate
+        print(f"{name:<20} {rate:>12,.0f} records/s  (x{rate / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
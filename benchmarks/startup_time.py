@@ -0,0 +1,60 @@
+"""Startup time benchmark of ds.py: eager plugins import vs lazy plugin loading.
+
+Run from the repo root:
+
+    python benchmarks/startup_time.py -n 10 -- get books --help
+    python benchmarks/startup_time.py -n 10 -- analysis alias --help
+
+Every run starts a fresh interpreter, the same way run_batch_testing does.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+import click
+
+
+def _measure(args, repetitions: int, env: dict) -> list:
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'ds.py', *args], env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _print_stats(name: str, times: list):
+    print(f"{name:<6} min: {min(times):.3f}s, median: {statistics.median(times):.3f}s, "
+          f"mean: {statistics.mean(times):.3f}s")
+
+
+@click.command()
+@click.option("-n", "--repetitions", default=10, show_default=True, type=click.IntRange(1))
+@click.argument("ds_args", nargs=-1, type=click.UNPROCESSED)
+def main(repetitions: int, ds_args: tuple):
+    """Runs `ds.py DS_ARGS` N times in both modes and prints timings.
+
+    Put `--` before DS_ARGS if they contain options.
+    """
+    args = list(ds_args) or ['--help']
+
+    eager_env = dict(os.environ, DS_EAGER_PLUGINS='1')
+    lazy_env = {k: v for k, v in os.environ.items() if k != 'DS_EAGER_PLUGINS'}
+
+    # Warm-up: builds the plugins manifest and the OS file cache.
+    _measure(args, 1, lazy_env)
+    _measure(args, 1, eager_env)
+
+    print(f"ds.py {' '.join(args)}, repetitions: {repetitions}")
+    eager = _measure(args, repetitions, eager_env)
+    lazy = _measure(args, repetitions, lazy_env)
+    _print_stats('eager', eager)
+    _print_stats('lazy', lazy)
+    print(f"Gain (median): {statistics.median(eager) - statistics.median(lazy):.3f}s "
+          f"(x{statistics.median(eager) / statistics.median(lazy):.2f})")
+
+
+if __name__ == '__main__':
+    main()
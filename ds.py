@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import traceback
 from datetime import datetime, timezone
 import click
@@ -9,6 +10,9 @@ from pathlib import Path
 __version__ = '2.2.0'
 
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
+from th2_ds.cli_util.lazy_group import LazyPluginGroup, load_plugin_entries
+
+PLUGINS_FOLDERS = ['th2_ds/cli_util/plugins', 'dsplugins']
 
 
 def print_version(ctx, param, value):
@@ -18,7 +22,7 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
-@click.group()
+@click.group(cls=LazyPluginGroup)
 @click.option("--version", is_flag=True, callback=print_version, expose_value=False, is_eager=True)
 def cli():
     """Data Services CLI util"""
@@ -58,8 +62,12 @@ def import_plugins(root_gr, plugins_folder_path: str) -> dict:  # {plugin_name:
 
 def main():
     # name: importlib.import_module(F"th2_data_services.cli_util.plugins.{name}")
-    import_plugins(cli, 'th2_ds/cli_util/plugins')
-    import_plugins(cli, 'dsplugins')
+    if os.environ.get('DS_EAGER_PLUGINS'):
+        # Old behaviour -- import all plugins on start. Useful for debugging and startup benchmark.
+        for plugins_folder in PLUGINS_FOLDERS:
+            import_plugins(cli, plugins_folder)
+    else:
+        cli.add_plugin_entries(load_plugin_entries(PLUGINS_FOLDERS))
     # from dsplugins_test import extend_get_plugin
 
     dt_object = datetime.now()
@@ -7,12 +7,13 @@ from th2_data_services.data import Data
 from th2_data_services.data_source.lwdp.struct import MessageStruct
 
 from dsplugins.analysis import analysis
+from th2_ds.cli_util import fetch_cache
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
-from th2_ds.cli_util.utils import counter, unix_timestamp, reset_counter, setup_counter, \
-    get_command_class_args, show_info, data_counter, get_ds_wrapper, generate_and_save_report, get_exception_info
+from th2_ds.cli_util.pipeline_metrics import PipelineMetrics, get_pipeline_metrics, metered_command
+from th2_ds.cli_util.utils import unix_timestamp, get_command_class_args, show_info, data_counter, get_ds_wrapper, generate_and_save_report, get_exception_info
 
 
 def map_add_unix_timestamp(m: dict):
@@ -81,13 +82,14 @@ def common_logic(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses,
         check2 = True
         for idx, val in enumerate(getattr(ctx.cfg.request_params, mode_to_name[message_mode])):
             get_messages_obj = ds_wrapper.get_messages_obj(ctx, dict({mode_to_name[message_mode]: [val]}))
-            msgs: Data = ds_wrapper.ds_impl.command(get_messages_obj)
+            msgs: Data = metered_command(ds_wrapper, get_messages_obj)
 
             print(f"[{idx + 1:0>3}] Request time: {time.time()}")
             click.secho(F"Get messages by {mode_to_name[message_mode]}: {val}")
-            setup_counter()
-            messages_by_mode: Data = msgs.map(counter)
+            metrics: PipelineMetrics = get_pipeline_metrics(msgs) or PipelineMetrics()
+            messages_by_mode: Data = metrics.count(msgs)
             data_by_mode.append(messages_by_mode)
+            metrics.start_progress()
 
             for m in messages_by_mode:
                 msg_id = m[cur_format_id]
@@ -115,7 +117,7 @@ def common_logic(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses,
                     exit_code = 1
 
                 if err_msg:
-                    reset_counter()
+                    metrics.stop_progress(force=True)
                     click.secho(f"\n{err_msg}", bg="red")
 
                     if not all_msgs_dumped_flag:
@@ -127,7 +129,7 @@ def common_logic(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses,
 
             len_by_mode += messages_by_mode.len
 
-            reset_counter()
+            metrics.stop_progress(force=True)
             print()
 
         # Check1
@@ -173,7 +175,8 @@ class Plugin(DSPlugin):
         ctx = kwargs['ctx']
 
         get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-        data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+        # The all streams pass checks correctness only, so it can be replayed from the fetch cache.
+        data: Data = fetch_cache.command(ds_wrapper, get_messages_cmd_obj)
         command_class_args = get_command_class_args(ctx.cfg, type(get_messages_cmd_obj))
 
         return dict(ds_wrapper=ds_wrapper, messages=data, command_class_args=command_class_args, ctx=ctx)
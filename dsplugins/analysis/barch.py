@@ -7,6 +7,7 @@ import click
 from th2_data_services.data import Data
 from th2_data_services.data_source.lwdp.struct import MessageStruct, EventStruct
 from dsplugins.analysis import analysis
+from th2_ds.cli_util import fetch_cache
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
@@ -540,14 +541,15 @@ class Plugin(DSPlugin):
         rtype = kwargs['rtype']
         parts_num = kwargs['parts_num']
 
+        # The long range checks correctness only, so it can be replayed from the fetch cache.
         if rtype == 'events':
             get_events_cmd_obj = ds_wrapper.get_events_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_events_cmd_obj)
+            data: Data = fetch_cache.command(ds_wrapper, get_events_cmd_obj)
             command_class_args = get_command_class_args(ctx.cfg, type(get_events_cmd_obj))
 
         elif rtype == 'messages':
             get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+            data: Data = fetch_cache.command(ds_wrapper, get_messages_cmd_obj)
             command_class_args = get_command_class_args(ctx.cfg, type(get_messages_cmd_obj))
 
         else:
@@ -1,91 +1,296 @@
-import json
-import os
+"""Do X concurrent requests to the server.
+
+Every client is a thread that downloads the request params range
+`repetitions` times. Hundreds of clients can be run from one process;
+with `--processes P` clients are spread over P processes (threads of one
+process share the GIL, so JSON decoding of many fast streams can make
+the client the bottleneck).
+
+Clients are started according to the ramp-up profile, failed requests
+are retried a bounded number of times with jittered exponential backoff,
+and results of all clients are aggregated in memory through a queue.
+
+`concurrent sweep` runs the test at 1, 2, 4, ... N clients and fits the
+Universal Scalability Law to the throughput: contention (σ) and
+coherency (κ) costs, the concurrency of the peak throughput and the
+level after which adding clients stops paying off.
+
+`concurrent mixed` runs a workload of weighted request classes (message
+and event scans, metadata calls) from the config, the same templates as
+in `analysis load`; every request of a client picks a class by weight:
+
+    custom_plugin_params:
+      concurrent:
+        templates:
+          - name: messages_10s
+            kind: messages      # messages | events | aliases | scopes | groups | books
+            window_sec: 10
+            weight: 2
+          - name: aliases
+            kind: aliases
+            weight: 5
+
+Throughput and latency are reported per class, so it's seen how heavy
+scans slow down interactive metadata calls.
+"""
+import multiprocessing
+import queue
+import random
+import threading
 import time
-from copy import copy
+from typing import Dict, List, NamedTuple, Optional
 
 import click
-import urllib3
+from prettytable import PrettyTable
 
-from th2_data_services.data import Data
 from dsplugins.analysis import analysis
-from th2_ds.cli_util.utils import get_ds_wrapper, get_command_class_args, generate_and_save_report, get_exception_info
-from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
+from dsplugins.analysis.load import RequestTemplate, build_command, execute_request, get_templates, \
+    supported_templates
+from th2_ds.cli_util import bench_stats
+from th2_ds.cli_util.bench_stats import HdrHistogram
+from th2_ds.cli_util.utils import get_ds_wrapper, generate_and_save_report, get_exception_info
+from th2_ds.cli_util.decorators import cli_command
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
 from th2_ds.cli_util.context import CliContext
-from th2_ds.cli_util.plugins.speed_test import common_logic
-from multiprocessing import Process
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 
 num_conc_req_opt = click.option("-n", "--num-concurrent-requests", "n_procs", type=click.IntRange(1), required=True)
+rtype_arg = click.argument("rtype", type=click.Choice(["messages", "events"]))
+
+# `sweep`: the knee is the last level, after which the next level adds less throughput than this.
+DEFAULT_MIN_GAIN = 0.1
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SEC = 0.5
+MAX_BACKOFF_SEC = 30
+
+
+def engine_opts(f):
+    """Options of the concurrent engine, see `EngineParams`."""
+    f = click.option("--processes", type=click.IntRange(1), default=1, show_default=True,
+                     help="Spread clients over this number of processes.")(f)
+    f = click.option("--backoff", "backoff_sec", type=click.FloatRange(0), default=DEFAULT_BACKOFF_SEC,
+                     show_default=True, help="Base of the exponential backoff between retries, seconds.")(f)
+    f = click.option("--retries", type=click.IntRange(0), default=DEFAULT_RETRIES, show_default=True,
+                     help="Max retries of a failed request.")(f)
+    f = click.option("--ramp-steps", type=click.IntRange(1),
+                     help="Start clients in this number of equal groups instead of one by one.")(f)
+    f = click.option("--ramp-up", "ramp_up_sec", type=click.FloatRange(0), default=0, show_default=True,
+                     help="Clients are started evenly during this time, seconds.")(f)
+    f = click.option("--repetitions", type=click.IntRange(1), default=1, show_default=True,
+                     help="Requests per client.")(f)
+    return f
+
+
+class EngineParams(NamedTuple):
+    repetitions: int = 1
+    ramp_up_sec: float = 0
+    ramp_steps: Optional[int] = None
+    retries: int = DEFAULT_RETRIES
+    backoff_sec: float = DEFAULT_BACKOFF_SEC
+    processes: int = 1
+
+    def start_offset(self, client: int, n_clients: int) -> float:
+        """Start time of the client relative to the start of the test."""
+        if not self.ramp_up_sec or n_clients == 1:
+            return 0.0
+        if self.ramp_steps:
+            step = client * self.ramp_steps // n_clients
+            return self.ramp_up_sec * step / self.ramp_steps
+        return self.ramp_up_sec * client / n_clients
+
+
+class ClientResult(NamedTuple):
+    client: int
+    request_class: str
+    repetition: int
+    records: int
+    started: float  # time.time()
+    finished: float
+    attempts: int
+    error: Optional[str] = None
+
+
+def backoff_delay(attempt: int, backoff_sec: float, rng: random.Random) -> float:
+    """Full jitter: uniform in [0, backoff_sec * 2^attempt], so retrying clients don't come back in a herd."""
+    return rng.uniform(0, min(MAX_BACKOFF_SEC, backoff_sec * 2 ** attempt))
+
+
+def _client(ds_wrapper, client: int, templates: List[RequestTemplate], commands: list, start_at: float,
+            params: EngineParams, results, seed: int):
+    rng = random.Random(seed)
+    weights = [t.weight for t in templates]
+    time.sleep(max(start_at - time.time(), 0))
+    for repetition in range(params.repetitions):
+        idx = rng.choices(range(len(templates)), weights)[0] if len(templates) > 1 else 0
+        started = time.time()
+        records, error = 0, None
+        for attempt in range(params.retries + 1):
+            try:
+                records = execute_request(ds_wrapper, commands[idx], timeout_sec=None)
+                error = None
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt < params.retries:
+                    time.sleep(backoff_delay(attempt, params.backoff_sec, rng))
+        results.put(ClientResult(client, templates[idx].name, repetition, records, started, time.time(),
+                                 attempt + 1, error))
+
+
+def _run_threads(ds_wrapper, clients: List[int], client_commands: Dict[int, list], templates, start_times,
+                 params: EngineParams, results, seed: int):
+    threads = [threading.Thread(target=_client,
+                                args=(ds_wrapper, c, templates, client_commands[c], start_times[c], params, results,
+                                      seed + c),
+                                name=f'ds-client-{c}', daemon=True)
+               for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_clients(ds_wrapper, ctx: CliContext, templates: List[RequestTemplate], n_clients: int,
+                params: EngineParams, seed: Optional[int] = None) -> List[ClientResult]:
+    """Runs n_clients concurrent clients. Every client does `params.repetitions` requests
+    of the templates (chosen randomly by their weights)."""
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    rng = random.Random(seed)
+    # Commands are created beforehand, so clients start with requests right away.
+    client_commands = {c: [build_command(ds_wrapper, ctx, t, rng) for t in templates] for c in range(n_clients)}
+    t0 = time.time() + 0.1
+    start_times = {c: t0 + params.start_offset(c, n_clients) for c in range(n_clients)}
+    expected = n_clients * params.repetitions
+
+    processes = min(params.processes, n_clients)
+    if processes == 1:
+        results = queue.Queue()
+        runner = threading.Thread(target=_run_threads,
+                                  args=(ds_wrapper, list(range(n_clients)), client_commands, templates, start_times,
+                                        params, results, seed),
+                                  daemon=True)
+        runner.start()
+        workers = [runner]
+    else:
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_run_threads,
+                                           args=(ds_wrapper, list(range(p, n_clients, processes)), client_commands,
+                                                 templates, start_times, params, results, seed),
+                                           daemon=True)
+                   for p in range(processes)]
+        for w in workers:
+            w.start()
+
+    collected: List[ClientResult] = []
+    last_print = time.time()
+    while len(collected) < expected:
+        try:
+            collected.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                break  # A worker process died, its results will never come.
+        if time.time() - last_print >= 1:
+            last_print = time.time()
+            print(f"\rFinished requests: {len(collected)}/{expected}   ", end="", flush=True)
+    print(f"\rFinished requests: {len(collected)}/{expected}   ")
+
+    for w in workers:
+        w.join(timeout=1)
+    return collected
+
+
+def aggregate(results: List[ClientResult], n_clients: int) -> dict:
+    """Aggregate and per-client throughput, latency of requests, errors and retries."""
+    ok = [r for r in results if r.error is None]
+    failed = [r for r in results if r.error is not None]
+    latency = HdrHistogram()
+    for r in ok:
+        latency.record((r.finished - r.started) * 1e6)
+
+    wall_sec = max(r.finished for r in results) - min(r.started for r in results) if results else 0
+    records = sum(r.records for r in ok)
+    per_client_records: Dict[int, int] = {}
+    per_client_time: Dict[int, float] = {}
+    for r in ok:
+        per_client_records[r.client] = per_client_records.get(r.client, 0) + r.records
+        per_client_time[r.client] = per_client_time.get(r.client, 0) + r.finished - r.started
+    per_client_throughput = [per_client_records[c] / per_client_time[c]
+                             for c in per_client_records if per_client_time[c] > 0]
+    errors: Dict[str, int] = {}
+    for r in failed:
+        errors[r.error.split(':')[0]] = errors.get(r.error.split(':')[0], 0) + 1
+
+    return dict(n_clients=n_clients,
+                requests=len(results),
+                ok=len(ok),
+                failed=len(failed),
+                errors_by_type=errors,
+                retries=sum(r.attempts - 1 for r in results),
+                records=records,
+                wall_time_sec=round(wall_sec, 4),
+                throughput_per_sec=round(records / wall_sec, 1) if wall_sec else None,
+                requests_per_sec=round(len(ok) / wall_sec, 3) if wall_sec else None,
+                per_client_throughput_per_sec=bench_stats.summarize(per_client_throughput),
+                latency_us=latency.to_dict())
+
 
 @analysis.group()
 def concurrent():
     """Do X concurrent requests to the server."""
 
 
-@http_error_wrapper
-def requester(data: Data, command_class_args: dict, ctx: CliContext, repetitions: int, rtype: str, _try=1):
-    print(f"try: {_try}")
-    try:
-        common_logic(data, command_class_args, ctx, repetitions, rtype)
-    except urllib3.exceptions.MaxRetryError:
-        time.sleep(0.5)
-        requester(data, command_class_args, ctx, repetitions, rtype, _try=_try + 1)
-
-
 @cli_command(group=concurrent, name="messages")
 @num_conc_req_opt
-def concurrent_messages(ctx: CliContext, n_procs):
+@engine_opts
+def concurrent_messages(ctx: CliContext, n_procs, **engine_kwargs):
     data_source = get_ds_wrapper(ctx)
-    exit_code = data_source.accept(Plugin(), n_procs=n_procs, rtype="messages", ctx=ctx)
+    exit_code = data_source.accept(Plugin(), n_procs=n_procs, rtype="messages", ctx=ctx,
+                                   params=EngineParams(**engine_kwargs))
     exit(exit_code)
 
 
 @cli_command(group=concurrent, name="events")
 @num_conc_req_opt
-def concurrent_events(ctx: CliContext, n_procs):
+@engine_opts
+def concurrent_events(ctx: CliContext, n_procs, **engine_kwargs):
     data_source = get_ds_wrapper(ctx)
-    exit_code = data_source.accept(Plugin(), n_procs=n_procs, rtype="events", ctx=ctx)
+    exit_code = data_source.accept(Plugin(), n_procs=n_procs, rtype="events", ctx=ctx,
+                                   params=EngineParams(**engine_kwargs))
     exit(exit_code)
 
 
-def common(n_procs, **kwargs):
+def common(ds_wrapper, n_procs: int, rtype: str, ctx: CliContext, params: EngineParams) -> int:
     exit_code = 0
     test_params = {
         "n_procs": n_procs,
-        "repetitions": kwargs["repetitions"],
-        "rtype": kwargs["rtype"]
+        "rtype": rtype,
+        **params._asdict(),
     }
 
     results = {}
-    ctx: CliContext = None
-
     try:
-        ppool = []
-        ctx = kwargs["ctx"]
-
-        for i in range(n_procs):
-            proc_kwarg = kwargs.copy()
-            proc_ctx: CliContext = copy(ctx)
-            proc_ctx.report_path = ctx.report_path + f"_{i}"
-            proc_kwarg["ctx"] = proc_ctx
-            ppool.append(Process(target=requester, kwargs=proc_kwarg))
-
-        for p in ppool:
-            p.start()
-            time.sleep(1)
-
-        for i, p in enumerate(ppool):
-            p.join()
-            process_report_filename = ctx.report_path + f"_{i}"
-            with open(process_report_filename, 'r', encoding='utf-8') as json_file:
-                 subprocess_res = json.load(json_file)
-            try:
-                os.remove(process_report_filename)
-            except:
-                pass
-
-            results[p.name] = subprocess_res["results"]
+        client_results = run_clients(ds_wrapper, ctx, [RequestTemplate(name=rtype, kind=rtype)], n_procs, params)
+
+        clients = {}
+        for r in sorted(client_results, key=lambda r: (r.client, r.repetition)):
+            c = clients.setdefault(f"client-{r.client}", dict(received_msgs=[], times_sec=[], attempts=[], errors=[]))
+            c["received_msgs"].append(r.records)
+            c["times_sec"].append(round(r.finished - r.started, 4))
+            c["attempts"].append(r.attempts)
+            c["errors"].append(r.error)
+        results["clients"] = clients
+        results["aggregate"] = agg = aggregate(client_results, n_procs)
+
+        # [1] Check that every client gets the same number of data (TH2-2638).
+        received = {r.records for r in client_results if r.error is None}
+        agg["th2_2638"] = len(received) > 1
+        if agg["th2_2638"]:
+            click.secho(f"Got a different number of data (TH2-2638) - {sorted(received)}", bg="red")
+        if agg["failed"]:
+            click.secho(f"Failed requests: {agg['failed']} {agg['errors_by_type']}", bg="red")
+            exit_code = 1
+
+        print_aggregate(agg, rtype)
 
     except Exception as e:
         results["exception"] = get_exception_info(e)
@@ -93,55 +298,268 @@ def common(n_procs, **kwargs):
 
     generate_and_save_report(
         ctx=ctx,
-        data=kwargs["data"],
-        command_class_args=kwargs.get("command_class_args", {}),
         test_params=test_params,
         results=results
     )
+    return exit_code
+
+
+def aggregate_by_class(results: List[ClientResult]) -> Dict[str, dict]:
+    """Throughput and latency of every request class. Rates are over the wall time of the whole test,
+    because classes run at the same time."""
+    wall_sec = max(r.finished for r in results) - min(r.started for r in results) if results else 0
+    by_class: Dict[str, List[ClientResult]] = {}
+    for r in results:
+        by_class.setdefault(r.request_class, []).append(r)
+
+    classes = {}
+    for name, class_results in sorted(by_class.items()):
+        ok = [r for r in class_results if r.error is None]
+        latency = HdrHistogram()
+        for r in ok:
+            latency.record((r.finished - r.started) * 1e6)
+        records = sum(r.records for r in ok)
+        classes[name] = dict(requests=len(class_results),
+                             ok=len(ok),
+                             failed=len(class_results) - len(ok),
+                             retries=sum(r.attempts - 1 for r in class_results),
+                             records=records,
+                             throughput_per_sec=round(records / wall_sec, 1) if wall_sec else None,
+                             requests_per_sec=round(len(ok) / wall_sec, 3) if wall_sec else None,
+                             latency_us=latency.to_dict())
+    return classes
+
+
+@cli_command(group=concurrent, name="mixed")
+@num_conc_req_opt
+@click.option("--template", "template_names", multiple=True,
+              help="Use only these templates from the config. Can be repeated.")
+@click.option("--seed", type=int, help="Seed of the class choice and request windows.")
+@engine_opts
+def concurrent_mixed(ctx: CliContext, n_procs, template_names, seed, **engine_kwargs):
+    """Concurrent clients with a mixed workload of weighted request classes from the config."""
+    templates = get_templates(ctx, 'concurrent')
+    if template_names:
+        templates = [t for t in templates if t.name in template_names]
+        if not templates:
+            raise click.BadParameter(f"no templates with names {template_names}", param_hint="--template")
 
-    if exit_code != 0:
-        exit(exit_code)
+    data_source = get_ds_wrapper(ctx)
+    exit_code = data_source.accept(Plugin(), n_procs=n_procs, templates=templates, ctx=ctx, seed=seed,
+                                   params=EngineParams(**engine_kwargs))
+    exit(exit_code)
 
 
-class Plugin(DSPlugin):
-    def root(self) -> click.Command:
-        return concurrent
+def mixed(ds_wrapper, n_procs: int, templates: List[RequestTemplate], ctx: CliContext, seed: Optional[int],
+          params: EngineParams) -> int:
+    exit_code = 0
+    templates, skipped = supported_templates(ds_wrapper, ctx, templates)
+    test_params = {
+        "n_procs": n_procs,
+        "templates": [t.dict() for t in templates],
+        "skipped_templates": skipped,
+        "seed": seed,
+        **params._asdict(),
+    }
 
-    def version(self) -> str:
-        return '2.0.0'
+    results = {}
+    try:
+        client_results = run_clients(ds_wrapper, ctx, templates, n_procs, params, seed)
+        results["classes"] = classes = aggregate_by_class(client_results)
+        results["aggregate"] = agg = aggregate(client_results, n_procs)
+        if agg["failed"]:
+            click.secho(f"Failed requests: {agg['failed']} {agg['errors_by_type']}", bg="red")
+            exit_code = 1
+        print_classes(classes)
 
-    def _get_common_lwdp_objects_for_common_logic(self, ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, **kwargs):
-        ctx = kwargs['ctx']
-        rtype = kwargs['rtype']
-        n_procs = kwargs['n_procs']
+    except Exception as e:
+        results["exception"] = get_exception_info(e)
+        exit_code = 1
 
-        if rtype == 'events':
-            get_events_cmd_obj = ds_wrapper.get_events_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_events_cmd_obj)
-            command_class_args = get_command_class_args(ctx.cfg, type(get_events_cmd_obj))
+    generate_and_save_report(
+        ctx=ctx,
+        test_params=test_params,
+        results=results
+    )
+    return exit_code
+
+
+def print_classes(classes: Dict[str, dict]):
+    table = PrettyTable(["class", "requests", "failed", "retries", "records/s", "requests/s",
+                         "latency p50, s", "latency p90, s", "latency p99, s", "latency max, s"])
+    for name, c in classes.items():
+        latency = c["latency_us"]
+        percentiles = latency.get("percentiles", {})
+        table.add_row([name, c["requests"], c["failed"], c["retries"],
+                       c["throughput_per_sec"] if c["throughput_per_sec"] is not None else '-',
+                       c["requests_per_sec"] if c["requests_per_sec"] is not None else '-',
+                       *(round(v / 1e6, 3) if v is not None else '-'
+                         for v in (percentiles.get("50"), percentiles.get("90"), percentiles.get("99"),
+                                   latency.get("max")))])
+    print(table)
+
+
+def sweep_levels(max_clients: int) -> List[int]:
+    """1, 2, 4, ... and max_clients itself."""
+    levels = []
+    n = 1
+    while n < max_clients:
+        levels.append(n)
+        n *= 2
+    levels.append(max_clients)
+    return levels
+
+
+def parse_levels(ctx, param, value: Optional[str]) -> Optional[List[int]]:
+    if value is None:
+        return None
+    try:
+        levels = sorted({int(v) for v in value.split(",") if v.strip()})
+    except ValueError:
+        raise click.BadParameter("must be a comma-separated list of integers")
+    if not levels or levels[0] < 1:
+        raise click.BadParameter("levels must be positive")
+    return levels
+
+
+def find_knee(levels: List[int], throughput: List[float], min_gain: float) -> int:
+    """The last level before the first step whose throughput gain is less than min_gain."""
+    for i in range(len(levels) - 1):
+        if throughput[i + 1] < throughput[i] * (1 + min_gain):
+            return levels[i]
+    return levels[-1]
+
+
+@cli_command(group=concurrent, name="sweep")
+@rtype_arg
+@click.option("-n", "--max-clients", type=click.IntRange(1), default=16, show_default=True,
+              help="Levels are 1, 2, 4, ... up to this number of clients.")
+@click.option("--levels", callback=parse_levels, help="Comma-separated client counts instead of --max-clients.")
+@click.option("--min-gain", type=click.FloatRange(0), default=DEFAULT_MIN_GAIN, show_default=True,
+              help="The knee is the last level after which the next one adds less than this fraction of "
+                   "throughput.")
+@click.option("--seed", type=int, help="Seed of request windows.")
+@engine_opts
+def concurrent_sweep(ctx: CliContext, rtype, max_clients, levels, min_gain, seed, **engine_kwargs):
+    """Run the concurrent test at increasing numbers of clients and fit the Universal Scalability Law."""
+    data_source = get_ds_wrapper(ctx)
+    exit_code = data_source.accept(Plugin(), levels=levels or sweep_levels(max_clients), rtype=rtype, ctx=ctx,
+                                   min_gain=min_gain, seed=seed, params=EngineParams(**engine_kwargs))
+    exit(exit_code)
 
-        elif rtype == 'messages':
-            get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
-            command_class_args = get_command_class_args(ctx.cfg,type(get_messages_cmd_obj))
 
+def sweep(ds_wrapper, levels: List[int], rtype: str, ctx: CliContext, min_gain: float, seed: Optional[int],
+          params: EngineParams) -> int:
+    exit_code = 0
+    test_params = {
+        "levels": levels,
+        "rtype": rtype,
+        "min_gain": min_gain,
+        "seed": seed,
+        **params._asdict(),
+    }
+
+    results = {}
+    try:
+        template = RequestTemplate(name=rtype, kind=rtype)
+        per_level = {}
+        for n in levels:
+            click.secho(f"{n} client(s)", bold=True)
+            agg = aggregate(run_clients(ds_wrapper, ctx, [template], n, params, seed), n)
+            per_level[n] = agg
+            if agg["failed"]:
+                click.secho(f"Failed requests: {agg['failed']} {agg['errors_by_type']}", bg="red")
+                exit_code = 1
+        results["levels"] = {str(n): agg for n, agg in per_level.items()}
+
+        measured = [n for n in levels if per_level[n]["throughput_per_sec"]]
+        throughput = [per_level[n]["throughput_per_sec"] for n in measured]
+        usl = bench_stats.fit_usl(measured, throughput)
+        results["usl"] = usl
+        results["knee_clients"] = find_knee(measured, throughput, min_gain) if measured else None
+
+        print_sweep(per_level, usl, rtype)
+        if usl is None:
+            click.secho("At least 3 levels with throughput are needed to fit the USL.", fg="yellow")
         else:
-            raise RuntimeError(f'Unknown Rtype: {rtype}')
+            r2 = f"{usl['r2']:.3f}" if usl["r2"] is not None else "-"
+            print(f"USL: λ={usl['lambda_']:.1f} {rtype}/s per client, σ={usl['sigma']:.4f} (contention), "
+                  f"κ={usl['kappa']:.6f} (coherency), R²={r2}")
+            if usl["peak_concurrency"] is not None:
+                print(f"Predicted peak: {usl['peak_throughput']:.1f} {rtype}/s at "
+                      f"{usl['peak_concurrency']:.1f} clients")
+            elif usl["asymptotic_throughput"] is not None:
+                print(f"No retrograde scaling, throughput approaches {usl['asymptotic_throughput']:.1f} {rtype}/s")
+        if results["knee_clients"] is not None:
+            print(f"Knee: {results['knee_clients']} clients (the next level adds less than {min_gain:.0%})")
+
+    except Exception as e:
+        results["exception"] = get_exception_info(e)
+        exit_code = 1
+
+    generate_and_save_report(
+        ctx=ctx,
+        test_params=test_params,
+        results=results
+    )
+    return exit_code
+
+
+def print_sweep(per_level: Dict[int, dict], usl: Optional[dict], rtype: str):
+    table = PrettyTable(["clients", "failed", f"{rtype}/s (total)", "USL fit", "speedup", "efficiency",
+                         f"{rtype}/s per client (median)", "latency p50, s", "latency p90, s", "latency p99, s"])
+    base = next((agg["throughput_per_sec"] / n for n, agg in per_level.items() if agg["throughput_per_sec"]), None)
+    for n, agg in per_level.items():
+        x = agg["throughput_per_sec"]
+        fitted = (usl["lambda_"] * n / (1 + usl["sigma"] * (n - 1) + usl["kappa"] * n * (n - 1))
+                  if usl else None)
+        percentiles = agg["latency_us"].get("percentiles", {})
+        table.add_row([n, agg["failed"], x if x is not None else '-',
+                       round(fitted, 1) if fitted is not None else '-',
+                       round(x / base, 2) if x and base else '-',
+                       f"{x / base / n:.0%}" if x and base else '-',
+                       agg["per_client_throughput_per_sec"].get("median", '-'),
+                       *(round(v / 1e6, 3) if v is not None else '-'
+                         for v in (percentiles.get("50"), percentiles.get("90"), percentiles.get("99")))])
+    print(table)
+
+
+def print_aggregate(agg: dict, rtype: str):
+    latency = agg["latency_us"]
+    table = PrettyTable(["clients", "ok", "failed", "retries", f"{rtype}/s (total)", f"{rtype}/s per client (median)",
+                         "latency p50, s", "latency p99, s", "latency max, s"])
+    percentiles = latency.get("percentiles", {})
+    table.add_row([agg["n_clients"], agg["ok"], agg["failed"], agg["retries"], agg["throughput_per_sec"],
+                   agg["per_client_throughput_per_sec"].get("median"),
+                   *(round(v / 1e6, 3) if v is not None else '-'
+                     for v in (percentiles.get("50"), percentiles.get("99"), latency.get("max")))])
+    print(table)
+
+
+class Plugin(DSPlugin):
+    def root(self) -> click.Command:
+        return concurrent
+
+    def version(self) -> str:
+        return '3.2.0'
 
-        return n_procs, dict(data=data, command_class_args=command_class_args, ctx=ctx, repetitions=1, rtype=rtype)
+    def _common(self, ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, **kwargs):
+        if 'templates' in kwargs:
+            return mixed(ds_wrapper, **kwargs)
+        if kwargs['rtype'] not in ('events', 'messages'):
+            raise RuntimeError(f"Unknown Rtype: {kwargs['rtype']}")
+        if 'levels' in kwargs:
+            return sweep(ds_wrapper, **kwargs)
+        return common(ds_wrapper, **kwargs)
 
     def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
-        n_procs, cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        return common(n_procs, **cl_kw)
+        return self._common(ds_wrapper, **kwargs)
 
     def visit_rpt5_http_data_source(self, ds_wrapper: ds_w.Rpt5HttpDataSource, **kwargs):
-        n_procs, cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        return common(n_procs, **cl_kw)
+        return self._common(ds_wrapper, **kwargs)
 
     def visit_lwdp2_http_data_source(self, ds_wrapper: ds_w.Lwdp2HttpDataSource, **kwargs):
-        n_procs, cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        return common(n_procs, **cl_kw)
+        return self._common(ds_wrapper, **kwargs)
 
     def visit_lwdp3_http_data_source(self, ds_wrapper: ds_w.Lwdp3HttpDataSource, **kwargs):
-        n_procs, cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        return common(n_procs, **cl_kw)
+        return self._common(ds_wrapper, **kwargs)
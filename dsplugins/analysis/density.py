@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from typing import Optional
 import click
 
 from th2_data_services.data import Data
@@ -7,8 +8,9 @@ from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
-from th2_ds.cli_util.utils import counter, reset_counter, setup_counter, \
-    not_implemented_err, get_command_class_args, show_info, get_ds_wrapper
+from th2_ds.cli_util.projection import Projection, compile_getter, fields_opt
+from th2_ds.cli_util.pipeline_metrics import PipelineMetrics, get_pipeline_metrics, metered_command, sizeof_fmt
+from th2_ds.cli_util.utils import not_implemented_err, get_command_class_args, show_info, get_ds_wrapper
 
 # Frequently of intervals.
 aggr_val_opt = click.option("--aggr-val", default=1, show_default=True, type=click.INT)
@@ -18,16 +20,32 @@ aggr_resolution_opt = click.option("--aggr-resolution", default="s", show_defaul
 # resolution: Datetime suffix for intervals.
 
 
+def record_time(record) -> datetime:
+    time = datetime.fromtimestamp(record["timestamp"].get("epochSecond", 0))
+    return time + timedelta(microseconds=record["timestamp"].get("nano", 0)) / 1000
+
+
 def transform_time(record):
     try:
-        time = datetime.fromtimestamp(record["timestamp"].get("epochSecond", 0))
-        time += timedelta(microseconds=record["timestamp"].get("nano", 0)) / 1000
-        return {"session_dir": record["sessionId"] + ":" + record["direction"], "time": time}
+        return {"session_dir": record["sessionId"] + ":" + record["direction"], "time": record_time(record)}
     except Exception as e:
         print(f"Exception: {e}")
         print(record)
 
 
+def fields_transform(fields: Projection):
+    """`transform_time` with values of the fields instead of session and direction."""
+    getters = [compile_getter(path) for path in fields.paths]
+
+    def transform(record):
+        try:
+            return {"session_dir": ":".join(str(get(record)) for get in getters), "time": record_time(record)}
+        except Exception as e:
+            print(f"Exception: {e}")
+            print(record)
+    return transform
+
+
 @analysis.group()
 def density():
     """Plots density chart"""
@@ -36,10 +54,14 @@ def density():
 @cli_command(group=density, name="messages")
 @aggr_val_opt
 @aggr_resolution_opt
-def density_messages(ctx: CliContext, aggr_val, aggr_resolution):
-    """Plots density chart for messages"""
+@fields_opt
+def density_messages(ctx: CliContext, aggr_val, aggr_resolution, fields: Optional[Projection]):
+    """Plots density chart for messages
+
+    Records are reduced to their time and values of --fields (session and direction by default).
+    """
     data_source = get_ds_wrapper(ctx)
-    data_source.accept(Plugin(), aggr_val=aggr_val, aggr_resolution=aggr_resolution, ctx=ctx)
+    data_source.accept(Plugin(), aggr_val=aggr_val, aggr_resolution=aggr_resolution, ctx=ctx, projection=fields)
 
 
 @cli_command(group=density, name="events")
@@ -50,29 +72,41 @@ def density_events(ctx: CliContext, aggr_val, aggr_resolution):
 
 
 @http_error_wrapper
-def common_logic(messages: Data, command_class_args: dict, ctx: CliContext, aggr_val: int, aggr_resolution: str):
+def common_logic(messages: Data, command_class_args: dict, ctx: CliContext, aggr_val: int, aggr_resolution: str,
+                 projection: Optional[Projection] = None):
     # TODO - ADD TOTAL only param
     from th2_data_services_utils.utils import aggregate_by_intervals
     import plotly.express as px
 
     show_info(ctx.extra_params, command_class_args, urls=messages.metadata["urls"], get_messages_mode=ctx.cfg.get_messages_mode)
 
-    transformed_messages = messages.map(counter).map(transform_time)
-
-    if not messages.is_empty:
-        setup_counter()
-        output = aggregate_by_intervals(transformed_messages, "time", resolution=aggr_resolution, every=aggr_val)
-        d_info = reset_counter()
-        print(output)
+    metrics = get_pipeline_metrics(messages) or PipelineMetrics()
+    transform = transform_time if projection is None else fields_transform(projection)
+    transformed_messages = metrics.count(messages).map(transform)
+
+    # One pass over the messages: they are counted while aggregated, the metrics are read right after it.
+    with metrics.progress():
+        try:
+            output = aggregate_by_intervals(transformed_messages, "time", resolution=aggr_resolution, every=aggr_val)
+        except Exception:
+            if metrics.records:
+                raise
+            output = None  # Nothing to aggregate.
+    d_info = metrics.summary()
+
+    if not d_info['records']:
+        click.secho("0 messages in the range", fg='red')
+        return
 
-        msgs_len = transformed_messages.len
-        fig = px.line(output, x="time", y="count",
-                      title=f"Density {ctx.cfg.request_params.start_timestamp} - {ctx.cfg.request_params.end_timestamp} | "
-                            f"Msgs: {msgs_len}, size: {d_info['last_size_fmted']}, "
-                            f"avg size: {d_info['avg_size_fmted']}, Aggr by {aggr_val}{aggr_resolution}")
-        fig.show()
+    print(output)
+    if d_info['decoded_bytes'] is not None:
+        size_info = f"size: {sizeof_fmt(d_info['decoded_bytes'])}, avg size: {sizeof_fmt(d_info['avg_record_size'])}, "
     else:
-        click.secho("0 messages in the range", fg='red')
+        size_info = ''
+    fig = px.line(output, x="time", y="count",
+                  title=f"Density {ctx.cfg.request_params.start_timestamp} - {ctx.cfg.request_params.end_timestamp} | "
+                        f"Msgs: {d_info['records']}, {size_info}Aggr by {aggr_val}{aggr_resolution}")
+    fig.show()
 
 
 class Plugin(DSPlugin):
@@ -80,7 +114,7 @@ class Plugin(DSPlugin):
         return density
 
     def version(self) -> str:
-        return '2.0.0'
+        return '2.1.0'
 
     def _get_common_lwdp_objects_for_common_logic(self, ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, **kwargs):
         ctx = kwargs['ctx']
@@ -88,14 +122,15 @@ class Plugin(DSPlugin):
         aggr_resolution = kwargs['aggr_resolution']
 
         get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-        messages: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+        messages: Data = metered_command(ds_wrapper, get_messages_cmd_obj)
         command_class_args = get_command_class_args(ctx.cfg, type(get_messages_cmd_obj))
 
         return dict(messages=messages,
                     command_class_args=command_class_args,
                     ctx=ctx,
                     aggr_val=aggr_val,
-                    aggr_resolution=aggr_resolution)
+                    aggr_resolution=aggr_resolution,
+                    projection=kwargs.get('projection'))
 
     def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
         cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
@@ -0,0 +1,383 @@
+"""Open-model load generator: requests are sent at a fixed rate, whether previous ones finished or not.
+
+Latency of every request is measured from the time it was *scheduled*
+(coordinated omission correction): if the provider or the client can't
+keep up, the waiting time of requests is a part of their latency, as it
+is for real users. Service time (from the actual start) and start lag
+(how late requests were started) are reported separately.
+
+Request templates come from the config:
+
+    custom_plugin_params:
+      load:
+        templates:
+          - name: messages_1s    # any name
+            kind: messages       # messages | events | aliases | scopes | groups | books
+            window_sec: 1        # random window of the request params range; the whole range if absent
+            weight: 4            # relative frequency
+"""
+from __future__ import annotations
+import contextlib
+import io
+import queue
+import random
+import threading
+import time
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import click
+from prettytable import PrettyTable
+from pydantic import BaseModel, validator, PositiveFloat
+
+from dsplugins.analysis import analysis
+from th2_ds.cli_util.bench_stats import HdrHistogram
+from th2_ds.cli_util.context import CliContext
+from th2_ds.cli_util.decorators import cli_command
+from th2_ds.cli_util.impl import data_source_wrapper as ds_w
+from th2_ds.cli_util.interfaces.plugin import DSPlugin
+from th2_ds.cli_util.sharded_fetch import to_nanoseconds
+from th2_ds.cli_util.utils import get_ds_wrapper, generate_and_save_report
+
+REQUEST_KINDS = ('messages', 'events', 'aliases', 'scopes', 'groups', 'books')
+# How often (records) a running request checks its timeout.
+TIMEOUT_CHECK_RECORDS = 256
+
+
+class RequestTemplate(BaseModel):
+    name: str
+    kind: str
+    window_sec: Optional[PositiveFloat] = None
+    weight: PositiveFloat = 1
+
+    @validator("kind")
+    def check_kind(cls, kind):
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"must be one of {REQUEST_KINDS}")
+        return kind
+
+
+DEFAULT_TEMPLATES = [
+    RequestTemplate(name='messages_1s', kind='messages', window_sec=1, weight=4),
+    RequestTemplate(name='events_1s', kind='events', window_sec=1, weight=2),
+    RequestTemplate(name='aliases', kind='aliases', weight=2),
+    RequestTemplate(name='scopes', kind='scopes', weight=1),
+    RequestTemplate(name='groups', kind='groups', weight=1),
+    RequestTemplate(name='messages_full', kind='messages', weight=1),
+]
+
+
+def get_templates(ctx: CliContext, plugin_name: str = 'load') -> List[RequestTemplate]:
+    params = ctx.cfg.custom_plugin_params.get(plugin_name) or {}
+    templates = params.get('templates')
+    if not templates:
+        return DEFAULT_TEMPLATES
+    return [RequestTemplate(**t) for t in templates]
+
+
+def build_command(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, ctx: CliContext,
+                  template: RequestTemplate, rng: random.Random):
+    """Creates a command object of the template. Windows are placed randomly inside the request params range."""
+    command_kwargs = None
+    if template.window_sec and template.kind in ('messages', 'events'):
+        start_ns = to_nanoseconds(ctx.cfg.request_params.start_timestamp)
+        end_ns = to_nanoseconds(ctx.cfg.request_params.end_timestamp)
+        window_ns = min(int(template.window_sec * 1e9), end_ns - start_ns)
+        window_start = rng.randint(start_ns, end_ns - window_ns)
+        command_kwargs = dict(start_timestamp=window_start, end_timestamp=window_start + window_ns)
+
+    # Wrappers print some info on every command creation.
+    with contextlib.redirect_stdout(io.StringIO()):
+        if template.kind == 'messages':
+            return ds_wrapper.get_messages_obj(ctx, command_kwargs)
+        elif template.kind == 'events':
+            return ds_wrapper.get_events_obj(ctx, command_kwargs)
+        elif template.kind == 'aliases':
+            return ds_wrapper.get_aliases_obj(ctx)
+        elif template.kind == 'scopes':
+            return ds_wrapper.get_scopes_obj(ctx)
+        elif template.kind == 'groups':
+            return ds_wrapper.get_groups_obj(ctx)
+        elif template.kind == 'books':
+            return ds_wrapper.get_books_obj(ctx)
+    raise RuntimeError(f'Unknown request kind: {template.kind}')
+
+
+def supported_templates(ds_wrapper, ctx: CliContext,
+                        templates: List[RequestTemplate]) -> Tuple[List[RequestTemplate], Dict[str, str]]:
+    """Templates whose commands the data source can create, and {name: error} of the others.
+
+    Some kinds aren't supported by all data sources (e.g. groups by lwdp1), such
+    templates are dropped before the run, so they don't fail it.
+
+    Raises:
+        click.UsageError: No template is supported.
+    """
+    supported, skipped = [], {}
+    for template in templates:
+        try:
+            build_command(ds_wrapper, ctx, template, random.Random(0))
+        except Exception as e:
+            skipped[template.name] = f"{type(e).__name__}: {e}"
+        else:
+            supported.append(template)
+    for name, error in skipped.items():
+        click.secho(f"Template '{name}' is skipped, it isn't supported by the data source: {error}", fg="yellow")
+    if not supported:
+        raise click.UsageError("No request template is supported by the data source")
+    return supported, skipped
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+def execute_request(ds_wrapper, command_obj, timeout_sec: Optional[float]) -> int:
+    """Executes the command and consumes its result. Returns the number of records.
+
+    Raises:
+        RequestTimeout: The result wasn't consumed in `timeout_sec`. It's checked
+            between records, so a request that waits for the first byte
+            can't be interrupted.
+    """
+    start = perf_counter()
+    result = ds_wrapper.ds_impl.command(command_obj)
+    records = 0
+    for _ in result if result is not None else ():
+        records += 1
+        if timeout_sec is not None and records % TIMEOUT_CHECK_RECORDS == 0 \
+                and perf_counter() - start > timeout_sec:
+            raise RequestTimeout(f"{records} records in {timeout_sec} sec")
+    if timeout_sec is not None and perf_counter() - start > timeout_sec:
+        raise RequestTimeout(f"{records} records in {timeout_sec} sec")
+    return records
+
+
+class RequestResult(NamedTuple):
+    name: str
+    scheduled: float  # perf_counter
+    started: float
+    finished: float
+    records: int
+    status: str  # ok | error | timeout
+    error: Optional[str] = None
+
+
+class RequestStats:
+    """Per request class aggregate. Latencies are in microseconds."""
+
+    def __init__(self):
+        self.scheduled = 0
+        self.ok = 0
+        self.timeouts = 0
+        self.unfinished = 0
+        self.errors: Dict[str, int] = {}
+        self.records = 0
+        self.latency = HdrHistogram()
+        self.service_time = HdrHistogram()
+        self.start_lag = HdrHistogram()
+
+    @property
+    def finished(self) -> int:
+        return self.ok + self.timeouts + sum(self.errors.values())
+
+    def add(self, r: RequestResult):
+        self.records += r.records
+        self.latency.record((r.finished - r.scheduled) * 1e6)
+        self.service_time.record((r.finished - r.started) * 1e6)
+        self.start_lag.record((r.started - r.scheduled) * 1e6)
+        if r.status == 'ok':
+            self.ok += 1
+        elif r.status == 'timeout':
+            self.timeouts += 1
+        else:
+            self.errors[r.error] = self.errors.get(r.error, 0) + 1
+
+    def merge(self, other: RequestStats):
+        self.scheduled += other.scheduled
+        self.ok += other.ok
+        self.timeouts += other.timeouts
+        self.unfinished += other.unfinished
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+        self.records += other.records
+        self.latency.merge(other.latency)
+        self.service_time.merge(other.service_time)
+        self.start_lag.merge(other.start_lag)
+
+    def to_dict(self, duration_sec: float) -> dict:
+        errors = sum(self.errors.values())
+        # Unfinished requests didn't return in time, they are timeouts for the user.
+        timeouts = self.timeouts + self.unfinished
+        return dict(scheduled=self.scheduled,
+                    ok=self.ok,
+                    errors=errors,
+                    errors_by_type=self.errors,
+                    timeouts=self.timeouts,
+                    unfinished=self.unfinished,
+                    error_rate=round(errors / self.scheduled, 4) if self.scheduled else None,
+                    timeout_rate=round(timeouts / self.scheduled, 4) if self.scheduled else None,
+                    throughput_per_sec=round(self.ok / duration_sec, 3) if duration_sec else None,
+                    records=self.records,
+                    latency_us=self.latency.to_dict(),
+                    service_time_us=self.service_time.to_dict(),
+                    start_lag_us=self.start_lag.to_dict())
+
+
+def _worker(ds_wrapper, tasks: queue.Queue, results: queue.Queue, timeout_sec: Optional[float]):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        name, scheduled, command_obj = task
+        started = perf_counter()
+        records, status, error = 0, 'ok', None
+        try:
+            records = execute_request(ds_wrapper, command_obj, timeout_sec)
+        except RequestTimeout:
+            status = 'timeout'
+        except Exception as e:
+            status, error = 'error', type(e).__name__
+        results.put(RequestResult(name, scheduled, started, perf_counter(), records, status, error))
+
+
+def run_load(ds_wrapper, ctx: CliContext, templates: List[RequestTemplate], rate: float, duration_sec: float,
+             timeout_sec: Optional[float], max_in_flight: int, seed: Optional[int] = None) -> Dict[str, RequestStats]:
+    """Sends requests of the templates at `rate` per second during `duration_sec`.
+
+    Returns:
+        {template name: RequestStats}
+    """
+    rng = random.Random(seed)
+    weights = [t.weight for t in templates]
+    stats = {t.name: RequestStats() for t in templates}
+    tasks, results = queue.Queue(), queue.Queue()
+
+    workers = [threading.Thread(target=_worker, args=(ds_wrapper, tasks, results, timeout_sec),
+                                name=f'ds-load-{i}', daemon=True)
+               for i in range(max_in_flight)]
+    for w in workers:
+        w.start()
+
+    def collect(until: float):
+        while True:
+            wait = until - perf_counter()
+            try:
+                r = results.get(timeout=wait) if wait > 0 else results.get_nowait()
+            except queue.Empty:
+                return
+            stats[r.name].add(r)
+
+    total = int(rate * duration_sec)
+    start = perf_counter()
+    last_print = start
+    for i in range(total):
+        scheduled = start + i / rate
+        collect(until=scheduled)
+        template = rng.choices(templates, weights)[0]
+        stats[template.name].scheduled += 1
+        tasks.put((template.name, scheduled, build_command(ds_wrapper, ctx, template, rng)))
+        if perf_counter() - last_print >= 1:
+            last_print = perf_counter()
+            finished = sum(s.finished for s in stats.values())
+            print(f"\rScheduled: {i + 1}/{total}, finished: {finished}, in flight/queued: {i + 1 - finished}   ",
+                  end="", flush=True)
+
+    for _ in workers:
+        tasks.put(None)
+    # Requests that aren't finished by the deadline are abandoned (workers are daemons).
+    deadline = perf_counter() + (timeout_sec if timeout_sec is not None else duration_sec)
+    while sum(s.finished for s in stats.values()) < total and perf_counter() < deadline:
+        collect(until=min(deadline, perf_counter() + 0.1))
+    collect(until=0)
+    for s in stats.values():
+        s.unfinished = s.scheduled - s.finished
+    print()
+    return stats
+
+
+def _fmt_ms(us: Optional[int]) -> str:
+    return f"{us / 1000:.1f}" if us is not None else '-'
+
+
+def print_stats(stats: Dict[str, RequestStats], duration_sec: float):
+    table = PrettyTable(["request", "scheduled", "ok", "errors", "timeouts", "ok/s",
+                         "p50, ms", "p90, ms", "p99, ms", "p99.9, ms", "max, ms", "service p50, ms", "service p99, ms"])
+    for name, s in stats.items():
+        table.add_row([name, s.scheduled, s.ok, sum(s.errors.values()), s.timeouts + s.unfinished,
+                       round(s.ok / duration_sec, 2),
+                       _fmt_ms(s.latency.percentile(50)), _fmt_ms(s.latency.percentile(90)),
+                       _fmt_ms(s.latency.percentile(99)), _fmt_ms(s.latency.percentile(99.9)),
+                       _fmt_ms(s.latency.max if s.latency.count else None),
+                       _fmt_ms(s.service_time.percentile(50)), _fmt_ms(s.service_time.percentile(99))])
+    print(table)
+    print("Latency is measured from the scheduled start (corrected for coordinated omission).")
+
+
+@cli_command(group=analysis, name="load")
+@click.option("--rate", type=click.FloatRange(0, min_open=True), required=True, help="Requests per second.")
+@click.option("--duration", "duration_sec", type=click.FloatRange(0, min_open=True), default=60, show_default=True,
+              help="Seconds.")
+@click.option("--timeout", "timeout_sec", type=click.FloatRange(0, min_open=True), default=30, show_default=True,
+              help="Request timeout, seconds.")
+@click.option("--max-in-flight", type=click.IntRange(1), default=64, show_default=True,
+              help="Max number of requests executed at the same time. Others wait in the queue "
+                   "(the waiting time is a part of their latency).")
+@click.option("--template", "template_names", multiple=True,
+              help="Use only these templates from the config. Can be repeated.")
+@click.option("--seed", type=int, help="Seed of the random template choice and windows.")
+def load(ctx: CliContext, rate, duration_sec, timeout_sec, max_in_flight, template_names, seed):
+    """Open-model load test: requests at a fixed rate from request templates."""
+    templates = get_templates(ctx)
+    if template_names:
+        templates = [t for t in templates if t.name in template_names]
+        if not templates:
+            raise click.BadParameter(f"no templates with names {template_names}", param_hint="--template")
+
+    ds_wrapper = get_ds_wrapper(ctx)
+    ds_wrapper.accept(Plugin(), ctx=ctx, templates=templates, rate=rate, duration_sec=duration_sec,
+                      timeout_sec=timeout_sec, max_in_flight=max_in_flight, seed=seed)
+
+
+def common_logic(ds_wrapper, ctx: CliContext, templates: List[RequestTemplate], **load_kwargs):
+    templates, skipped = supported_templates(ds_wrapper, ctx, templates)
+    start = time.time()
+    stats = run_load(ds_wrapper, ctx, templates, **load_kwargs)
+    duration_sec = load_kwargs['duration_sec']
+    print_stats(stats, duration_sec)
+
+    total = RequestStats()
+    for s in stats.values():
+        total.merge(s)
+
+    test_params = dict(templates=[t.dict() for t in templates],
+                       skipped_templates=skipped,
+                       rate=load_kwargs['rate'],
+                       duration_sec=duration_sec,
+                       timeout_sec=load_kwargs['timeout_sec'],
+                       max_in_flight=load_kwargs['max_in_flight'],
+                       seed=load_kwargs['seed'])
+    results = dict(templates={name: s.to_dict(duration_sec) for name, s in stats.items()},
+                   total=total.to_dict(duration_sec),
+                   wall_time_sec=round(time.time() - start, 3))
+    generate_and_save_report(ctx=ctx, test_params=test_params, results=results)
+
+
+class Plugin(DSPlugin):
+    def version(self) -> str:
+        return '1.0.0'
+
+    def root(self) -> click.Command:
+        return load
+
+    def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
+        return common_logic(ds_wrapper, **kwargs)
+
+    def visit_rpt5_http_data_source(self, ds_wrapper: ds_w.Rpt5HttpDataSource, **kwargs):
+        return common_logic(ds_wrapper, **kwargs)
+
+    def visit_lwdp2_http_data_source(self, ds_wrapper: ds_w.Lwdp2HttpDataSource, **kwargs):
+        return common_logic(ds_wrapper, **kwargs)
+
+    def visit_lwdp3_http_data_source(self, ds_wrapper: ds_w.Lwdp3HttpDataSource, **kwargs):
+        return common_logic(ds_wrapper, **kwargs)
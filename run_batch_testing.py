@@ -1,14 +1,20 @@
+import io
 import json
 import os
 import sys
 import subprocess
+import threading
+from functools import partial
 from pathlib import Path
 from subprocess import TimeoutExpired
 import yaml
 from datetime import datetime
+from typing import Optional
 import time
 
+from batch_scheduler import Job, TestScheduler
 from testing_config import TestingConfig, TestCase
+from th2_ds.cli_util import daemon, fetch_cache, metadata_store
 from th2_ds.cli_util.impl.data_source_wrapper import Lwdp3HttpDataSource
 from th2_data_services.data_source.lwdp.commands.http import GetBooks, GetEventScopes, GetMessageAliases, \
     GetMessageGroups
@@ -21,7 +27,14 @@ CFG_FILES = [
     r'./rpt_dp.yaml'
 ]
 
-TIMEOUT_EXIT_CODE = 124
+TIMEOUT_EXIT_CODE = daemon.TIMEOUT_EXIT_CODE
+# Set DS_SERVE=1 to run test cases in the `ds serve` daemon instead of a new interpreter per test.
+USE_DS_SERVE = bool(os.environ.get('DS_SERVE'))
+DS_SERVE_SOCKET_PATH = daemon.DEFAULT_SOCKET_PATH
+DS_SERVE_START_TIMEOUT_SEC = 120
+
+_print_lock = threading.Lock()
+
 
 def prepare_config_files():
     with open(DATA_SOURCES_CFG, 'r') as file:
@@ -35,8 +48,7 @@ def prepare_config_files():
 
     book_id = request_params.get('book_id')
     if book_id is None:
-        get_books_cmd_obj = GetBooks()
-        books_list = list(ds.ds_impl.command(get_books_cmd_obj))
+        books_list = metadata_store.get(ds, GetBooks())
         if len(books_list) != 1:
             raise ValueError(f"If `book_id` is not specified, database should contain exactly one book. Actual books: {books_list}.")
         book_id = books_list[0]
@@ -60,17 +72,16 @@ def prepare_config_files():
         start_timestamp = end_timestamp - testing_config.default_testing_interval_sec
         request_params['start_timestamp'] = request_params['start_timestamp'].strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
-    if 'scopes' not in request_params:
-        get_scopes_cmd_obj = GetEventScopes(book_id, start_timestamp, end_timestamp)
-        request_params['scopes'] = list(ds.ds_impl.command(get_scopes_cmd_obj))
-
-    if 'streams' not in request_params:
-        get_aliases_cmd_obj = GetMessageAliases(book_id, start_timestamp, end_timestamp)
-        request_params['streams'] = list(ds.ds_impl.command(get_aliases_cmd_obj))
-
-    if 'groups' not in request_params:
-        get_groups_cmd_obj = GetMessageGroups(book_id, start_timestamp, end_timestamp)
-        request_params['groups'] = list(ds.ds_impl.command(get_groups_cmd_obj))
+    # Discovery requests don't depend on each other, so they are sent concurrently.
+    discovery_commands = {
+        'scopes': GetEventScopes,
+        'streams': GetMessageAliases,
+        'groups': GetMessageGroups,
+    }
+    discovery_requests = {name: (ds, command_class(book_id, start_timestamp, end_timestamp))
+                          for name, command_class in discovery_commands.items()
+                          if name not in request_params}
+    request_params.update(metadata_store.get_many(discovery_requests))
 
     lw_request_params = request_params.copy()
     del lw_request_params['streams']
@@ -99,56 +110,146 @@ def prepare_config_files():
         with open(CFG_FILES[1], 'r') as read_file:
             print(read_file.read())
 
-def execute_test_case(test_case: TestCase, cfg: str = None) -> tuple[str, list[str], float, int, float, str]:
+
+def setup_fetch_cache():
+    """Enables the fetch cache for ds commands started by the batch run.
+
+    The cache is shared by all test cases of the run, but not between runs,
+    so every run checks the data the provider returns now.
+    """
+    os.environ['DS_FETCH_CACHE'] = '1'
+    os.environ['DS_FETCH_CACHE_MAX_SIZE_MB'] = str(testing_config.fetch_cache_max_size_mb)
+    fetch_cache.clear()
+
+
+def start_ds_serve() -> subprocess.Popen:
+    cfg_args = [arg for cfg in CFG_FILES for arg in ('-c', cfg)]
+    proc = subprocess.Popen([sys.executable, 'ds.py', 'serve', '-s', DS_SERVE_SOCKET_PATH, *cfg_args])
+    if not daemon.wait_until_ready(DS_SERVE_SOCKET_PATH, DS_SERVE_START_TIMEOUT_SEC):
+        proc.kill()
+        raise RuntimeError(f"ds serve didn't start in {DS_SERVE_START_TIMEOUT_SEC} seconds")
+    return proc
+
+
+def stop_ds_serve(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except TimeoutExpired:
+        proc.kill()
+
+
+def execute_test_case(test_case: TestCase,
+                      cfg: str = None,
+                      report_path: str = TEST_REPORT_PATH,
+                      capture_output: bool = False) -> tuple[str, list[str], float, int, float, str]:
+    """Runs the test case.
+
+    If capture_output, the output is printed as one block when the test case
+    is finished, so outputs of test cases running in parallel are not mixed.
+    """
     try:
-        os.remove(TEST_REPORT_PATH)
+        os.remove(report_path)
     except:
         pass
 
-    command_args = ['ds.py', *test_case.args, f'-r{TEST_REPORT_PATH}']
+    command_args = ['ds.py', *test_case.args, f'-r{report_path}']
     if cfg:
         command_args.append('-c')
         command_args.append(cfg)
-    print('./' + ' '.join(command_args))
+    command_line = './' + ' '.join(command_args)
+    output = io.StringIO() if capture_output else None
+    if not capture_output:
+        print(command_line)
 
     start_time = time.time()
 
-    try:
-        execution_result = subprocess.run([sys.executable, *command_args], timeout=test_case.timeout_sec)
-        exit_code = execution_result.returncode
-    except TimeoutExpired:
-        exit_code = TIMEOUT_EXIT_CODE
+    if USE_DS_SERVE:
+        # The daemon kills the command and returns TIMEOUT_EXIT_CODE by itself.
+        exit_code = daemon.run_remote_command(command_args[1:], timeout=test_case.timeout_sec,
+                                              socket_path=DS_SERVE_SOCKET_PATH, out=output)
+    else:
+        pipe = subprocess.PIPE if capture_output else None
+        stderr = subprocess.STDOUT if capture_output else None
+        try:
+            execution_result = subprocess.run([sys.executable, *command_args], timeout=test_case.timeout_sec,
+                                              stdout=pipe, stderr=stderr)
+            exit_code = execution_result.returncode
+            process_output = execution_result.stdout
+        except TimeoutExpired as e:
+            exit_code = TIMEOUT_EXIT_CODE
+            process_output = e.output
+        if capture_output and process_output:
+            output.write(process_output.decode('utf-8', errors='replace'))
 
     execution_time = time.time() - start_time
 
+    if capture_output:
+        with _print_lock:
+            print('#' * 100)
+            print(command_line)
+            print('#' * 100)
+            print(output.getvalue(), flush=True)
+
     try:
-        with open(TEST_REPORT_PATH, 'r', encoding='utf-8') as file:
+        with open(report_path, 'r', encoding='utf-8') as file:
             test_report = json.load(file)
     except FileNotFoundError:
         test_report = {}
 
+    if report_path != TEST_REPORT_PATH:
+        try:
+            os.remove(report_path)
+        except OSError:
+            pass
+
     report_message = f"{test_case.name} for {Path(cfg).stem}" if cfg else test_case.name
     return report_message, command_args, test_case.timeout_sec, exit_code, execution_time, test_report
 
 
-def execute_tests() -> int:
-    return_codes_sum = 0
-    test_results = []
+def get_test_data_sources(cfg: Optional[str]) -> frozenset[str]:
+    """Returns names of data sources the test case uses."""
+    if cfg:
+        with open(cfg, 'r') as file:
+            return frozenset([yaml.safe_load(file)['default_data_source']])
 
-    for cfg in CFG_FILES:
-        print('#'*100)
-        print(cfg)
-        print('#' * 100)
+    # Tests without config (e.g. `get equivalence`) request all data sources.
+    with open(DATA_SOURCES_CFG, 'r') as file:
+        return frozenset(yaml.safe_load(file)['data_sources'])
 
-        for test_case in testing_config.test_cases:
-            if not test_case.no_cfg:
-                results = execute_test_case(test_case, cfg)
-                test_results.append(results)
 
-    for test_case in testing_config.test_cases:
-        if test_case.no_cfg:
-            results = execute_test_case(test_case)
-            test_results.append(results)
+def execute_tests() -> int:
+    return_codes_sum = 0
+
+    # Report order: all test cases for every config, then test cases without config.
+    test_runs = [(test_case, cfg)
+                 for cfg in CFG_FILES
+                 for test_case in testing_config.test_cases if not test_case.no_cfg]
+    test_runs += [(test_case, None) for test_case in testing_config.test_cases if test_case.no_cfg]
+
+    # Start order: a test case for all configs, then the next one. So tests of
+    # different data sources can overlap between exclusive tests.
+    test_case_position = {id(test_case): pos for pos, test_case in enumerate(testing_config.test_cases)}
+    start_order = sorted(range(len(test_runs)), key=lambda idx: test_case_position[id(test_runs[idx][0])])
+
+    parallel = testing_config.max_workers > 1
+    jobs = []
+    for idx in start_order:
+        test_case, cfg = test_runs[idx]
+        # Every test case running in parallel needs its own report file.
+        report_path = f'./test_report_{idx}.json' if parallel else TEST_REPORT_PATH
+        jobs.append(Job(run=partial(execute_test_case, test_case, cfg, report_path, capture_output=parallel),
+                        data_sources=get_test_data_sources(cfg),
+                        exclusive=test_case.exclusive))
+
+    scheduler = TestScheduler(max_workers=testing_config.max_workers,
+                              data_source_concurrency=testing_config.data_source_concurrency,
+                              default_data_source_concurrency=testing_config.default_data_source_concurrency)
+    jobs_results = scheduler.run(jobs)
+
+    test_results = [None] * len(test_runs)
+    for job_idx, idx in enumerate(start_order):
+        test_results[idx] = jobs_results[job_idx]
 
     with open(testing_config.report_file_path, 'w') as report_file:
         for test_name, args, timeout, exit_code, execution_time, test_report in test_results:
@@ -177,6 +278,15 @@ def execute_tests() -> int:
 
 if __name__ == "__main__":
     testing_config: TestingConfig = TestingConfig(TESTING_CONFIG_PATH)
+    # ds commands only verify ds_impl libs, so they are installed once before the run.
+    subprocess.run([sys.executable, 'ds.py', 'env', 'sync'])
     prepare_config_files()
-    result = execute_tests()
+    if testing_config.fetch_cache:
+        setup_fetch_cache()
+    ds_serve_proc = start_ds_serve() if USE_DS_SERVE else None
+    try:
+        result = execute_tests()
+    finally:
+        if ds_serve_proc is not None:
+            stop_ds_serve(ds_serve_proc)
     sys.exit(result)
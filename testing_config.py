@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel, Field, PositiveFloat
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, PositiveFloat, PositiveInt
 from datetime import timedelta
 import yaml
 
@@ -9,6 +9,8 @@ class TestCase(BaseModel):
     args: List[str]
     timeout_sec: Optional[float]
     no_cfg: bool = Field(default=False)
+    # Throughput-sensitive tests that must not overlap with any other test.
+    exclusive: bool = Field(default=False)
 
     def __init__(self, **data):
         super().__init__(**data)
@@ -20,6 +22,13 @@ class TestingConfig(BaseModel):
     request_params_path: str = Field(default="./request_params.yaml")
     report_file_path: str = Field(default="./report.jsonl")
     test_cases: List[TestCase] = Field(default_factory=list)
+    max_workers: PositiveInt = Field(default=1)
+    # How many tests can use the same data source at the same time, {data_source_name: N}.
+    data_source_concurrency: Dict[str, PositiveInt] = Field(default_factory=dict)
+    default_data_source_concurrency: PositiveInt = Field(default=1)
+    # Correctness tests replay ranges already fetched during the run, see th2_ds/cli_util/fetch_cache.py.
+    fetch_cache: bool = Field(default=False)
+    fetch_cache_max_size_mb: PositiveInt = Field(default=2048)
 
     def __init__(self, filename: str):
         with open(filename, 'r') as f:
@@ -0,0 +1,233 @@
+"""Statistics of benchmark samples (per-repetition throughput, latencies).
+
+Plain Python on purpose -- samples are small (tens of repetitions), so
+numpy isn't worth the dependency.
+"""
+import math
+import random
+import statistics
+from typing import Callable, List, Optional, Sequence, Tuple
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_BOOTSTRAP_RESAMPLES = 2000
+# Samples further than this number of scaled MADs from the median are outliers.
+DEFAULT_OUTLIER_THRESHOLD = 3.5
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Linear interpolation between closest ranks (the same as numpy's default)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = p / 100 * (len(ordered) - 1)
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def reject_outliers(values: Sequence[float],
+                    threshold: float = DEFAULT_OUTLIER_THRESHOLD) -> Tuple[List[float], List[float]]:
+    """Splits values into (kept, rejected) by the modified z-score (median absolute deviation).
+
+    MAD isn't affected by the outliers themselves, unlike the standard deviation,
+    so a single stalled repetition on a shared provider is rejected reliably.
+    """
+    if len(values) < 3:
+        return list(values), []
+    median = statistics.median(values)
+    mad = statistics.median([abs(v - median) for v in values])
+    if mad == 0:
+        return list(values), []
+    kept, rejected = [], []
+    for v in values:
+        # 0.6745 makes MAD consistent with the standard deviation for normal data.
+        (rejected if abs(0.6745 * (v - median) / mad) > threshold else kept).append(v)
+    return kept, rejected
+
+
+def bootstrap_ci(values: Sequence[float],
+                 stat: Callable[[Sequence[float]], float] = statistics.median,
+                 confidence: float = DEFAULT_CONFIDENCE,
+                 resamples: int = DEFAULT_BOOTSTRAP_RESAMPLES,
+                 seed: Optional[int] = 0) -> Optional[Tuple[float, float]]:
+    """Percentile bootstrap confidence interval of `stat`. None if there are less than 2 values."""
+    if len(values) < 2:
+        return None
+    rnd = random.Random(seed)
+    n = len(values)
+    estimates = [stat(rnd.choices(values, k=n)) for _ in range(resamples)]
+    alpha = (1 - confidence) / 2 * 100
+    return percentile(estimates, alpha), percentile(estimates, 100 - alpha)
+
+
+def relative_ci_width(ci: Optional[Tuple[float, float]], center: float) -> Optional[float]:
+    """Half-width of the interval relative to the center. None if it can't be calculated."""
+    if ci is None or not center:
+        return None
+    return (ci[1] - ci[0]) / 2 / abs(center)
+
+
+def summarize(values: Sequence[float],
+              confidence: float = DEFAULT_CONFIDENCE,
+              resamples: int = DEFAULT_BOOTSTRAP_RESAMPLES,
+              ndigits: int = 1) -> dict:
+    """median, p5/p95, mean, stddev and bootstrap CI of the median."""
+    if not values:
+        return dict(n=0)
+    median = statistics.median(values)
+    ci = bootstrap_ci(values, confidence=confidence, resamples=resamples)
+    rel_width = relative_ci_width(ci, median)
+    return dict(n=len(values),
+                median=round(median, ndigits),
+                p5=round(percentile(values, 5), ndigits),
+                p95=round(percentile(values, 95), ndigits),
+                mean=round(statistics.fmean(values), ndigits),
+                stddev=round(statistics.stdev(values), ndigits) if len(values) > 1 else 0.0,
+                min=round(min(values), ndigits),
+                max=round(max(values), ndigits),
+                confidence=confidence,
+                ci_low=round(ci[0], ndigits) if ci else None,
+                ci_high=round(ci[1], ndigits) if ci else None,
+                ci_rel_half_width=round(rel_width, 4) if rel_width is not None else None)
+
+
+class HdrHistogram:
+    """Log-linear histogram of non-negative integers (e.g. latency in microseconds), like HdrHistogram.
+
+    Values are kept with `significant_digits` precision: buckets are linear
+    within every power of two, so the relative error doesn't depend on
+    the magnitude and the size stays small for any range of values.
+    """
+
+    PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99)
+
+    def __init__(self, significant_digits: int = 2):
+        self.significant_digits = significant_digits
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._counts = {}  # {lowest equivalent value: count}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _shift(self, value: int) -> int:
+        return max(value.bit_length() - self._sub_bucket_bits, 0)
+
+    def _lowest_equivalent(self, value: int) -> int:
+        shift = self._shift(value)
+        return (value >> shift) << shift
+
+    def _highest_equivalent(self, value: int) -> int:
+        return value + (1 << self._shift(value)) - 1
+
+    def record(self, value: int, count: int = 1):
+        value = max(int(value), 0)
+        key = self._lowest_equivalent(value)
+        self._counts[key] = self._counts.get(key, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'HdrHistogram'):
+        for key, count in other._counts.items():
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> Optional[int]:
+        """The highest value equivalent to the p-th percentile (as HdrHistogram reports)."""
+        if not self.count:
+            return None
+        rank = max(math.ceil(p / 100 * self.count), 1)
+        seen = 0
+        for key in sorted(self._counts):
+            seen += self._counts[key]
+            if seen >= rank:
+                return min(self._highest_equivalent(key), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return dict(count=0)
+        return dict(count=self.count,
+                    significant_digits=self.significant_digits,
+                    min=self.min,
+                    mean=round(self.total / self.count, 1),
+                    max=self.max,
+                    percentiles={str(p): self.percentile(p) for p in self.PERCENTILES},
+                    buckets={str(k): v for k, v in sorted(self._counts.items())})
+
+
+def _least_squares(columns: Sequence[Sequence[float]], y: Sequence[float]) -> Optional[List[float]]:
+    """Coefficients c of y = Σ c_i * columns[i] by the normal equations, None if they are singular."""
+    k = len(columns)
+    # Augmented matrix of the normal equations, solved by Gauss-Jordan elimination.
+    m = [[sum(a * b for a, b in zip(columns[i], columns[j])) for j in range(k)]
+         + [sum(a * b for a, b in zip(columns[i], y))] for i in range(k)]
+    for col in range(k):
+        pivot = max(range(col, k), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12 * max(1.0, max(abs(v) for row in m for v in row[:k])):
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(k):
+            if r != col:
+                factor = m[r][col] / m[col][col]
+                m[r] = [v - factor * p for v, p in zip(m[r], m[col])]
+    return [m[i][k] / m[i][i] for i in range(k)]
+
+
+def fit_usl(concurrency: Sequence[float], throughput: Sequence[float]) -> Optional[dict]:
+    """Fits the Universal Scalability Law X(N) = λN / (1 + σ(N - 1) + κN(N - 1)).
+
+    σ is contention (serialization), κ is coherency (crosstalk) cost.
+    λ, σ and κ are fitted together by least squares of the form that is linear in
+    1/λ, σ/λ and κ/λ:  N/X(N) = 1/λ + (σ/λ)(N - 1) + (κ/λ)N(N - 1),  so λ doesn't
+    depend on a single level and N=1 doesn't have to be measured. σ and κ are
+    non-negative: if the fit gives a negative one, it's fitted again without it.
+
+    Returns None if there are less than 3 levels.
+    """
+    points = sorted((n, x) for n, x in zip(concurrency, throughput) if x > 0)
+    if len(points) < 3:
+        return None
+    y = [n / x for n, x in points]
+    terms = [[1.0] * len(points), [n - 1 for n, _ in points], [n * (n - 1) for n, _ in points]]
+
+    best = None
+    # Subsets of (σ, κ) terms, the full model first.
+    for used in ((1, 2), (1,), (2,), ()):
+        coefs = _least_squares([terms[0], *(terms[i] for i in used)], y)
+        if coefs is None or coefs[0] <= 0 or any(c < 0 for c in coefs[1:]):
+            continue
+        c = dict(zip((0, *used), coefs))
+        ss = sum((yi - sum(c.get(i, 0.0) * terms[i][j] for i in range(3))) ** 2 for j, yi in enumerate(y))
+        if best is None or ss < best[0]:
+            best = ss, c
+        if len(used) == 2:
+            break  # The unconstrained fit is valid.
+    if best is None:
+        return None
+    c = best[1]
+    lam = 1 / c[0]
+    sigma = c.get(1, 0.0) * lam
+    kappa = c.get(2, 0.0) * lam
+
+    def model(n):
+        return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+    mean_x = statistics.fmean(x for _, x in points)
+    ss_tot = sum((x - mean_x) ** 2 for _, x in points)
+    ss_res = sum((x - model(n)) ** 2 for n, x in points)
+    peak = math.sqrt((1 - sigma) / kappa) if kappa > 0 and sigma < 1 else None
+    return dict(lambda_=lam,
+                sigma=sigma,
+                kappa=kappa,
+                r2=1 - ss_res / ss_tot if ss_tot else None,
+                peak_concurrency=peak,
+                peak_throughput=model(peak) if peak is not None else None,
+                # Throughput limit when κ = 0: λ/σ.
+                asymptotic_throughput=lam / sigma if kappa == 0 and sigma > 0 else None)
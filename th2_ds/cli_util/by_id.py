@@ -0,0 +1,182 @@
+"""Fetch of messages/events by ids (`ds get messages-by-id`, `ds get events-by-id`).
+
+Ids are split into batches, and batches are fetched by a bounded pool of
+worker threads (every id is a separate provider request, the pool limits
+how many of them are in flight). At most `2 * workers` batches are
+submitted ahead, so memory doesn't depend on the number of ids.
+
+Records are returned either in the input order of ids or in the order
+batches arrive. Ids the provider doesn't know are returned with None
+instead of the record.
+
+Found records are stored in the local id cache (`.ds_cache/records_by_id.sqlite`)
+and aren't requested again: a stored th2 message or event never changes.
+"""
+import json
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+from th2_data_services.exceptions import CommandError, EventNotFound, MessageNotFound
+
+from th2_ds.cli_util import cache
+from th2_ds.cli_util.context import CliContext
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WORKERS = 8
+ID_CACHE_PATH = cache.cache_path('records_by_id.sqlite')
+# Max number of sqlite query parameters per statement.
+_SQL_CHUNK = 500
+
+
+def read_ids(f: TextIO) -> List[str]:
+    """Ids, one per line. Empty lines and lines starting with '#' are skipped, repeated ids are taken once."""
+    ids = {}
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            ids.setdefault(line, None)
+    return list(ids)
+
+
+class IdCache:
+    """{(data source url, rtype, id): record} on disk."""
+
+    def __init__(self, source: str, path: str = ID_CACHE_PATH):
+        self._source = source
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS records "
+                         "(source TEXT, rtype TEXT, id TEXT, record TEXT, PRIMARY KEY (source, rtype, id))")
+
+    def get_many(self, rtype: str, ids: List[str]) -> Dict[str, dict]:
+        found = {}
+        for i in range(0, len(ids), _SQL_CHUNK):
+            chunk = ids[i:i + _SQL_CHUNK]
+            rows = self._db.execute(f"SELECT id, record FROM records WHERE source = ? AND rtype = ? "
+                                    f"AND id IN ({','.join('?' * len(chunk))})", (self._source, rtype, *chunk))
+            found.update((record_id, json.loads(record)) for record_id, record in rows)
+        return found
+
+    def put_many(self, rtype: str, records: Iterable[Tuple[str, dict]]):
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                                 ((self._source, rtype, record_id, json.dumps(record))
+                                  for record_id, record in records))
+
+    def close(self):
+        self._db.close()
+
+
+def _fetch_batch(ds_wrapper, ctx: CliContext, rtype: str, ids: List[str]) -> List[Tuple[str, Optional[dict]]]:
+    get_cmd_obj = ds_wrapper.get_message_by_id_obj if rtype == 'messages' else ds_wrapper.get_event_by_id_obj
+    result = []
+    for record_id in ids:
+        try:
+            result.append((record_id, ds_wrapper.ds_impl.command(get_cmd_obj(ctx, record_id))))
+        except CommandError as e:
+            # The data source wraps errors of commands, the original one is the context.
+            if not isinstance(e.__context__, (MessageNotFound, EventNotFound)):
+                raise
+            result.append((record_id, None))
+    return result
+
+
+def _plan(ids: List[str], cached: Dict[str, dict], batch_size: int) -> List[Union[str, List[str]]]:
+    """Ids in the input order: a cached id or a batch of consecutive not cached ids."""
+    plan = []
+    batch = []
+    for record_id in ids:
+        if record_id in cached:
+            if batch:
+                plan.append(batch)
+                batch = []
+            plan.append(record_id)
+        else:
+            batch.append(record_id)
+            if len(batch) == batch_size:
+                plan.append(batch)
+                batch = []
+    if batch:
+        plan.append(batch)
+    return plan
+
+
+def fetch_by_ids(ds_wrapper, ctx: CliContext, rtype: str, ids: List[str],
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS,
+                 ordered: bool = True,
+                 id_cache: Optional[IdCache] = None,
+                 stats: Optional[dict] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+    """Yields (id, record or None if it's not found) for every id.
+
+    Args:
+        ds_wrapper: Data source wrapper.
+        ctx: Cli context.
+        rtype: 'messages' or 'events'.
+        ids: Unique ids.
+        batch_size: Ids per worker task.
+        workers: Max number of concurrent requests.
+        ordered: In the order of `ids` if True, in the order of arrival otherwise.
+        id_cache: Found records are taken from and stored to it.
+        stats: Updated with the number of 'cached' and 'fetched' ids.
+    """
+    if rtype not in ('messages', 'events'):
+        raise RuntimeError(f'Unknown Rtype: {rtype}')
+    stats = stats if stats is not None else {}
+    cached = id_cache.get_many(rtype, ids) if id_cache is not None else {}
+    stats.update(cached=len(cached), fetched=0)
+    plan = _plan(ids, cached, batch_size)
+    window = 2 * workers
+
+    def completed(future: Future) -> List[Tuple[str, Optional[dict]]]:
+        batch = future.result()
+        stats['fetched'] += len(batch)
+        if id_cache is not None:
+            id_cache.put_many(rtype, ((record_id, record) for record_id, record in batch if record is not None))
+        return batch
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ds-by-id')
+    try:
+        if ordered:
+            pending = deque()
+            in_flight = 0
+            for item in plan:
+                if isinstance(item, str):
+                    pending.append(item)
+                else:
+                    pending.append(executor.submit(_fetch_batch, ds_wrapper, ctx, rtype, item))
+                    in_flight += 1
+                while in_flight >= window or pending and isinstance(pending[0], str):
+                    head = pending.popleft()
+                    if isinstance(head, str):
+                        yield head, cached[head]
+                    else:
+                        in_flight -= 1
+                        yield from completed(head)
+            while pending:
+                head = pending.popleft()
+                if isinstance(head, str):
+                    yield head, cached[head]
+                else:
+                    yield from completed(head)
+        else:
+            for record_id, record in cached.items():
+                yield record_id, record
+            in_flight = set()
+            for item in plan:
+                if isinstance(item, str):
+                    continue
+                if len(in_flight) >= window:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from completed(future)
+                in_flight.add(executor.submit(_fetch_batch, ds_wrapper, ctx, rtype, item))
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from completed(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,41 @@
+"""Local on-disk state of the ds cli (plugin manifest, stamps, cached data).
+
+Everything is stored under CACHE_DIR, which is relative to the working
+directory by default (ds.py is always started from the repo root).
+It can be changed via the `DS_CACHE_DIR` environment variable.
+"""
+import json
+import os
+import tempfile
+
+CACHE_DIR = os.environ.get('DS_CACHE_DIR', '.ds_cache')
+
+
+def cache_path(*parts: str) -> str:
+    return os.path.join(CACHE_DIR, *parts)
+
+
+def load_json(path: str, default=None):
+    """Returns the file content or `default` if the file is absent or broken."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path: str, obj) -> None:
+    """Writes the object atomically, so concurrent readers never see a partial file."""
+    dir_name = os.path.dirname(path) or '.'
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,165 @@
+"""Checkpoints of `ds get -o FILE` downloads, so interrupted downloads can be resumed (`--resume`).
+
+The checkpoint (`FILE.checkpoint`) is saved every `--checkpoint-interval`
+seconds and when the download fails. It has the size of the output file
+and, per stream (a message group/stream or an event scope), the
+timestamp of the last written record and ids of the written records
+with that timestamp.
+
+On resume the output file is truncated to the checkpointed size, the
+request starts from the earliest of the streams' last timestamps and
+records the streams already have are dropped. Records of every stream
+come ordered by timestamp, so the drop is exact. If some of the
+requested streams didn't get any records before the interruption, the
+request isn't narrowed -- there may be records of them before the
+checkpoint timestamps.
+
+The checkpoint is removed when the download is completed.
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import click
+
+from th2_ds.cli_util import cache
+from th2_ds.cli_util.context import CliContext
+from th2_ds.cli_util.sharded_fetch import RECORD_FIELDS, record_timestamp_ns, stream_key, to_nanoseconds
+from th2_ds.cli_util.writers import LINE_FORMATS
+
+DEFAULT_CHECKPOINT_INTERVAL_SEC = 30
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def resume_opts(f):
+    f = click.option("--checkpoint-interval", "checkpoint_interval_sec", type=click.FloatRange(0, min_open=True),
+                     default=DEFAULT_CHECKPOINT_INTERVAL_SEC, show_default=True,
+                     help="Seconds between checkpoints of the out file download.")(f)
+    f = click.option("--resume", is_flag=True,
+                     help="Continue the interrupted download of the out file from its checkpoint.")(f)
+    return f
+
+
+def _request_fingerprint(ctx: CliContext, rtype: str, file_format: str, fields: Optional[Sequence[str]]) -> str:
+    params = ctx.cfg.request_params.dict(exclude={'filters'})
+    # Only set fields are fingerprinted, so checkpoints of downloads without them still match.
+    projection = dict(fields=list(fields)) if fields else {}
+    return json.dumps(dict(rtype=rtype,
+                           format=file_format,
+                           **projection,
+                           data_source=ctx.cfg.default_data_source,
+                           messages_mode=ctx.cfg.get_messages_mode,
+                           filters=str(ctx.cfg.request_params.filters),
+                           request_params=params),
+                      sort_keys=True, default=str)
+
+
+class DownloadCheckpoint:
+    def __init__(self, out_file: str, rtype: str, messages_mode: str, fingerprint: str, interval_sec: float):
+        self.path = out_file + CHECKPOINT_SUFFIX
+        self.rtype = rtype
+        self.messages_mode = messages_mode
+        self.fingerprint = fingerprint
+        self.interval_sec = interval_sec
+        self.offset: Optional[int] = None
+        self.records = 0
+        # {stream: {'timestamp': ns, 'ids': [ids of records with this timestamp]}}
+        self.streams: Dict[str, dict] = {}
+        self._resumed: Dict[str, dict] = {}
+        self._last_save = time.monotonic()
+
+    @classmethod
+    def start(cls, ctx: CliContext, rtype: str, out_file: str, file_format: str, resume: bool,
+              interval_sec: float = DEFAULT_CHECKPOINT_INTERVAL_SEC,
+              fields: Optional[Sequence[str]] = None) -> 'DownloadCheckpoint':
+        """A new checkpoint or the saved one if `resume` is set.
+
+        Raises:
+            click.UsageError: The format can't be resumed or the checkpoint is of another request.
+        """
+        file_format = file_format.lower()
+        if file_format not in LINE_FORMATS:
+            raise click.UsageError(f"Checkpoints are supported for {', '.join(LINE_FORMATS)} formats only")
+        checkpoint = cls(out_file, rtype, ctx.cfg.get_messages_mode,
+                         _request_fingerprint(ctx, rtype, file_format, fields), interval_sec)
+        saved = cache.load_json(checkpoint.path) if resume else None
+        if saved is None:
+            if resume:
+                click.secho(f"No checkpoint '{checkpoint.path}', the download is started from the beginning",
+                            fg="yellow")
+            return checkpoint
+        if saved.get('fingerprint') != checkpoint.fingerprint:
+            raise click.UsageError(f"Checkpoint '{checkpoint.path}' was saved for another request or format")
+        checkpoint.offset = saved['offset']
+        checkpoint.records = saved['records']
+        checkpoint.streams = saved['streams']
+        checkpoint._resumed = {k: dict(v, ids=set(v['ids'])) for k, v in saved['streams'].items()}
+        print(f"Resuming from the checkpoint: {checkpoint.records} {rtype} written, "
+              f"{len(checkpoint.streams)} stream(s)")
+        return checkpoint
+
+    def _expected_streams(self, ctx: CliContext) -> Optional[List[str]]:
+        params = ctx.cfg.request_params
+        if self.rtype == 'events':
+            return params.scopes
+        return params.groups if self.messages_mode == 'ByGroups' else params.streams
+
+    def narrow(self, ctx: CliContext):
+        """Moves the start of the request params range to the earliest of the streams' last timestamps."""
+        if not self.streams:
+            return
+        expected = self._expected_streams(ctx)
+        if not expected or not set(expected) <= set(self.streams):
+            print("Not all streams have checkpoints, the request isn't narrowed")
+            return
+        start = min(s['timestamp'] for s in self.streams.values())
+        params = ctx.cfg.request_params
+        if params.start_timestamp is None or start > to_nanoseconds(params.start_timestamp):
+            params.start_timestamp = start
+            print(f"The request is narrowed to start at {start}")
+
+    def _is_written(self, stream: str, timestamp: int, record_id: str) -> bool:
+        saved = self._resumed.get(stream)
+        if saved is None:
+            return False
+        return timestamp < saved['timestamp'] or timestamp == saved['timestamp'] and record_id in saved['ids']
+
+    def filter(self, records, projection: Optional[Callable[[dict], dict]] = None):
+        """Drops records written before the checkpoint and tracks the written ones.
+
+        Records are tracked by their timestamps and ids, so `projection` is applied here, after tracking.
+        """
+        ts_field, id_field = RECORD_FIELDS[self.rtype]
+        for record in records:
+            stream = stream_key(record, self.rtype, self.messages_mode)
+            timestamp = record_timestamp_ns(record[ts_field])
+            record_id = record.get(id_field)
+            if self._resumed and self._is_written(stream, timestamp, record_id):
+                continue
+            last = self.streams.get(stream)
+            if last is None or timestamp > last['timestamp']:
+                self.streams[stream] = {'timestamp': timestamp, 'ids': [record_id]}
+            elif timestamp == last['timestamp']:
+                last['ids'].append(record_id)
+            self.records += 1
+            yield record if projection is None else projection(record)
+
+    def on_chunk(self, f, final: bool):
+        """`writers.write_lines` callback: saves the checkpoint every interval and at the end."""
+        if final or time.monotonic() - self._last_save >= self.interval_sec:
+            self.save(f.sync())
+
+    def save(self, offset: int):
+        self.offset = offset
+        self._last_save = time.monotonic()
+        cache.save_json(self.path, dict(fingerprint=self.fingerprint,
+                                        offset=offset,
+                                        records=self.records,
+                                        streams=self.streams))
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
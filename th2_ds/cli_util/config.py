@@ -1,4 +1,5 @@
 from __future__ import annotations
+import os
 from copy import copy
 from datetime import datetime
 from typing import Optional, List, Union, Any, Dict
@@ -9,6 +10,9 @@ from pydantic import BaseModel, validator
 
 DATA_SOURCE_CONFIG_PATH = "configs/data_sources.yaml"
 
+# Parsed configs are kept between commands by `ds serve`, see enable_cfg_cache.
+_cfg_cache: Optional[dict] = None
+
 
 class DataSourceImpl(BaseModel):
     lib: str
@@ -92,8 +96,31 @@ def _get_cfg(ctx: Context, cfg_path) -> (CliConfig, dict):
     return cfg, extra_params
 
 
+def enable_cfg_cache():
+    """Makes get_cfg keep parsed configs in memory.
+
+    The cache is invalidated by config files modification time.
+    """
+    global _cfg_cache
+    _cfg_cache = {}
+
+
 def get_cfg(cfg_path: str, extra_params: Optional[dict] = None) -> CliConfig:
     """Returns common for all CLI config object."""
+    if _cfg_cache is None:
+        return _build_cfg(cfg_path, extra_params)
+
+    key = (os.path.abspath(cfg_path), os.path.getmtime(cfg_path),
+           os.path.abspath(DATA_SOURCE_CONFIG_PATH), os.path.getmtime(DATA_SOURCE_CONFIG_PATH),
+           tuple(sorted(extra_params.items())))
+    cfg = _cfg_cache.get(key)
+    if cfg is None:
+        cfg = _cfg_cache[key] = _build_cfg(cfg_path, extra_params)
+    # Commands are free to change their config.
+    return cfg.copy(deep=True)
+
+
+def _build_cfg(cfg_path: str, extra_params: Optional[dict] = None) -> CliConfig:
 
     def _get_key_chains_dict(d: dict, path='') -> List[str]:
         """
@@ -1,8 +1,8 @@
-import click
 from click import Context
 
 from th2_ds.cli_util.cli_regestry import CliRegistry
 from th2_ds.cli_util.config import CliConfig, get_cfg
+from th2_ds.cli_util.env import verify_ds_impl
 
 
 class CliContext:
@@ -11,20 +11,11 @@ class CliContext:
         self.cfg: CliConfig = get_cfg(cfg_path, self.extra_params)
         self.verbose_level: int = verbose
         self.report_path: str = report_path
-        self.cli_registry = CliRegistry()
+        self.cli_registry = create_cli_registry()
 
-        # FIXME
-        #   Find some another way to register DataSourceWrappers
-        #   Context shouldn't know about DS-wrappers
-        from th2_ds.cli_util.impl.data_source_wrapper import Lwdp1HttpDataSource, \
-            Lwdp2HttpDataSource, Lwdp3HttpDataSource, Rpt5HttpDataSource
-        self.cli_registry.register(Lwdp1HttpDataSource)
-        self.cli_registry.register(Lwdp2HttpDataSource)
-        self.cli_registry.register(Lwdp3HttpDataSource)
-        self.cli_registry.register(Rpt5HttpDataSource)
-
-        # TODO - don't sure that ds lib installation is related to DSContext.
-        install_ds_impl(self.cfg)
+        # Installation is done via `ds env sync` only, here is just a fast check.
+        if not verify_ds_impl(self.cfg.data_sources[self.cfg.default_data_source].ds_impl):
+            exit(1)
 
     def _get_extra_params(self, ctx: Context) -> dict:
         """Params that were added via CLI."""
@@ -34,19 +25,18 @@ class CliContext:
         return extra_params
 
 
-def install_ds_impl(cfg):
-    # FIXME -- pkg_resources is deprecated.
-    import sys, subprocess, pkg_resources
-
-    ds_impl = cfg.data_sources[cfg.default_data_source].ds_impl
-    command = [sys.executable, "-m", "pip", "install", f"{ds_impl.lib}=={ds_impl.version}"]
-    try:
-        distr = pkg_resources.get_distribution(ds_impl.lib)
-        if distr.version != ds_impl.version:
-            click.secho(f"Version conflict: required version {ds_impl.version}, found {distr.version}", fg='red')
-            click.secho(f"Installing {ds_impl.lib}:{ds_impl.version}", fg='blue')
-            subprocess.check_call(command)
-    except pkg_resources.DistributionNotFound:
-        click.secho(f"Package {ds_impl.lib} not found", fg='red')
-        click.secho(f"Installing {ds_impl.lib}:{ds_impl.version}", fg='blue')
-        subprocess.check_call(command)
+def create_cli_registry() -> CliRegistry:
+    cli_registry = CliRegistry()
+
+    # FIXME
+    #   Find some another way to register DataSourceWrappers
+    #   Context shouldn't know about DS-wrappers
+    from th2_ds.cli_util.impl.data_source_wrapper import Lwdp1HttpDataSource, \
+        Lwdp2HttpDataSource, Lwdp3HttpDataSource, Rpt5HttpDataSource, ReplayHttpDataSource, IndexedCacheFileDataSource
+    cli_registry.register(Lwdp1HttpDataSource)
+    cli_registry.register(Lwdp2HttpDataSource)
+    cli_registry.register(Lwdp3HttpDataSource)
+    cli_registry.register(Rpt5HttpDataSource)
+    cli_registry.register(ReplayHttpDataSource)
+    cli_registry.register(IndexedCacheFileDataSource)
+    return cli_registry
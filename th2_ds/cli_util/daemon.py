@@ -0,0 +1,266 @@
+"""`ds serve` -- long-lived local daemon that runs ds commands.
+
+Starting ds.py for every command means re-importing plugins and th2_data_services,
+re-parsing configs and re-connecting to data sources. The daemon does it once and
+then runs every command in a forked worker process:
+  - the worker inherits imported modules, parsed configs and data source
+    wrappers of the daemon (copy-on-write);
+  - the worker is isolated -- `exit()`, global counters and memory of one command
+    don't affect other commands and the daemon itself;
+  - the worker is killed together with its children when the command timeout expires.
+
+Protocol -- JSON lines over a Unix socket. One request per connection.
+  Request:  {"type": "run", "args": ["get", "books", "-c", "lw_dp.yaml"], "timeout": 60.0, "cwd": "/path"}
+            {"type": "ping"}
+            {"type": "shutdown"}
+  Response: {"type": "output", "data": "..."} -- zero or more times, command stdout + stderr
+            {"type": "exit", "exit_code": 0}
+"""
+from __future__ import annotations
+import codecs
+import json
+import os
+import selectors
+import signal
+import socket
+import socketserver
+import sys
+import time
+import traceback
+from typing import Callable, List, Optional, TextIO
+
+from th2_ds.cli_util import cache
+
+DEFAULT_SOCKET_PATH = cache.cache_path('ds.sock')
+TIMEOUT_EXIT_CODE = 124
+_READ_SIZE = 65536
+_POLL_INTERVAL_SEC = 0.1
+
+
+def _send(wfile, msg: dict):
+    wfile.write((json.dumps(msg) + '\n').encode('utf-8'))
+    wfile.flush()
+
+
+def _exit_code_from_system_exit(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _run_worker(run_cli: Callable[[List[str]], None], args: List[str], cwd: Optional[str], out_fd: int):
+    """Runs in the forked worker process. Never returns."""
+    exit_code = 1
+    try:
+        # Own process group to kill the command together with its subprocesses on timeout.
+        os.setpgrp()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(out_fd, 1)
+        os.dup2(out_fd, 2)
+        os.close(out_fd)
+        sys.stdout.reconfigure(line_buffering=True)
+        sys.stderr.reconfigure(line_buffering=True)
+
+        if cwd:
+            os.chdir(cwd)
+        run_cli(args)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = _exit_code_from_system_exit(e)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def _execute(run_cli: Callable[[List[str]], None], request: dict, wfile) -> int:
+    """Runs the command in a worker process and forwards its output. Returns exit code."""
+    timeout = request.get('timeout')
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        _run_worker(run_cli, request['args'], request.get('cwd'), w)
+
+    os.close(w)
+    try:
+        os.setpgid(pid, pid)  # The same as the worker does, to avoid the race with killpg.
+    except OSError:
+        pass
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = False
+    status = None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        with os.fdopen(r, 'rb', buffering=0) as out, selectors.DefaultSelector() as sel:
+            sel.register(out, selectors.EVENT_READ)
+            output_closed = False
+            while status is None:
+                if deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                    break
+                # Subprocesses of the command can keep the output open, so
+                # the worker exit status is polled instead of waiting for EOF.
+                if not output_closed and sel.select(_POLL_INTERVAL_SEC):
+                    chunk = out.read(_READ_SIZE)
+                    if chunk:
+                        _send(wfile, dict(type='output', data=decoder.decode(chunk)))
+                    else:
+                        output_closed = True
+                elif output_closed:
+                    time.sleep(_POLL_INTERVAL_SEC)
+                pid_, status_ = os.waitpid(pid, os.WNOHANG)
+                if pid_ != 0:
+                    status = status_
+
+            # Output that was written right before the worker exit.
+            while not output_closed and sel.select(0):
+                chunk = out.read(_READ_SIZE)
+                if not chunk:
+                    break
+                _send(wfile, dict(type='output', data=decoder.decode(chunk)))
+    except BaseException:
+        # E.g. the client has gone.
+        _kill_group(pid)
+        if status is None:
+            os.waitpid(pid, 0)
+        raise
+
+    # Kills the command on timeout and everything it left running otherwise.
+    _kill_group(pid)
+    if timed_out:
+        os.waitpid(pid, 0)
+        _send(wfile, dict(type='output', data=f"\n[ds serve] Timeout {timeout} s expired, the command is killed\n"))
+        return TIMEOUT_EXIT_CODE
+
+    return os.waitstatus_to_exitcode(status)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        request = json.loads(line)
+        request_type = request.get('type')
+        if request_type == 'run':
+            exit_code = _execute(self.server.run_cli, request, self.wfile)
+            _send(self.wfile, dict(type='exit', exit_code=exit_code))
+        elif request_type == 'ping':
+            _send(self.wfile, dict(type='pong', pid=os.getppid()))
+        elif request_type == 'shutdown':
+            _send(self.wfile, dict(type='exit', exit_code=0))
+            os.kill(os.getppid(), signal.SIGTERM)
+        else:
+            _send(self.wfile, dict(type='output', data=f"Unknown request type: {request_type}\n"))
+            _send(self.wfile, dict(type='exit', exit_code=2))
+
+
+class _ForkingUnixStreamServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    # Every connection is handled in its own process, so commands can run concurrently.
+    max_children = 256
+
+
+def serve(run_cli: Callable[[List[str]], None], socket_path: str = DEFAULT_SOCKET_PATH):
+    """Serves requests until SIGTERM/SIGINT or `shutdown` request.
+
+    Args:
+        run_cli: Function that runs ds cli with provided args in the current process.
+        socket_path: Unix socket path.
+    """
+    if os.path.exists(socket_path):
+        if ping(socket_path):
+            raise RuntimeError(f"ds serve is already running on '{socket_path}'")
+        os.remove(socket_path)  # Stale socket of a killed daemon.
+    os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+
+    def _stop(signum, frame):
+        raise SystemExit(0)
+
+    server = _ForkingUnixStreamServer(socket_path, _RequestHandler)
+    server.run_cli = run_cli
+    server_pid = os.getpid()
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        print(f"[ds serve] Listening on '{socket_path}', pid: {server_pid}", flush=True)
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.getpid() == server_pid:
+            try:
+                os.remove(socket_path)
+            except OSError:
+                pass
+
+
+def _request(socket_path: str, request: dict, timeout: Optional[float] = None):
+    """Sends the request and yields response messages."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        with sock.makefile('rwb') as f:
+            _send(f, request)
+            for line in f:
+                yield json.loads(line)
+
+
+def run_remote_command(args: List[str],
+                       timeout: Optional[float] = None,
+                       socket_path: str = DEFAULT_SOCKET_PATH,
+                       cwd: Optional[str] = None,
+                       out: TextIO = None) -> int:
+    """Runs ds command in the daemon and returns its exit code.
+
+    Output of the command is written to `out` (stdout by default) as it comes.
+    The timeout is enforced by the daemon; TIMEOUT_EXIT_CODE is returned if it expires.
+    """
+    out = out or sys.stdout
+    request = dict(type='run', args=list(args), timeout=timeout, cwd=cwd or os.getcwd())
+    # A margin to let the daemon kill the command and answer by itself.
+    sock_timeout = None if timeout is None else timeout + 30
+    for msg in _request(socket_path, request, sock_timeout):
+        if msg['type'] == 'output':
+            out.write(msg['data'])
+            out.flush()
+        elif msg['type'] == 'exit':
+            return msg['exit_code']
+    raise ConnectionError("ds serve closed the connection without exit code")
+
+
+def ping(socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    try:
+        return any(msg['type'] == 'pong' for msg in _request(socket_path, dict(type='ping'), timeout=5))
+    except OSError:
+        return False
+
+
+def wait_until_ready(socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if ping(socket_path):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def shutdown(socket_path: str = DEFAULT_SOCKET_PATH):
+    for _ in _request(socket_path, dict(type='shutdown'), timeout=5):
+        pass
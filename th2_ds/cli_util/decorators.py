@@ -3,8 +3,13 @@ import click
 import urllib3
 from click import Context
 
-from run_batch_testing import CFG_FILES
 from th2_ds.cli_util.context import CliContext
+from th2_ds.cli_util.profiling import profile_opt, profiled
+from th2_ds.cli_util.stage_timing import enable_stage_timing
+
+stage_timing_opt = click.option("--stage-timing", is_flag=True,
+                                help="Time fetch stages (ttfb, chunk reads, SSE/JSON decoding, map chain) "
+                                     "and write their histograms to the report.")
 
 
 def _cw(f):
@@ -40,26 +45,22 @@ def cli_command(f, name=None, group=None, required_cfg=True, **kwargs):
     if group is None:
         group = click
 
-    @group.command(name or f.__name__.lower().replace("_", "-"), context_settings=_context_settings, **kwargs)
-    @click.option("-c", "--cfg-path", required=True)
-    @click.option("-v", "--verbose", count=True)
-    @click.option("-r", "--report-path")
-    @click.pass_context
-    @wraps(f)
-    def new_func(ctx: Context, cfg_path: str, verbose: int, report_path: str, *args, **kwargs):
-        ctx.obj = CliContext(ctx, cfg_path, verbose, report_path)
-        return ctx.invoke(f, ctx.obj, *args, **kwargs)
-
     if required_cfg:
         @group.command(name or f.__name__.lower().replace("_", "-"), context_settings=_context_settings, **kwargs)
         @click.option("-c", "--cfg-path", required=True)
         @click.option("-v", "--verbose", count=True)
         @click.option("-r", "--report-path")
+        @stage_timing_opt
+        @profile_opt
         @click.pass_context
         @wraps(f)
-        def new_func(ctx: Context, cfg_path: str, verbose: int, report_path: str, *args, **kwargs):
-            ctx.obj = CliContext(ctx, cfg_path, verbose, report_path)
-            return ctx.invoke(f, ctx.obj, *args, **kwargs)
+        def new_func(ctx: Context, cfg_path: str, verbose: int, report_path: str, stage_timing: bool, profile: str,
+                     *args, **kwargs):
+            if stage_timing:
+                enable_stage_timing()
+            with profiled(profile, report_path):
+                ctx.obj = CliContext(ctx, cfg_path, verbose, report_path)
+                return ctx.invoke(f, ctx.obj, *args, **kwargs)
 
         return new_func
 
@@ -67,10 +68,18 @@ def cli_command(f, name=None, group=None, required_cfg=True, **kwargs):
         @group.command(name or f.__name__.lower().replace("_", "-"), context_settings=_context_settings, **kwargs)
         @click.option("-v", "--verbose", count=True)
         @click.option("-r", "--report-path")
+        @stage_timing_opt
+        @profile_opt
         @click.pass_context
         @wraps(f)
-        def new_func_no_cfg(ctx: Context, verbose: int, report_path: str, *args, **kwargs):
-            ctx.obj = CliContext(ctx, CFG_FILES[0], verbose, report_path)  # lw_dp.yaml used as dummy config
-            return ctx.invoke(f, ctx.obj, *args, **kwargs)
+        def new_func_no_cfg(ctx: Context, verbose: int, report_path: str, stage_timing: bool, profile: str,
+                            *args, **kwargs):
+            if stage_timing:
+                enable_stage_timing()
+            with profiled(profile, report_path):
+                # Imported here because run_batch_testing imports data source commands that are slow to import.
+                from run_batch_testing import CFG_FILES
+                ctx.obj = CliContext(ctx, CFG_FILES[0], verbose, report_path)  # lw_dp.yaml used as dummy config
+                return ctx.invoke(f, ctx.obj, *args, **kwargs)
 
         return new_func_no_cfg
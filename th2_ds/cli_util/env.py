@@ -0,0 +1,83 @@
+"""Verification and installation of data source implementation libs (ds_impl).
+
+Every command only verifies that the required ds_impl is installed.
+It's cheap: an importlib.metadata lookup and a persisted "verified" stamp keyed by
+the interpreter, the required and the installed ds_impl versions. The installed
+version is looked up on every check, so a stamp doesn't outlive a reinstall.
+
+Installation happens only via `ds env sync`.
+"""
+from __future__ import annotations
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from importlib import metadata
+from typing import Optional
+import click
+
+from th2_ds.cli_util import cache
+
+STAMP_PATH = cache.cache_path('ds_impl_verified.json')
+
+
+@lru_cache(maxsize=None)
+def get_installed_version(lib: str) -> Optional[str]:
+    try:
+        return metadata.version(lib)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _stamp_key(ds_impl, installed_version: Optional[str]) -> str:
+    python_version = '.'.join(map(str, sys.version_info[:3]))
+    return f"{sys.executable}|{python_version}|{ds_impl.lib}=={ds_impl.version}|installed={installed_version}"
+
+
+def _save_stamp(ds_impl):
+    stamps = cache.load_json(STAMP_PATH, default={})
+    stamps[_stamp_key(ds_impl, get_installed_version(ds_impl.lib))] = time.time()
+    try:
+        cache.save_json(STAMP_PATH, stamps)
+    except OSError as e:
+        click.secho(f"Cannot save ds_impl stamp: {e}", fg='yellow')
+
+
+def is_verified(ds_impl) -> bool:
+    version = get_installed_version(ds_impl.lib)
+    return version == ds_impl.version and _stamp_key(ds_impl, version) in cache.load_json(STAMP_PATH, default={})
+
+
+def verify_ds_impl(ds_impl) -> bool:
+    """Checks that the required ds_impl version is installed. Doesn't install anything."""
+    if ds_impl is None or is_verified(ds_impl):
+        return True
+
+    version = get_installed_version(ds_impl.lib)
+    if version is None:
+        click.secho(f"Package {ds_impl.lib} not found", fg='red')
+    elif version != ds_impl.version:
+        click.secho(f"Version conflict: required version {ds_impl.version}, found {version}", fg='red')
+    else:
+        _save_stamp(ds_impl)
+        return True
+
+    click.secho(f"Run `ds env sync` to install {ds_impl.lib}=={ds_impl.version}", fg='blue')
+    return False
+
+
+def sync_ds_impl(ds_impl):
+    """Installs the required ds_impl version if it's not installed yet."""
+    version = get_installed_version(ds_impl.lib)
+    if version == ds_impl.version:
+        click.secho(f"{ds_impl.lib}=={version} is already installed", fg='green')
+    else:
+        if version is None:
+            click.secho(f"Package {ds_impl.lib} not found", fg='red')
+        else:
+            click.secho(f"Version conflict: required version {ds_impl.version}, found {version}", fg='red')
+        click.secho(f"Installing {ds_impl.lib}:{ds_impl.version}", fg='blue')
+        subprocess.check_call([sys.executable, "-m", "pip", "install", f"{ds_impl.lib}=={ds_impl.version}"])
+        get_installed_version.cache_clear()
+
+    _save_stamp(ds_impl)
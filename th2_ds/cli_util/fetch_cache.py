@@ -0,0 +1,173 @@
+"""Opt-in on-disk cache of data fetched from data sources.
+
+Correctness tests (e.g. barch long range, alias all streams pass) download
+the same range again and again. With the cache enabled, the first complete
+iteration of the data is written to disk and later commands with the same
+data source, command class and command args replay it instead of going to
+the wire. Throughput tests must not use the cache.
+
+Enabled by the `DS_FETCH_CACHE` environment variable. The total size is
+bounded by `DS_FETCH_CACHE_MAX_SIZE_MB`; least recently used entries are
+evicted first.
+
+Entry files:
+    <key>.pickle -- records, pickle stream (the same as `Data.build_cache`).
+    <key>.json   -- Data metadata.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from typing import Any
+
+from th2_data_services.data import Data
+
+from th2_ds.cli_util import cache
+from th2_ds.cli_util.interfaces.data_source_wrapper import IDataSourceWrapper
+from th2_ds.cli_util.pipeline_metrics import get_pipeline_metrics, metered_command, register_pipeline_metrics
+
+FETCH_CACHE_DIR = cache.cache_path('fetch')
+DEFAULT_MAX_SIZE_MB = 2048
+
+
+def is_enabled() -> bool:
+    return bool(os.environ.get('DS_FETCH_CACHE'))
+
+
+def get_max_size_bytes() -> int:
+    return int(os.environ.get('DS_FETCH_CACHE_MAX_SIZE_MB', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024
+
+
+def _is_jsonable(value) -> bool:
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def get_cache_key(ds_wrapper: IDataSourceWrapper, command) -> str:
+    """Key by data source, command class and command args.
+
+    Command args are the plain attributes of the command object, so
+    handlers, adapters and other internals don't affect the key.
+    """
+    command_args = {k: v for k, v in vars(command).items() if _is_jsonable(v)}
+    key = {
+        'data_source': [type(ds_wrapper).__name__, getattr(ds_wrapper.ds_impl, 'url', None)],
+        'command': f"{type(command).__module__}.{type(command).__qualname__}",
+        'args': command_args,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _entry_paths(key: str):
+    return os.path.join(FETCH_CACHE_DIR, f'{key}.pickle'), os.path.join(FETCH_CACHE_DIR, f'{key}.json')
+
+
+def _replay(records_path: str, metadata_path: str) -> Data:
+    os.utime(records_path)  # Marks the entry as recently used.
+    metadata = cache.load_json(metadata_path, default={})
+    return Data.from_cache_file(records_path).update_metadata(metadata)
+
+
+def _evict(keep_path: str):
+    """Removes least recently used entries until the cache fits the size limit."""
+    entries = []
+    total_size = 0
+    with os.scandir(FETCH_CACHE_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith('.pickle'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            metadata_path = entry.path[:-len('.pickle')] + '.json'
+            try:
+                size = stat.st_size + os.path.getsize(metadata_path)
+            except OSError:
+                size = stat.st_size
+            entries.append((stat.st_mtime, entry.path, metadata_path, size))
+            total_size += size
+
+    max_size = get_max_size_bytes()
+    for _, records_path, metadata_path, size in sorted(entries):
+        if total_size <= max_size:
+            break
+        if records_path == keep_path:
+            continue
+        for path in (records_path, metadata_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total_size -= size
+
+
+def _recording(source: Data, records_path: str, metadata_path: str):
+    """Yields records of the source and writes them to the cache entry.
+
+    The entry is published only when the iteration is complete, so
+    an interrupted iteration never leaves a partial entry.
+    """
+    def iterate(*args, **kwargs):
+        if os.path.exists(records_path):
+            # Written by the previous iteration or by another process.
+            yield from _replay(records_path, metadata_path)
+            return
+
+        os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=FETCH_CACHE_DIR, suffix='.tmp')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for record in source:
+                    pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield record
+            completed = True
+        finally:
+            if completed:
+                cache.save_json(metadata_path, source.metadata)
+                os.replace(tmp_path, records_path)
+                _evict(keep_path=records_path)
+            else:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    return iterate
+
+
+def command(ds_wrapper: IDataSourceWrapper, command_obj: Any) -> Data:
+    """The same as `metered_command(ds_wrapper, command_obj)`, but uses the fetch cache if enabled.
+
+    Use it only for commands that return Data and only where the
+    transport speed is not what is being tested.
+    """
+    if not is_enabled():
+        return metered_command(ds_wrapper, command_obj)
+
+    records_path, metadata_path = _entry_paths(get_cache_key(ds_wrapper, command_obj))
+    if os.path.exists(records_path):
+        try:
+            return _replay(records_path, metadata_path)
+        except FileNotFoundError:
+            pass  # Evicted by another process right now.
+
+    source: Data = metered_command(ds_wrapper, command_obj)
+    data = Data(_recording(source, records_path, metadata_path)).update_metadata(source.metadata)
+    return register_pipeline_metrics(data, get_pipeline_metrics(source))
+
+
+def clear():
+    """Removes all entries."""
+    if not os.path.isdir(FETCH_CACHE_DIR):
+        return
+    for name in os.listdir(FETCH_CACHE_DIR):
+        try:
+            os.remove(os.path.join(FETCH_CACHE_DIR, name))
+        except OSError:
+            pass
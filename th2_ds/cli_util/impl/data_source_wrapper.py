@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 from typing_extensions import override
 
+from th2_ds.cli_util.env import get_installed_version
 from th2_ds.cli_util.interfaces.data_source_wrapper import ITh2DataSourceWrapper
 from th2_ds.cli_util.utils import get_command_class_args
 from th2_ds.cli_util.utils import truncate_timestamp
@@ -29,9 +30,8 @@ class CommonLogicForLwdpRelatedClasses(ITh2DataSourceWrapper):
     @override
     def get_messages_obj(self, ctx, command_kwargs=None):
         if ctx.cfg.get_messages_mode == "ByGroups":
-            import pkg_resources
-            version = pkg_resources.get_distribution('th2-data-services-lwdp').version
-            print("th2-data-services-lwdp version: " + version)
+            version = get_installed_version('th2-data-services-lwdp')
+            print(f"th2-data-services-lwdp version: {version}")
             from th2_data_services.data_source.lwdp.commands.http import GetMessagesByBookByGroups
             return GetMessagesByBookByGroups(**get_command_class_args(ctx.cfg, GetMessagesByBookByGroups, command_kwargs))
         elif ctx.cfg.get_messages_mode == "ByStreams":
@@ -60,6 +60,16 @@ class CommonLogicForLwdpRelatedClasses(ITh2DataSourceWrapper):
         from th2_data_services.data_source.lwdp.commands.http import GetBooks
         return GetBooks()
 
+    @override
+    def get_message_by_id_obj(self, ctx, message_id: str):
+        from th2_data_services.data_source.lwdp.commands.http import GetMessageById
+        return GetMessageById(message_id)
+
+    @override
+    def get_event_by_id_obj(self, ctx, event_id: str):
+        from th2_data_services.data_source.lwdp.commands.http import GetEventById
+        return GetEventById(event_id)
+
 
 class CommonLogicForRdp5RelatedClasses(CommonLogicForLwdpRelatedClasses):
     @override
@@ -82,6 +92,16 @@ class CommonLogicForRdp5RelatedClasses(CommonLogicForLwdpRelatedClasses):
         from th2_data_services.data_source.rdp.commands.http import GetBooks
         return GetBooks()
 
+    @override
+    def get_message_by_id_obj(self, ctx, message_id: str):
+        from th2_data_services.data_source.rdp.commands.http import GetMessageById
+        return GetMessageById(message_id)
+
+    @override
+    def get_event_by_id_obj(self, ctx, event_id: str):
+        from th2_data_services.data_source.rdp.commands.http import GetEventById
+        return GetEventById(event_id)
+
 
 class Lwdp1HttpDataSource(CommonLogicForLwdpRelatedClasses):
     @override
@@ -144,3 +164,83 @@ class Lwdp3HttpDataSource(CommonLogicForLwdpRelatedClasses):
     @override
     def accept(self, plugin: DSPlugin, **kwargs):
         return plugin.visit_lwdp3_http_data_source(self, **kwargs)
+
+
+class ReplayHttpDataSource(CommonLogicForLwdpRelatedClasses):
+    """Serves lwdp3 responses recorded by `speed-test --record`.
+
+    `url` in data_sources.yaml is the recording directory.
+    """
+    @override
+    def __init__(self, url: str, chunk_length: int = 65536):
+        from th2_ds.cli_util.impl.replay_data_source import ReplayDataSource
+        self._ds = ReplayDataSource(url, chunk_length)
+
+    @override
+    def accept(self, plugin: DSPlugin, **kwargs):
+        return plugin.visit_replay_http_data_source(self, **kwargs)
+
+
+class IndexedCacheFileDataSource(ITh2DataSourceWrapper):
+    """Serves records of an indexed cache file written by `ds get -o FILE -f dsc`.
+
+    `url` in data_sources.yaml is the file. The file has either messages or events.
+    """
+    @override
+    def __init__(self, url: str, chunk_length: int = 65536):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import IndexedCacheDataSource
+        self._ds = IndexedCacheDataSource(url)
+
+    @override
+    @property
+    def ds_impl(self):
+        return self._ds
+
+    @override
+    def accept(self, plugin: DSPlugin, **kwargs):
+        return plugin.visit_indexed_cache_file_data_source(self, **kwargs)
+
+    @override
+    def get_events_obj(self, ctx, command_kwargs=None):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedRecords
+        args = get_command_class_args(ctx.cfg, GetCachedRecords, command_kwargs)
+        args['streams'] = ctx.cfg.request_params.scopes
+        return GetCachedRecords('events', **args)
+
+    @override
+    def get_messages_obj(self, ctx, command_kwargs=None):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedRecords
+        args = get_command_class_args(ctx.cfg, GetCachedRecords, command_kwargs)
+        if ctx.cfg.get_messages_mode == "ByGroups":
+            args['streams'] = ctx.cfg.request_params.groups
+        elif ctx.cfg.get_messages_mode != "ByStreams":
+            raise ValueError(f"Unknown `messages_mode` value: {ctx.cfg.get_messages_mode}")
+        return GetCachedRecords('messages', messages_mode=ctx.cfg.get_messages_mode, **args)
+
+    @override
+    def get_groups_obj(self, ctx):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedStreams
+        return GetCachedStreams('messages')
+
+    @override
+    def get_aliases_obj(self, ctx):
+        raise Exception("Indexed cache files don't have aliases!")
+
+    @override
+    def get_scopes_obj(self, ctx):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedStreams
+        return GetCachedStreams('events')
+
+    @override
+    def get_books_obj(self, ctx):
+        raise Exception("Indexed cache files don't have books!")
+
+    @override
+    def get_message_by_id_obj(self, ctx, message_id: str):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedRecordById
+        return GetCachedRecordById('messages', message_id)
+
+    @override
+    def get_event_by_id_obj(self, ctx, event_id: str):
+        from th2_ds.cli_util.impl.indexed_cache_data_source import GetCachedRecordById
+        return GetCachedRecordById('events', event_id)
@@ -0,0 +1,93 @@
+"""Data source that serves records of an indexed cache file written by `ds get -o FILE -f dsc`."""
+import os
+from typing import List, Optional
+
+from th2_data_services.data import Data
+from th2_data_services.exceptions import CommandError, EventNotFound, MessageNotFound
+
+from th2_ds.cli_util.indexed_cache import IndexedCache
+from th2_ds.cli_util.sharded_fetch import stream_key, to_nanoseconds
+
+
+class IndexedCacheDataSource:
+    """The file is mapped to memory on creation and again if it's rewritten (wrappers live long in `ds serve`).
+
+    Commands fail the same way as lwdp ones: errors are wrapped into CommandError.
+    """
+
+    def __init__(self, path: str):
+        self.url = path
+        self._stamp = self._file_stamp()
+        self.cache = IndexedCache(path)
+
+    def _file_stamp(self) -> tuple:
+        st = os.stat(self.url)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def command(self, cmd):
+        try:
+            return cmd.handle(data_source=self)
+        except Exception as e:
+            raise CommandError(f"The command '{cmd.__class__.__name__}' was broken. Details of error:\n{e}")
+
+    def records_cache(self, rtype: str) -> IndexedCache:
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self.cache = IndexedCache(self.url)
+            self._stamp = stamp
+        if self.cache.rtype != rtype:
+            raise ValueError(f"'{self.url}' has {self.cache.rtype}, not {rtype}")
+        return self.cache
+
+    def check_connect(self, timeout, certification: bool = True) -> None:
+        pass
+
+
+class GetCachedRecords:
+    """Records with start_timestamp <= timestamp < end_timestamp of the streams, ordered by timestamp.
+
+    Streams are message groups or streams (by `messages_mode`) or event scopes.
+    """
+
+    def __init__(self, rtype: str, start_timestamp=None, end_timestamp=None, streams: Optional[List[str]] = None,
+                 messages_mode: str = 'ByGroups'):
+        self.rtype = rtype
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.streams = streams
+        self.messages_mode = messages_mode
+
+    def handle(self, data_source: IndexedCacheDataSource) -> Data:
+        cache = data_source.records_cache(self.rtype)
+        start_ns = to_nanoseconds(self.start_timestamp) if self.start_timestamp is not None else None
+        end_ns = to_nanoseconds(self.end_timestamp) if self.end_timestamp is not None else None
+        if not self.streams or self.rtype == 'events' or self.messages_mode == cache.messages_mode:
+            return cache.data(start_ns, end_ns, self.streams or None)
+
+        # Streams of the file are of the other messages mode, so records are filtered.
+        streams = set(self.streams)
+        rtype, messages_mode = self.rtype, self.messages_mode
+        return cache.data(start_ns, end_ns).filter(lambda r: stream_key(r, rtype, messages_mode) in streams)
+
+
+class GetCachedRecordById:
+    def __init__(self, rtype: str, record_id: str):
+        self.rtype = rtype
+        self.record_id = record_id
+
+    def handle(self, data_source: IndexedCacheDataSource) -> dict:
+        record = data_source.records_cache(self.rtype).get(self.record_id)
+        if record is None:
+            not_found = MessageNotFound if self.rtype == 'messages' else EventNotFound
+            raise not_found(self.record_id, f"Not in '{data_source.url}'")
+        return record
+
+
+class GetCachedStreams:
+    def __init__(self, rtype: str):
+        self.rtype = rtype
+
+    def handle(self, data_source: IndexedCacheDataSource) -> Data:
+        data = Data(list(data_source.records_cache(self.rtype).streams))
+        data.metadata["urls"] = [data_source.url]
+        return data
@@ -0,0 +1,39 @@
+"""lwdp HTTPDataSource that serves SSE responses recorded by `speed-test --record`."""
+from typing import Dict, Generator
+
+from th2_data_services.data_source.lwdp.data_source import HTTPDataSource
+from th2_data_services.data_source.lwdp.source_api.http import API
+from urllib3 import exceptions
+
+from th2_ds.cli_util.recording import load_recording, request_key
+
+
+class ReplayAPI(API):
+    def __init__(self, url: str, chunk_length: int, bodies: Dict[str, bytes]):
+        super().__init__(url, chunk_length)
+        self._bodies = bodies
+
+    def execute_sse_request(self, url: str) -> Generator[bytes, None, None]:
+        body = self._bodies.get(request_key(url))
+        if body is None:
+            raise exceptions.HTTPError(f"The request isn't recorded: {url}")
+        chunk_length = self._chunk_length
+        for i in range(0, len(body), chunk_length):
+            yield body[i:i + chunk_length]
+
+
+class ReplayDataSource(HTTPDataSource):
+    """Responses are read from the recording into memory on creation.
+
+    URLs are built from the recorded provider url, so commands produce
+    the same requests as in the recorded run.
+    """
+
+    def __init__(self, record_dir: str, chunk_length: int = 65536):
+        provider_url, bodies = load_recording(record_dir)
+        self.record_dir = record_dir
+        super().__init__(provider_url, chunk_length)
+        self._provider_api = ReplayAPI(provider_url, chunk_length, bodies)
+
+    def check_connect(self, timeout, certification: bool = True) -> None:
+        pass
@@ -0,0 +1,290 @@
+"""Indexed binary cache of events/messages (`ds get -o FILE -f dsc`).
+
+Unlike a pickled Data cache, the file can be read without decoding it
+from the start: it's mapped to memory and records are found by the
+footer index -- by time range, stream and id.
+
+Layout (integers are little-endian):
+
+    header      b"DSC1" + u32 format version
+    records     u32 length + json record, one after another
+    time index  (i64 timestamp ns, i64 record offset) sorted by stream, then timestamp;
+                `streams` of the metadata has the slice of every stream
+    id index    (u64 id hash, u64 record offset) sorted by hash
+    metadata    u32 length + json (rtype, messages mode, streams and index positions)
+    trailer     u64 metadata offset + b"DSC1"
+
+Indexes are aligned to 8 bytes.
+
+Streams are message groups or streams (by `get_messages_mode`) or
+event scopes. Records without a timestamp are indexed with 0, without
+an id aren't in the id index.
+
+`IndexedCache(path).data(...)` is a Data of the file records, so the
+file can be used as an offline data source, see
+`IndexedCacheFileDataSource`.
+"""
+import bisect
+import hashlib
+import heapq
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from th2_data_services.data import Data
+
+from th2_ds.cli_util.serializers import encode_line
+from th2_ds.cli_util.sharded_fetch import RECORD_FIELDS, record_timestamp_ns, stream_key
+
+MAGIC = b"DSC1"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sI")
+RECORD_LENGTH = struct.Struct("<I")
+TRAILER = struct.Struct("<Q4s")
+WRITE_BUFFER_SIZE = 1 << 20
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def id_hash(record_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(record_id.encode(), digest_size=8).digest(), 'little')
+
+
+def _to_bytes(values: array) -> bytes:
+    if not _LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class IndexedCacheWriter:
+    """Writes records to the file as they come, the index is written on `close`.
+
+    The index is kept in memory as arrays, 32 bytes per record.
+    """
+
+    def __init__(self, path: str, rtype: str, messages_mode: str = 'ByGroups'):
+        if rtype not in RECORD_FIELDS:
+            raise RuntimeError(f'Unknown Rtype: {rtype}')
+        self.path = path
+        self.rtype = rtype
+        self.messages_mode = messages_mode
+        self.records = 0
+        self._ts_field, self._id_field = RECORD_FIELDS[rtype]
+        # {stream: (timestamps, offsets)}
+        self._streams: Dict[str, Tuple[array, array]] = {}
+        self._id_hashes = array('Q')
+        self._id_offsets = array('Q')
+        self._f = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        self._offset = HEADER.size
+
+    def write(self, record: dict):
+        line = encode_line(record)
+        offset = self._offset
+        self._f.write(RECORD_LENGTH.pack(len(line)))
+        self._f.write(line)
+        self._offset += RECORD_LENGTH.size + len(line)
+        self.records += 1
+
+        timestamp = record.get(self._ts_field)
+        timestamps, offsets = self._streams.setdefault(stream_key(record, self.rtype, self.messages_mode) or '',
+                                                       (array('q'), array('q')))
+        timestamps.append(record_timestamp_ns(timestamp) if timestamp is not None else 0)
+        offsets.append(offset)
+        record_id = record.get(self._id_field)
+        if record_id is not None:
+            self._id_hashes.append(id_hash(str(record_id)))
+            self._id_offsets.append(offset)
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def _write_time_index(self) -> List[list]:
+        streams = []
+        first = 0
+        for name in sorted(self._streams):
+            timestamps, offsets = self._streams[name]
+            order = range(len(timestamps))
+            if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+                order = sorted(order, key=lambda i: (timestamps[i], offsets[i]))
+            entries = array('q')
+            for i in order:
+                entries.append(timestamps[i])
+                entries.append(offsets[i])
+            self._f.write(_to_bytes(entries))
+            streams.append([name, first, len(timestamps)])
+            first += len(timestamps)
+        return streams
+
+    def _write_id_index(self):
+        hashes, offsets = self._id_hashes, self._id_offsets
+        entries = array('Q')
+        # The sort is stable, so records with the same hash stay in the file order.
+        for i in sorted(range(len(hashes)), key=hashes.__getitem__):
+            entries.append(hashes[i])
+            entries.append(offsets[i])
+        self._f.write(_to_bytes(entries))
+
+    def close(self):
+        if self._f.closed:
+            return
+        records_end = self._offset
+        padding = -records_end % 8
+        self._f.write(b"\0" * padding)
+        time_index = records_end + padding
+        streams = self._write_time_index()
+        id_index = time_index + 16 * self.records
+        self._write_id_index()
+        meta = json.dumps(dict(rtype=self.rtype,
+                               messages_mode=self.messages_mode,
+                               records=self.records,
+                               records_end=records_end,
+                               streams=streams,
+                               time_index=time_index,
+                               id_index=id_index,
+                               ids=len(self._id_hashes))).encode()
+        meta_offset = id_index + 16 * len(self._id_hashes)
+        self._f.write(RECORD_LENGTH.pack(len(meta)))
+        self._f.write(meta)
+        self._f.write(TRAILER.pack(meta_offset, MAGIC))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class IndexedCache:
+    """Memory-mapped reader of an indexed cache file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._views: List[memoryview] = []
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load_metadata()
+        except Exception:
+            self.close()
+            raise
+
+    def _view_of(self, values: Sequence[int]) -> Sequence[int]:
+        if isinstance(values, memoryview):
+            self._views.append(values)
+        return values
+
+    def _view(self, offset: int, count: int, typecode: str) -> Sequence[int]:
+        """`count` integers at the offset, without copying on little-endian machines."""
+        if not _LITTLE_ENDIAN:
+            values = array(typecode, self._mm[offset:offset + count * 8])
+            values.byteswap()
+            return values
+        view = self._view_of(memoryview(self._mm)[offset:offset + count * 8])
+        return self._view_of(view.cast(typecode))
+
+    def _load_metadata(self):
+        mm = self._mm
+        if len(mm) < HEADER.size + TRAILER.size:
+            raise ValueError(f"'{self.path}' isn't an indexed cache file")
+        magic, version = HEADER.unpack_from(mm, 0)
+        meta_offset, end_magic = TRAILER.unpack_from(mm, len(mm) - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f"'{self.path}' isn't an indexed cache file or it's incomplete")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"'{self.path}' has unsupported format version {version}")
+        (meta_size,) = RECORD_LENGTH.unpack_from(mm, meta_offset)
+        meta = json.loads(mm[meta_offset + RECORD_LENGTH.size:meta_offset + RECORD_LENGTH.size + meta_size])
+        self._records_end = meta['records_end']
+        self.rtype: str = meta['rtype']
+        self.messages_mode: str = meta['messages_mode']
+        self.records: int = meta['records']
+        # {stream: (first index entry, number of entries)}
+        self.streams: Dict[str, Tuple[int, int]] = {name: (first, count) for name, first, count in meta['streams']}
+        time_index = self._view(meta['time_index'], 2 * self.records, 'q')
+        self._timestamps, self._offsets = self._view_of(time_index[0::2]), self._view_of(time_index[1::2])
+        id_index = self._view(meta['id_index'], 2 * meta['ids'], 'Q')
+        self._id_hashes, self._id_offsets = self._view_of(id_index[0::2]), self._view_of(id_index[1::2])
+        self._id_field = RECORD_FIELDS[self.rtype][1]
+
+    def __len__(self):
+        return self.records
+
+    def record_at(self, offset: int) -> dict:
+        (size,) = RECORD_LENGTH.unpack_from(self._mm, offset)
+        start = offset + RECORD_LENGTH.size
+        return json.loads(self._mm[start:start + size])
+
+    def __iter__(self) -> Iterator[dict]:
+        """Records in the file order."""
+        offset = HEADER.size
+        while offset < self._records_end:
+            (size,) = RECORD_LENGTH.unpack_from(self._mm, offset)
+            start = offset + RECORD_LENGTH.size
+            yield json.loads(self._mm[start:start + size])
+            offset = start + size
+
+    def get(self, record_id: str) -> Optional[dict]:
+        """The record with the id or None."""
+        hashes = self._id_hashes
+        h = id_hash(record_id)
+        idx = bisect.bisect_left(hashes, h)
+        while idx < len(hashes) and hashes[idx] == h:
+            record = self.record_at(self._id_offsets[idx])
+            if record.get(self._id_field) == record_id:
+                return record
+            idx += 1
+        return None
+
+    def _stream_entries(self, name: str, start_ns: Optional[int], end_ns: Optional[int]) -> Iterator[Tuple[int, int]]:
+        first, count = self.streams[name]
+        lo, hi = first, first + count
+        timestamps, offsets = self._timestamps, self._offsets
+        if start_ns is not None:
+            lo = bisect.bisect_left(timestamps, start_ns, lo, hi)
+        if end_ns is not None:
+            hi = bisect.bisect_left(timestamps, end_ns, lo, hi)
+        for idx in range(lo, hi):
+            yield timestamps[idx], offsets[idx]
+
+    def iter_range(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                   streams: Optional[Sequence[str]] = None) -> Iterator[dict]:
+        """Records of the streams (all if None) with start_ns <= timestamp < end_ns, ordered by timestamp."""
+        names = self.streams if streams is None else [name for name in streams if name in self.streams]
+        for _, offset in heapq.merge(*(self._stream_entries(name, start_ns, end_ns) for name in names)):
+            yield self.record_at(offset)
+
+    def data(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+             streams: Optional[Sequence[str]] = None) -> Data:
+        """Data of `iter_range` records. Without arguments, records are in the file order."""
+        if start_ns is None and end_ns is None and streams is None:
+            data = Data(self.__iter__)
+        else:
+            data = Data(lambda: self.iter_range(start_ns, end_ns, streams))
+        data.metadata["urls"] = [self.path]
+        return data
+
+    def close(self):
+        # Views of the index must be released before the map is closed.
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_cache_file(records, out_file: str, rtype: str, messages_mode: str = 'ByGroups') -> int:
+    """Writes the records to the indexed cache file. Returns the number of records."""
+    with IndexedCacheWriter(out_file, rtype, messages_mode) as writer:
+        writer.write_all(records)
+    return writer.records
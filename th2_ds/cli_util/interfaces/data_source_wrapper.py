@@ -42,3 +42,11 @@ class ITh2DataSourceWrapper(IDataSourceWrapper):
     @abstractmethod
     def get_books_obj(self, ctx):
         pass
+
+    @abstractmethod
+    def get_message_by_id_obj(self, ctx, message_id: str):
+        pass
+
+    @abstractmethod
+    def get_event_by_id_obj(self, ctx, event_id: str):
+        pass
@@ -32,18 +32,26 @@ class DSPlugin(ABC):
         click.echo(F"Version {self.version}")
         ctx.exit()
 
-    @abstractmethod
+    def _not_applicable(self):
+        raise click.UsageError(f"'{self.root().name}' is not applicable to this data source")
+
+    # Plugins that work with data sources override the visitors.
     def visit_lwdp1_http_data_source(self, element: IDataSourceWrapper, **kwargs):
-        pass
+        self._not_applicable()
 
-    @abstractmethod
     def visit_rpt5_http_data_source(self, element: IDataSourceWrapper, **kwargs):
-        pass
+        self._not_applicable()
 
-    @abstractmethod
     def visit_lwdp2_http_data_source(self, element: IDataSourceWrapper, **kwargs):
-        pass
+        self._not_applicable()
 
-    @abstractmethod
     def visit_lwdp3_http_data_source(self, element: IDataSourceWrapper, **kwargs):
-        pass
+        self._not_applicable()
+
+    def visit_replay_http_data_source(self, element: IDataSourceWrapper, **kwargs):
+        """Recorded lwdp3 responses are handled like lwdp3 by default."""
+        return self.visit_lwdp3_http_data_source(element, **kwargs)
+
+    def visit_indexed_cache_file_data_source(self, element: IDataSourceWrapper, **kwargs):
+        """Records of indexed cache files are handled like lwdp3 by default."""
+        return self.visit_lwdp3_http_data_source(element, **kwargs)
@@ -0,0 +1,170 @@
+"""Lazy plugin loading for ds.py.
+
+To know the command names, every plugin module has to be imported, which pulls
+in th2_data_services, prettytable, event-tree code and so on. The result of
+such a scan is stored in a manifest (command name -> module path), so next
+starts import only the plugin module of the command that is being run.
+
+The manifest is rebuilt when any file in the plugins folders is added,
+removed or modified.
+"""
+from __future__ import annotations
+import importlib
+import pkgutil
+import traceback
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import click
+from click.utils import make_default_short_help
+
+from th2_ds.cli_util import cache
+
+MANIFEST_PATH = cache.cache_path('plugins_manifest.json')
+MANIFEST_VERSION = 1
+
+
+def print_load_error(full_module_path: str):
+    click.secho(F"Cannot load plugin: '{full_module_path}'", bg='red')
+    print(traceback.format_exc())
+    print()
+
+
+class LazyPluginGroup(click.Group):
+    """click.Group that imports plugin modules only when their command is requested.
+
+    plugin_entries: {command_name: manifest entry}
+        entry = {'module': 'th2_ds.cli_util.plugins.get', 'help': '...'}
+        Packages (e.g. dsplugins/analysis) additionally have
+            'package': True, 'commands': {command_name: entry}
+    """
+
+    def __init__(self, *args, plugin_entries: Optional[dict] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plugin_entries: Dict[str, dict] = plugin_entries or {}
+
+    def add_plugin_entries(self, plugin_entries: dict):
+        self.plugin_entries.update(plugin_entries)
+
+    def list_commands(self, ctx) -> List[str]:
+        return sorted(set(self.commands) | set(self.plugin_entries))
+
+    def get_command(self, ctx, cmd_name: str):
+        cmd = self.commands.get(cmd_name)
+        if cmd is not None:
+            return cmd
+
+        entry = self.plugin_entries.get(cmd_name)
+        if entry is None:
+            return None
+
+        cmd = load_command(entry)
+        if cmd is not None:
+            self.add_command(cmd, cmd_name)
+        return cmd
+
+    def format_commands(self, ctx, formatter):
+        """The same as click does, but takes help of not loaded commands from the manifest."""
+        rows = []
+        names = self.list_commands(ctx)
+        if not names:
+            return
+
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        for name in names:
+            cmd = self.commands.get(name)
+            if cmd is not None:
+                if cmd.hidden:
+                    continue
+                rows.append((name, cmd.get_short_help_str(limit)))
+            else:
+                rows.append((name, make_default_short_help(self.plugin_entries[name]['help'], limit)))
+
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+def load_command(entry: dict) -> Optional[click.Command]:
+    full_module_path = entry['module']
+    try:
+        plugin_module = importlib.import_module(full_module_path)
+        if entry.get('package'):
+            gr: click.Group = plugin_module.Package().get_root_group()
+            return LazyPluginGroup(name=gr.name,
+                                   help=gr.help,
+                                   callback=gr.callback,
+                                   params=gr.params,
+                                   plugin_entries=entry['commands'])
+        else:
+            return plugin_module.Plugin().get_root_group()
+    except Exception:
+        print_load_error(full_module_path)
+        return None
+
+
+def _get_short_help(cmd: click.Command) -> str:
+    return cmd.short_help or cmd.help or ''
+
+
+def scan_plugins(plugins_folder_path: str) -> Tuple[dict, bool]:
+    """Imports all plugins from the folder and returns (plugin_entries, all_loaded)."""
+    module_path = plugins_folder_path.replace('/', '.')
+    entries = {}
+    all_loaded = True
+    for finder, name, ispkg in pkgutil.iter_modules([str(Path(plugins_folder_path).resolve())]):
+        full_module_path = F"{module_path}.{name}"
+        try:
+            plugin_module = importlib.import_module(full_module_path)
+            if not ispkg:
+                if 'Plugin' in dir(plugin_module):
+                    cmd = plugin_module.Plugin().get_root_group()
+                    entries[cmd.name] = dict(module=full_module_path, help=_get_short_help(cmd))
+            elif 'Package' in dir(plugin_module):
+                gr = plugin_module.Package().get_root_group()
+                sub_entries, sub_loaded = scan_plugins(plugins_folder_path + '/' + name)
+                all_loaded &= sub_loaded
+                entries[gr.name] = dict(module=full_module_path, help=_get_short_help(gr),
+                                        package=True, commands=sub_entries)
+        except Exception:
+            print_load_error(full_module_path)
+            all_loaded = False
+
+    return entries, all_loaded
+
+
+def get_plugins_mtimes(plugins_folders: List[str]) -> Dict[str, float]:
+    mtimes = {}
+    for folder in plugins_folders:
+        for path in sorted(Path(folder).rglob('*.py')):
+            mtimes[str(path)] = path.stat().st_mtime
+    return mtimes
+
+
+def load_plugin_entries(plugins_folders: List[str]) -> dict:
+    """Returns plugin entries from the manifest, rebuilding it if it's outdated."""
+    mtimes = get_plugins_mtimes(plugins_folders)
+    manifest = cache.load_json(MANIFEST_PATH)
+    if (manifest is not None
+            and manifest.get('version') == MANIFEST_VERSION
+            and manifest.get('folders') == plugins_folders
+            and manifest.get('mtimes') == mtimes):
+        return manifest['commands']
+
+    entries = {}
+    all_loaded = True
+    for folder in plugins_folders:
+        folder_entries, folder_loaded = scan_plugins(folder)
+        entries.update(folder_entries)
+        all_loaded &= folder_loaded
+
+    # Broken plugins are not cached to show the error on every start until it's fixed.
+    if all_loaded:
+        try:
+            cache.save_json(MANIFEST_PATH, dict(version=MANIFEST_VERSION,
+                                                folders=plugins_folders,
+                                                mtimes=mtimes,
+                                                commands=entries))
+        except OSError as e:
+            click.secho(f"Cannot save plugins manifest: {e}", fg='yellow')
+
+    return entries
@@ -0,0 +1,93 @@
+"""Local store of data source metadata (books, scopes, aliases, groups) with TTL.
+
+Discovery requests are cheap for the provider to answer, but a large book
+has thousands of scopes and aliases and every request is a full HTTP
+round-trip. The results are kept in METADATA_STORE_PATH and reused until
+they are older than the TTL (`DS_METADATA_TTL_SEC`, 0 disables the store).
+
+Records are keyed the same way as fetch cache entries -- by data source,
+command class and command args.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional
+
+from th2_ds.cli_util import cache
+from th2_ds.cli_util.fetch_cache import get_cache_key
+from th2_ds.cli_util.interfaces.data_source_wrapper import IDataSourceWrapper
+
+METADATA_STORE_PATH = cache.cache_path('metadata.json')
+DEFAULT_TTL_SEC = 3600
+DEFAULT_MAX_WORKERS = 8
+
+_store_lock = threading.Lock()
+
+
+def get_ttl_sec() -> float:
+    return float(os.environ.get('DS_METADATA_TTL_SEC', DEFAULT_TTL_SEC))
+
+
+def _load_fresh(key: str, ttl_sec: float) -> Optional[list]:
+    with _store_lock:
+        record = cache.load_json(METADATA_STORE_PATH, default={}).get(key)
+    if record is not None and time.time() - record['saved_at'] < ttl_sec:
+        return record['value']
+    return None
+
+
+def _save(key: str, value: list):
+    now = time.time()
+    ttl_sec = get_ttl_sec()
+    with _store_lock:
+        store = cache.load_json(METADATA_STORE_PATH, default={})
+        # Expired records are dropped, so the store doesn't grow endlessly.
+        store = {k: v for k, v in store.items() if now - v['saved_at'] < ttl_sec}
+        store[key] = dict(saved_at=now, value=value)
+        cache.save_json(METADATA_STORE_PATH, store)
+
+
+def get(ds_wrapper: IDataSourceWrapper, command_obj: Any, refresh: bool = False) -> List:
+    """Returns the command result as a list, from the store if it isn't expired.
+
+    Args:
+        ds_wrapper: Data source wrapper to request.
+        command_obj: Discovery command (GetBooks, GetEventScopes, GetMessageAliases, GetMessageGroups).
+        refresh: Request the data source even if the store has a fresh record.
+    """
+    ttl_sec = get_ttl_sec()
+    if ttl_sec <= 0:
+        return list(ds_wrapper.ds_impl.command(command_obj))
+
+    key = get_cache_key(ds_wrapper, command_obj)
+    if not refresh:
+        value = _load_fresh(key, ttl_sec)
+        if value is not None:
+            return value
+
+    value = list(ds_wrapper.ds_impl.command(command_obj))
+    _save(key, value)
+    return value
+
+
+def get_many(requests: Dict[Hashable, tuple],
+             refresh: bool = False,
+             max_workers: int = DEFAULT_MAX_WORKERS) -> Dict[Hashable, List]:
+    """Runs `get` for every request concurrently.
+
+    Args:
+        requests: {name: (ds_wrapper, command_obj)}.
+        refresh: See `get`.
+        max_workers: Max number of concurrent requests.
+
+    Returns:
+        {name: result}
+    """
+    if not requests:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as executor:
+        futures = {name: executor.submit(get, ds_wrapper, command_obj, refresh)
+                   for name, (ds_wrapper, command_obj) in requests.items()}
+        return {name: future.result() for name, future in futures.items()}
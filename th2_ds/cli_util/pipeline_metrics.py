@@ -0,0 +1,253 @@
+"""Metrics of a Data pipeline: records, wire bytes and decoded bytes.
+
+Every pipeline has its own PipelineMetrics object, so several pipelines can
+be counted at the same time (e.g. in different threads).
+
+- records       -- records yielded by the pipeline;
+- wire bytes    -- bytes read from the HTTP stream;
+- decoded bytes -- bytes of SSE event data (JSON text) decoded from the stream.
+
+Wire and decoded bytes are known only for pipelines created by `metered_command`
+from SSE commands. E.g. a pipeline replayed from a cache has records only.
+
+Counters are accumulated locally by the pipeline generators and added to the
+shared totals in batches, so the per-record overhead is an integer increment.
+"""
+from __future__ import annotations
+import contextlib
+import datetime
+import threading
+import time
+import weakref
+from typing import Any, Iterable, Optional
+
+from th2_data_services.data import Data
+
+from th2_ds.cli_util.stage_timing import timed_command
+
+# How many records/events are accumulated locally before being added to the totals.
+BATCH_SIZE = 256
+PRINT_INTERVAL_SEC = 1
+
+# PipelineMetrics of Data objects created by `metered_command`.
+_data_metrics = weakref.WeakKeyDictionary()
+
+
+def sizeof_fmt(num, suffix="B"):
+    for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
+        if abs(num) < 1024.0:
+            return f"{num:3.1f}{unit}{suffix}"
+        num /= 1024.0
+    return f"{num:.1f}Yi{suffix}"
+
+
+class PipelineMetrics:
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._records = 0
+        self._wire_bytes = 0
+        self._decoded_bytes = 0
+        self._is_stream_metered = False
+        self._start_time: Optional[float] = None
+        self._end_time: Optional[float] = None
+
+        self._progress_depth = 0
+        self._printer_thread: Optional[threading.Thread] = None
+        self._printer_stop = threading.Event()
+
+    def __deepcopy__(self, memo):
+        # Data deep-copies its workflow (with callbacks bound to the metrics)
+        # on every iteration. All copies must update the same counters.
+        return self
+
+    def _add(self, records: int = 0, wire_bytes: int = 0, decoded_bytes: int = 0):
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            self._records += records
+            self._wire_bytes += wire_bytes
+            self._decoded_bytes += decoded_bytes
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    @property
+    def wire_bytes(self) -> Optional[int]:
+        """None if the pipeline isn't metered on the stream level."""
+        return self._wire_bytes if self._is_stream_metered else None
+
+    @property
+    def decoded_bytes(self) -> Optional[int]:
+        """None if the pipeline isn't metered on the stream level."""
+        return self._decoded_bytes if self._is_stream_metered else None
+
+    @property
+    def elapsed_sec(self) -> float:
+        if self._start_time is None:
+            return 0.0
+        end_time = self._end_time if self._end_time is not None else time.monotonic()
+        return end_time - self._start_time
+
+    # Metering.
+    def _count_records(self, stream: Iterable) -> Iterable:
+        batch_size = self._batch_size
+        n = 0
+        try:
+            for record in stream:
+                n += 1
+                if n == batch_size:
+                    self._add(records=n)
+                    n = 0
+                yield record
+        finally:
+            self._add(records=n)
+
+    def count(self, data: Data) -> Data:
+        """Returns the Data that counts records yielded by `data`."""
+        return data.map_stream(self._count_records)
+
+    def meter_command(self, command_obj: Any) -> bool:
+        """Meters wire and decoded bytes of the SSE command.
+
+        Must be called before the command is executed. Returns False if
+        the command doesn't work with an SSE stream.
+        """
+        bytes_stream = getattr(command_obj, '_sse_bytes_stream', None)
+        events_stream = getattr(command_obj, '_sse_events_stream', None)
+        if bytes_stream is None or events_stream is None:
+            return False
+
+        def metered_bytes_stream(*args, **kwargs):
+            # Chunks are large (chunk_length), so they are added one by one.
+            for chunk in bytes_stream(*args, **kwargs):
+                self._add(wire_bytes=len(chunk))
+                yield chunk
+
+        def metered_events_stream(*args, **kwargs):
+            batch_size = self._batch_size
+            n = 0
+            decoded_bytes = 0
+            try:
+                for event in events_stream(*args, **kwargs):
+                    n += 1
+                    decoded_bytes += len(event.data)
+                    if n == batch_size:
+                        self._add(decoded_bytes=decoded_bytes)
+                        n = decoded_bytes = 0
+                    yield event
+            finally:
+                self._add(decoded_bytes=decoded_bytes)
+
+        # The command calls these methods through `self`, so instance attributes override them.
+        command_obj._sse_bytes_stream = metered_bytes_stream
+        command_obj._sse_events_stream = metered_events_stream
+        self._is_stream_metered = True
+        return True
+
+    # Reporting.
+    def summary(self) -> dict:
+        records = self.records
+        wire_bytes = self.wire_bytes
+        decoded_bytes = self.decoded_bytes
+        elapsed_sec = self.elapsed_sec
+        summary = dict(records=records,
+                       elapsed_sec=elapsed_sec,
+                       records_per_sec=records / elapsed_sec if elapsed_sec else None,
+                       wire_bytes=wire_bytes,
+                       decoded_bytes=decoded_bytes)
+        if decoded_bytes is not None:
+            summary['wire_bytes_per_sec'] = wire_bytes / elapsed_sec if elapsed_sec else None
+            summary['avg_record_size'] = decoded_bytes / records if records else 0
+        return summary
+
+    def state_str(self, last_records: int = None) -> str:
+        records = self.records
+        elapsed_sec = self.elapsed_sec
+        avg = records / elapsed_sec if elapsed_sec else 0
+        text = f"Recv: {records}, "
+        if last_records is not None:
+            text += f"speed: {records - last_records}/s, "
+        text += f"avg: {avg:.0f}/s, "
+        if self._is_stream_metered:
+            wire_speed = self._wire_bytes / elapsed_sec if elapsed_sec else 0
+            text += f"wire: {sizeof_fmt(self._wire_bytes)} ({sizeof_fmt(wire_speed)}/s), "
+            text += f"decoded: {sizeof_fmt(self._decoded_bytes)}, "
+        text += f"time: {datetime.timedelta(seconds=round(elapsed_sec))}"
+        return text
+
+    def _print_progress(self):
+        last_records = self.records
+        while not self._printer_stop.wait(PRINT_INTERVAL_SEC):
+            records = self.records
+            print(f"\r{self.state_str(last_records)}         ", end="", flush=True)
+            last_records = records
+
+    def start_progress(self):
+        """Starts printing the state every second. Reentrant -- nested calls are counted."""
+        with self._lock:
+            self._progress_depth += 1
+            if self._progress_depth > 1:
+                return
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            self._end_time = None
+            self._printer_stop.clear()
+            self._printer_thread = threading.Thread(target=self._print_progress, daemon=True)
+        self._printer_thread.start()
+
+    def stop_progress(self, force: bool = False):
+        """Stops printing and prints the final state.
+
+        Args:
+            force: Stop regardless of the nesting depth. Further stops are no-op.
+        """
+        with self._lock:
+            if self._progress_depth == 0:
+                return
+            self._progress_depth = 0 if force else self._progress_depth - 1
+            if self._progress_depth > 0:
+                return
+            self._end_time = time.monotonic()
+            thread, self._printer_thread = self._printer_thread, None
+        self._printer_stop.set()
+        thread.join()
+        print(f"\r{self.state_str()}         ")
+
+    @contextlib.contextmanager
+    def progress(self):
+        self.start_progress()
+        try:
+            yield self
+        finally:
+            self.stop_progress()
+
+
+def get_pipeline_metrics(data: Data) -> Optional[PipelineMetrics]:
+    """Returns PipelineMetrics of the Data created by `metered_command`."""
+    try:
+        return _data_metrics.get(data)
+    except TypeError:
+        return None
+
+
+def register_pipeline_metrics(data: Data, metrics: Optional[PipelineMetrics]) -> Data:
+    if metrics is not None:
+        _data_metrics[data] = metrics
+    return data
+
+
+def metered_command(ds_wrapper, command_obj: Any) -> Data:
+    """The same as `timed_command(ds_wrapper, command_obj)`, but also meters wire and decoded bytes.
+
+    PipelineMetrics of the result can be got by `get_pipeline_metrics`.
+    """
+    metrics = PipelineMetrics()
+    if not metrics.meter_command(command_obj):
+        return timed_command(ds_wrapper, command_obj)
+
+    data = timed_command(ds_wrapper, command_obj)
+    if isinstance(data, Data):
+        register_pipeline_metrics(data, metrics)
+    return data
@@ -0,0 +1,50 @@
+from subprocess import CalledProcessError
+from typing import Optional
+import click
+
+from th2_ds.cli_util.config import DATA_SOURCE_CONFIG_PATH, DataSource, get_cfg, _load_yaml
+from th2_ds.cli_util.env import sync_ds_impl
+from th2_ds.cli_util.interfaces.plugin import DSPlugin
+
+
+@click.group()
+def env():
+    """Manage data source libs (ds_impl) required by configs"""
+
+
+@env.command()
+@click.option("-c", "--cfg-path",
+              help="Sync ds_impl of the `default_data_source` of the config only. "
+                   "By default ds_impl of all data sources are synced.")
+def sync(cfg_path: Optional[str]):
+    """Install ds_impl versions required by data sources config
+
+    Commands don't install anything themselves, they only verify ds_impl.
+    """
+    if cfg_path:
+        cfg = get_cfg(cfg_path, {})
+        ds_cfgs = {cfg.default_data_source: cfg.data_sources[cfg.default_data_source]}
+    else:
+        ds_cfgs = {name: DataSource(**ds_cfg)
+                   for name, ds_cfg in _load_yaml(DATA_SOURCE_CONFIG_PATH)['data_sources'].items()}
+
+    exit_code = 0
+    for name, ds_cfg in ds_cfgs.items():
+        if ds_cfg.ds_impl is None:
+            continue
+        try:
+            sync_ds_impl(ds_cfg.ds_impl)
+        except CalledProcessError as e:
+            click.secho(f"Cannot install ds_impl for '{name}': {e}", fg='red')
+            exit_code = 1
+
+    exit(exit_code)
+
+
+class Plugin(DSPlugin):
+    def version(self) -> str:
+        return '1.0.0'
+
+    def root(self) -> click.Command:
+        """The group or command to attach to ds.py cli."""
+        return env
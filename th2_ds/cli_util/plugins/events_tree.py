@@ -1,4 +1,3 @@
-import json
 import os
 import re
 import time
@@ -9,26 +8,22 @@ from th2_data_services.data import Data
 from th2_data_services.data_source.lwdp.event_tree import HttpETCDriver
 from th2_data_services.event_tree.event_tree_collection import EventTreeCollection
 from th2_data_services.utils.converters import Th2TimestampConverter
+from th2_ds.cli_util import writers
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
-from th2_ds.cli_util.utils import counter, reset_counter, setup_counter, \
-    get_command_class_args, show_info, data_counter, get_ds_wrapper
+from th2_ds.cli_util.pipeline_metrics import metered_command
+from th2_ds.cli_util.utils import get_command_class_args, show_info, data_counter, get_ds_wrapper
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 
 
 def write_data_to_file(data, out_file):
-    with open(out_file, "w") as f:
-        setup_counter()
-        data = data.map(counter)
-        for m in data:
-            print(json.dumps(m, separators=(",", ":")), file=f)
-        reset_counter()
+    with data_counter(data) as data_:
+        writers.write_file(data_, out_file, 'json')
 
 
 def print_data_to_stdout(data):
-    for m in data:
-        print(json.dumps(m, separators=(",", ":")))
+    writers.print_lines(data)
 
 
 def get_etc(events: Data, ds):
@@ -156,7 +151,7 @@ class Plugin(DSPlugin):
         exclude_events_by_name = kwargs['exclude_events_by_name']
 
         get_events_cmd_obj = ds_wrapper.get_events_obj(ctx)
-        data: Data = ds_wrapper.ds_impl.command(get_events_cmd_obj)
+        data: Data = metered_command(ds_wrapper, get_events_cmd_obj)
         command_class_args = get_command_class_args(ctx.cfg, type(get_events_cmd_obj))
 
         return dict(data=data,
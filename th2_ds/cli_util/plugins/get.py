@@ -1,15 +1,19 @@
 from __future__ import annotations
 import json
-import os
 import time
-from typing import Optional
+from typing import Optional, TextIO
 import click
 
 from th2_data_services.data import Data
+from th2_ds.cli_util import by_id, indexed_cache, metadata_store, writers
 from th2_ds.cli_util.interfaces.data_source_wrapper import IDataSourceWrapper
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
+from th2_ds.cli_util.sharded_fetch import shards_opt, unordered_opt, fetch
+from th2_ds.cli_util.checkpoint import DownloadCheckpoint, resume_opts
+from th2_ds.cli_util.spilled_fetch import processes_opt, download_to_file
+from th2_ds.cli_util.projection import Projection, fields_opt
 from th2_ds.cli_util.context import CliContext
-from th2_ds.cli_util.utils import not_implemented_err, get_command_class_args, show_info, data_counter, \
+from th2_ds.cli_util.utils import get_command_class_args, show_info, data_counter, \
     get_ds_wrapper, create_ds_wrapper, generate_and_save_report, get_exception_info
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 
@@ -19,30 +23,97 @@ if TYPE_CHECKING:
     from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 
 
-def write_data_to_file_json(data, out_file):
-    with open(out_file, "w") as f:
-        with data_counter(data) as data_:
-            for m in data_:
-                print(json.dumps(m, separators=(",", ":")), file=f)
+def write_data_to_file_json(data, out_file, file_format='json', checkpoint: Optional[DownloadCheckpoint] = None,
+                            projection: Optional[Projection] = None):
+    """json lines, plain or compressed, or a columnar format -- see `writers`.
+
+    `projection` is applied by the checkpoint; without a checkpoint `data` is expected to be projected already.
+    """
+    with data_counter(data) as data_:
+        if checkpoint is None:
+            writers.write_file(data_, out_file, file_format)
+        else:
+            writers.write_file(checkpoint.filter(data_, projection), out_file, file_format,
+                               offset=checkpoint.offset, on_chunk=checkpoint.on_chunk)
+            checkpoint.remove()
 
 
 def write_data_to_file_pickle(data, out_file):
-    with open(out_file, "w") as f:
-        with data_counter(data) as data_:
-            data_: Data
-            data_.build_cache(out_file)
+    click.secho("pickle format is deprecated, use dsc -- the indexed cache format", fg="yellow")
+    with data_counter(data) as data_:
+        data_: Data
+        data_.build_cache(out_file)
+
+
+def write_data_to_file_cache(data, out_file, rtype: str, messages_mode: str):
+    """Indexed cache file, see `indexed_cache`."""
+    with data_counter(data) as data_:
+        indexed_cache.write_cache_file(data_, out_file, rtype, messages_mode)
+
+
+def check_out_format(out_file: Optional[str], format_file: str, rtype: str):
+    if not out_file:
+        return
+    if format_file.lower() == CACHE_FILE_FORMAT and rtype not in ('messages', 'events'):
+        raise click.UsageError(f"{CACHE_FILE_FORMAT} format is for messages and events only")
+    writers.check_format(format_file.lower())
 
 
 def print_data_to_stdout(data):
-    for m in data:
-        print(json.dumps(m, separators=(",", ":")))
+    writers.print_lines(data)
+
+
+def start_checkpoint(ctx: CliContext, rtype: str, out_file: Optional[str], format_file: str, resume: bool,
+                     interval_sec: float, fields: Optional[Projection] = None,
+                     ordered: bool = True) -> Optional[DownloadCheckpoint]:
+    """Downloads to json line files are checkpointed, other outputs can't be resumed.
+
+    Checkpoints rely on records of every stream coming ordered by timestamp,
+    so unordered sharded downloads aren't checkpointed either.
+    """
+    if not ordered:
+        if resume:
+            raise click.UsageError("--unordered downloads can't be resumed")
+        return None
+    if out_file and format_file.lower() in writers.LINE_FORMATS:
+        checkpoint = DownloadCheckpoint.start(ctx, rtype, out_file, format_file, resume, interval_sec,
+                                              fields.paths if fields else None)
+        checkpoint.narrow(ctx)
+        return checkpoint
+    if resume:
+        raise click.UsageError(f"--resume requires the out file in one of {', '.join(writers.LINE_FORMATS)} formats")
+    return None
+
+
+def check_spilled_download(out_file: Optional[str], format_file: str, resume: bool):
+    if not out_file or format_file.lower() not in writers.LINE_FORMATS:
+        raise click.UsageError(f"--processes requires the out file in one of {', '.join(writers.LINE_FORMATS)} "
+                               f"formats")
+    if resume:
+        raise click.UsageError("--processes downloads can't be resumed")
 
 
 DEFAULT_FILE_FORMAT = 'json'
+CACHE_FILE_FORMAT = 'dsc'
+
+
+def by_id_opts(f):
+    f = click.option("--no-cache", is_flag=True, help="Don't take records from the local id cache.")(f)
+    f = click.option("--missing-file", type=click.File('w'),
+                     help="File for ids that weren't found.  [default: OUT_FILE.missing with -o, stderr otherwise]")(f)
+    f = click.option("--order", type=click.Choice(['input', 'arrival']), default='input', show_default=True,
+                     help="Output records in the order of ids or as they are received.")(f)
+    f = click.option("--workers", type=click.IntRange(1), default=by_id.DEFAULT_WORKERS, show_default=True,
+                     help="Max number of concurrent requests.")(f)
+    f = click.option("--batch-size", type=click.IntRange(1), default=by_id.DEFAULT_BATCH_SIZE, show_default=True,
+                     help="Ids per worker task.")(f)
+    f = click.option("-i", "--ids-file", type=click.File('r'), default='-', show_default=True,
+                     help="File with ids, one per line ('-' is stdin).")(f)
+    return f
 
 outfile_opt = click.option("-o", "--out-file")
 format_opt = click.option("-f", "--format-file",
-                          type=click.Choice(['json', 'pickle'], case_sensitive=False),
+                          type=click.Choice([*writers.FORMATS, CACHE_FILE_FORMAT, 'pickle'], case_sensitive=False),
                           default=DEFAULT_FILE_FORMAT, show_default=True,
                           help='applicable with "out file" mode only')
 
@@ -54,7 +125,13 @@ def get():
 @cli_command(name='messages', group=get)
 @outfile_opt
 @format_opt
-def get_messages(ctx: CliContext, out_file: Optional[str], format_file: str):
+@shards_opt
+@unordered_opt
+@processes_opt
+@resume_opts
+@fields_opt
+def get_messages(ctx: CliContext, out_file: Optional[str], format_file: str, shards: int, unordered: bool, processes: bool,
+             resume: bool, checkpoint_interval_sec: float, fields: Optional[Projection]):
     """Get messages from DataProvider
 
     By default, messages will be printed to stdout.
@@ -63,13 +140,33 @@ def get_messages(ctx: CliContext, out_file: Optional[str], format_file: str):
     #   Here we don't know what exact class of ds_wrapper we have.
     #   But we will know inside the visitor method.
     ds_wrapper = get_ds_wrapper(ctx)
-    ds_wrapper.accept(Plugin(), rtype="messages", ctx=ctx, out_file=out_file, format_file=format_file)
+    if processes:
+        check_spilled_download(out_file, format_file, resume)
+        checkpoint = None
+    else:
+        checkpoint = start_checkpoint(ctx, "messages", out_file, format_file, resume, checkpoint_interval_sec, fields,
+                                      ordered=not unordered or shards == 1)
+    ds_wrapper.accept(Plugin(), rtype="messages", ctx=ctx, out_file=out_file, format_file=format_file, shards=shards,
+                      unordered=unordered, processes=processes, checkpoint=checkpoint, projection=fields)
 
 
 @cli_command(name='messages-by-id', group=get)
 @outfile_opt
-def get_messages_by_id(ctx: CliContext, out_file: Optional[str]):
-    not_implemented_err()
+@format_opt
+@by_id_opts
+@fields_opt
+def get_messages_by_id(ctx: CliContext, out_file: Optional[str], format_file: str, ids_file: TextIO, batch_size: int,
+                       workers: int, order: str, missing_file: Optional[TextIO], no_cache: bool,
+                       fields: Optional[Projection]):
+    """Get messages by ids from DataProvider
+
+    Found messages are cached locally and aren't requested again.
+    By default, messages will be printed to stdout.
+    """
+    ds_wrapper = get_ds_wrapper(ctx)
+    ds_wrapper.accept(Plugin(), rtype="messages", ctx=ctx, out_file=out_file, format_file=format_file,
+                      ids=by_id.read_ids(ids_file), batch_size=batch_size, workers=workers, order=order,
+                      missing_file=missing_file, use_cache=not no_cache, projection=fields)
 
 
 @cli_command(name='groups', group=get)
@@ -99,7 +196,13 @@ def get_aliases(ctx: CliContext, out_file: Optional[str], format_file: str):
 @cli_command(name='events', group=get)
 @outfile_opt
 @format_opt
-def get_events(ctx: CliContext, out_file: Optional[str], format_file: str):
+@shards_opt
+@unordered_opt
+@processes_opt
+@resume_opts
+@fields_opt
+def get_events(ctx: CliContext, out_file: Optional[str], format_file: str, shards: int, unordered: bool, processes: bool,
+             resume: bool, checkpoint_interval_sec: float, fields: Optional[Projection]):
     """Get events from DataProvider
 
     By default, events will be printed to stdout.
@@ -108,7 +211,14 @@ def get_events(ctx: CliContext, out_file: Optional[str], format_file: str):
     #   Here we don't know what exact class of ds_wrapper we have.
     #   But we will know inside the visitor method.
     ds_wrapper = get_ds_wrapper(ctx)
-    ds_wrapper.accept(Plugin(), rtype="events", ctx=ctx, out_file=out_file, format_file=format_file)
+    if processes:
+        check_spilled_download(out_file, format_file, resume)
+        checkpoint = None
+    else:
+        checkpoint = start_checkpoint(ctx, "events", out_file, format_file, resume, checkpoint_interval_sec, fields,
+                                      ordered=not unordered or shards == 1)
+    ds_wrapper.accept(Plugin(), rtype="events", ctx=ctx, out_file=out_file, format_file=format_file, shards=shards,
+                      unordered=unordered, processes=processes, checkpoint=checkpoint, projection=fields)
 
 
 @cli_command(name='scopes', group=get)
@@ -125,12 +235,41 @@ def get_scopes(ctx: CliContext, out_file: Optional[str], format_file: str):
 
 @cli_command(name='events-by-id', group=get)
 @outfile_opt
-def get_events_by_id(ctx, cfg_path, out_file, verbose, protocol):
-    not_implemented_err()
+@format_opt
+@by_id_opts
+@fields_opt
+def get_events_by_id(ctx: CliContext, out_file: Optional[str], format_file: str, ids_file: TextIO, batch_size: int,
+                     workers: int, order: str, missing_file: Optional[TextIO], no_cache: bool,
+                     fields: Optional[Projection]):
+    """Get events by ids from DataProvider
+
+    Found events are cached locally and aren't requested again.
+    By default, events will be printed to stdout.
+    """
+    ds_wrapper = get_ds_wrapper(ctx)
+    ds_wrapper.accept(Plugin(), rtype="events", ctx=ctx, out_file=out_file, format_file=format_file,
+                      ids=by_id.read_ids(ids_file), batch_size=batch_size, workers=workers, order=order,
+                      missing_file=missing_file, use_cache=not no_cache, projection=fields)
+
+
+EQUIVALENCE_RTYPES = ['books', 'aliases', 'scopes']
+
+
+def get_metadata_cmd_obj(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, rtype: str, ctx: CliContext):
+    if rtype == 'books':
+        return ds_wrapper.get_books_obj(ctx)
+    elif rtype == 'aliases':
+        return ds_wrapper.get_aliases_obj(ctx)
+    elif rtype == 'scopes':
+        return ds_wrapper.get_scopes_obj(ctx)
+    elif rtype == 'groups':
+        return ds_wrapper.get_groups_obj(ctx)
+    raise RuntimeError(f'Unknown Rtype: {rtype}')
+
 
-TEMP_OUTPUT_FILE = './temp_output.txt'
 @cli_command(name='equivalence', group=get, required_cfg=False)
-def get_tests(ctx: CliContext):
+@click.option("--refresh", is_flag=True, help="Don't use books, aliases and scopes from the local metadata store.")
+def get_tests(ctx: CliContext, refresh: bool):
     report = dict[str, object]()
 
     try:
@@ -152,16 +291,18 @@ def get_tests(ctx: CliContext):
         for name, ds_cfg in ctx.cfg.data_sources.items():
             data_sources.append((name, create_ds_wrapper(ctx.cli_registry, ds_cfg)))
 
-        for rtype in ['books', 'aliases', 'scopes']:
+        # All requests are sent concurrently; results not older than the TTL come from the metadata store.
+        requests = {(rtype, name): (ds, get_metadata_cmd_obj(ds, rtype, ctx))
+                    for rtype in EQUIVALENCE_RTYPES
+                    for name, ds in data_sources}
+        values = metadata_store.get_many(requests, refresh=refresh)
+
+        for rtype in EQUIVALENCE_RTYPES:
             results = list[tuple[str, set[str]]]()
-            for name, ds in data_sources:
-                ds.accept(Plugin(), rtype=rtype, ctx=ctx, out_file=TEMP_OUTPUT_FILE, format_file='json')
-                with open(TEMP_OUTPUT_FILE, 'r') as file:
-                    results.append((name, set(line.strip().strip('"') for line in file)))
-                try:
-                    os.remove(TEMP_OUTPUT_FILE)
-                except:
-                    pass
+            for name, _ in data_sources:
+                print(f"Got: {len(values[(rtype, name)])} {rtype} from {name}")
+                results.append((name, set(json.dumps(v, separators=(",", ":")).strip('"')
+                                          for v in values[(rtype, name)])))
 
             sets = iter(results)
             first_ds, first_set = next(sets)
@@ -200,19 +341,23 @@ def common_logic(data: Data,
                  ctx: CliContext,
                  out_file: Optional[str],
                  format_file: str,
-                 rtype: str):
+                 rtype: str,
+                 checkpoint: Optional[DownloadCheckpoint] = None,
+                 projection: Optional[Projection] = None):
 
+    check_out_format(out_file, format_file, rtype)
     show_info(ctx.extra_params, command_class_args, urls=data.metadata["urls"])
+    if projection is not None and checkpoint is None:
+        data = data.map(projection)
 
     start = time.time()
     if out_file:
-        # TODO
-        #   Add jsonl, json.gz, jsonl.gz
-        #   Implement them via Data method
-        if format_file.lower() == 'json':
-            write_data_to_file_json(data, out_file)
-        elif format_file.lower() == 'pickle':
+        if format_file.lower() == 'pickle':
             write_data_to_file_pickle(data, out_file)
+        elif format_file.lower() == CACHE_FILE_FORMAT:
+            write_data_to_file_cache(data, out_file, rtype, ctx.cfg.get_messages_mode)
+        else:
+            write_data_to_file_json(data, out_file, format_file, checkpoint, projection)
 
     else:
         print_data_to_stdout(data)
@@ -222,9 +367,91 @@ def common_logic(data: Data,
     print(f"Got: {data.len} {rtype} in {t} seconds (~{avg_msgs_per_sec} per second)")
 
 
+@http_error_wrapper
+def common_logic_spilled(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses,
+                         ctx: CliContext,
+                         out_file: str,
+                         format_file: str,
+                         rtype: str,
+                         shards: int,
+                         projection: Optional[Projection] = None):
+    writers.check_format(format_file.lower())
+    start = time.time()
+    records, urls, commands = download_to_file(ds_wrapper, ctx, rtype, shards, out_file, format_file, projection)
+    show_info(ctx.extra_params, get_command_class_args(ctx.cfg, type(commands[0])), urls=urls)
+
+    t = time.time() - start
+    avg_msgs_per_sec = records / t if t != 0 else 'n/a'
+    print(f"Got: {records} {rtype} in {t} seconds (~{avg_msgs_per_sec} per second)")
+
+
+def write_missing_ids(missing: list, rtype: str, out_file: Optional[str], missing_file: Optional[TextIO]):
+    """To `--missing-file`, OUT_FILE.missing or stderr."""
+    if missing_file is None and out_file:
+        missing_file = open(out_file + '.missing', 'w')
+    if missing_file is None:
+        click.secho(f"Not found {len(missing)} {rtype}:", fg="yellow", err=True)
+        click.echo("".join(f"{record_id}\n" for record_id in missing), nl=False, err=True)
+        return
+    with missing_file:
+        missing_file.writelines(f"{record_id}\n" for record_id in missing)
+    click.secho(f"Not found {len(missing)} {rtype}, ids are written to '{missing_file.name}'", fg="yellow", err=True)
+
+
+@http_error_wrapper
+def common_logic_by_id(ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses,
+                       ctx: CliContext,
+                       out_file: Optional[str],
+                       format_file: str,
+                       rtype: str,
+                       ids: list,
+                       batch_size: int,
+                       workers: int,
+                       order: str,
+                       missing_file: Optional[TextIO],
+                       use_cache: bool,
+                       projection: Optional[Projection] = None):
+    if out_file and format_file.lower() == 'pickle':
+        raise click.UsageError("pickle format isn't supported for records by ids")
+    check_out_format(out_file, format_file, rtype)
+    id_cache = by_id.IdCache(ctx.cfg.data_sources[ctx.cfg.default_data_source].url) if use_cache else None
+    missing = []
+    stats = {}
+
+    def found_records():
+        for record_id, record in by_id.fetch_by_ids(ds_wrapper, ctx, rtype, ids, batch_size=batch_size,
+                                                    workers=workers, ordered=order == 'input',
+                                                    id_cache=id_cache, stats=stats):
+            if record is None:
+                missing.append(record_id)
+            else:
+                yield record if projection is None else projection(record)
+
+    start = time.time()
+    try:
+        if out_file and format_file.lower() == CACHE_FILE_FORMAT:
+            write_data_to_file_cache(Data(found_records), out_file, rtype, ctx.cfg.get_messages_mode)
+        elif out_file:
+            write_data_to_file_json(Data(found_records), out_file, format_file)
+        else:
+            print_data_to_stdout(found_records())
+    finally:
+        if id_cache is not None:
+            id_cache.close()
+
+    if missing:
+        write_missing_ids(missing, rtype, out_file, missing_file)
+
+    t = time.time() - start
+    found = len(ids) - len(missing)
+    avg_per_sec = found / t if t != 0 else 'n/a'
+    print(f"Got: {found} {rtype} ({stats.get('cached', 0)} from the cache), missing: {len(missing)}, "
+          f"in {t} seconds (~{avg_per_sec} per second)")
+
+
 class Plugin(DSPlugin):
     def version(self) -> str:
-        return '1.1.0'
+        return '1.8.0'
 
     def root(self) -> click.Command:
         """The group or command to attach to ds.py cli."""
@@ -238,7 +465,9 @@ class Plugin(DSPlugin):
 
         if rtype == 'events':
             get_scopes_cmd_obj = ds_wrapper.get_events_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_scopes_cmd_obj)
+            # Sharded output is merged by timestamp (unless --unordered), so it's ordered like a single stream.
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_scopes_cmd_obj, kwargs.get('shards'),
+                               ordered=not kwargs.get('unordered'))
             command_class_args = get_command_class_args(ctx.cfg, type(get_scopes_cmd_obj))
 
         elif rtype == 'scopes':
@@ -254,7 +483,8 @@ class Plugin(DSPlugin):
 
         elif rtype == 'messages':
             get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_messages_cmd_obj, kwargs.get('shards'),
+                               ordered=not kwargs.get('unordered'))
             command_class_args = get_command_class_args(ctx.cfg,
                                                         type(
                                                             get_messages_cmd_obj))
@@ -290,20 +520,28 @@ class Plugin(DSPlugin):
                     ctx=ctx,
                     out_file=out_file,
                     format_file=format_file,
-                    rtype=rtype)
+                    rtype=rtype,
+                    checkpoint=kwargs.get('checkpoint'),
+                    projection=kwargs.get('projection'))
+
+    def _common(self, ds_wrapper: ds_w.CommonLogicForLwdpRelatedClasses, **kwargs):
+        if 'ids' in kwargs:
+            common_logic_by_id(ds_wrapper, **kwargs)
+        elif kwargs.get('processes'):
+            common_logic_spilled(ds_wrapper, ctx=kwargs['ctx'], out_file=kwargs['out_file'],
+                                 format_file=kwargs['format_file'], rtype=kwargs['rtype'], shards=kwargs['shards'],
+                                 projection=kwargs.get('projection'))
+        else:
+            common_logic(**self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs))
 
     def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
-        cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        common_logic(**cl_kw)
+        self._common(ds_wrapper, **kwargs)
 
     def visit_rpt5_http_data_source(self, ds_wrapper: ds_w.Rpt5HttpDataSource, **kwargs):
-        cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        common_logic(**cl_kw)
+        self._common(ds_wrapper, **kwargs)
 
     def visit_lwdp2_http_data_source(self, ds_wrapper: ds_w.Lwdp2HttpDataSource, **kwargs):
-        cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        common_logic(**cl_kw)
+        self._common(ds_wrapper, **kwargs)
 
     def visit_lwdp3_http_data_source(self, ds_wrapper: ds_w.Lwdp3HttpDataSource, **kwargs):
-        cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
-        common_logic(**cl_kw)
+        self._common(ds_wrapper, **kwargs)
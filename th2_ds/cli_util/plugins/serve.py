@@ -0,0 +1,66 @@
+from typing import Tuple
+import click
+
+from th2_ds.cli_util import daemon
+from th2_ds.cli_util.config import enable_cfg_cache, get_cfg
+from th2_ds.cli_util.context import create_cli_registry
+from th2_ds.cli_util.env import verify_ds_impl
+from th2_ds.cli_util.interfaces.plugin import DSPlugin
+from th2_ds.cli_util.utils import enable_ds_wrappers_cache, create_ds_wrapper
+
+
+def _load_all_commands(ctx: click.Context, group: click.MultiCommand):
+    for name in group.list_commands(ctx):
+        cmd = group.get_command(ctx, name)
+        if isinstance(cmd, click.MultiCommand):
+            _load_all_commands(ctx, cmd)
+
+
+def _warm_up_cfg(cfg_path: str):
+    cfg = get_cfg(cfg_path, {})
+    verify_ds_impl(cfg.data_sources[cfg.default_data_source].ds_impl)
+    cli_registry = create_cli_registry()
+    for name, ds_cfg in cfg.data_sources.items():
+        try:
+            create_ds_wrapper(cli_registry, ds_cfg)
+            click.secho(f"[ds serve] Data source '{name}' is connected", fg='green')
+        except Exception as e:
+            # Commands will try to connect again by themselves.
+            click.secho(f"[ds serve] Cannot connect to data source '{name}': {e}", fg='yellow')
+
+
+@click.command()
+@click.option("-c", "--cfg-path", "cfg_paths", multiple=True,
+              help="Config to parse and whose data sources to connect to in advance. Can be repeated.")
+@click.option("-s", "--socket-path", default=daemon.DEFAULT_SOCKET_PATH, show_default=True)
+@click.pass_context
+def serve(ctx: click.Context, cfg_paths: Tuple[str], socket_path: str):
+    """Run ds commands in a long-lived daemon
+
+    The daemon imports all plugins, parses configs and connects to data
+    sources once, then runs every command received over the Unix socket in
+    its own forked process. See `run_batch_testing.py` (DS_SERVE=1).
+    """
+    root_ctx = ctx.find_root()
+    root: click.MultiCommand = root_ctx.command
+    _load_all_commands(root_ctx, root)
+
+    enable_cfg_cache()
+    enable_ds_wrappers_cache()
+    for cfg_path in cfg_paths:
+        _warm_up_cfg(cfg_path)
+
+    def run_cli(args):
+        root.main(args=args, prog_name='ds.py')
+
+    daemon.serve(run_cli, socket_path)
+
+
+class Plugin(DSPlugin):
+    def version(self) -> str:
+        return '1.0.0'
+
+    def root(self) -> click.Command:
+        """The group or command to attach to ds.py cli."""
+        return serve
+
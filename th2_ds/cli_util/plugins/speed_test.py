@@ -1,17 +1,53 @@
-import json
+import statistics
 import time
+from itertools import islice
+from time import perf_counter
+from typing import Optional
+
 import click
+from prettytable import PrettyTable
 
 from th2_data_services.data import Data
 
+from th2_ds.cli_util import bench_stats
+from th2_ds.cli_util.config import DATA_SOURCE_CONFIG_PATH
 from th2_ds.cli_util.utils import show_info, get_command_class_args, get_ds_wrapper, generate_and_save_report, \
-    get_exception_info
+    get_exception_info, create_ds_wrapper
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
+from th2_ds.cli_util.pipeline_metrics import get_pipeline_metrics
+from th2_ds.cli_util.recording import ResponseRecorder
+from th2_ds.cli_util.sharded_fetch import shards_opt, fetch
+from th2_ds.cli_util.stage_timing import mark_consumer
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 
 repetitions_opt = click.option("-n", "--repetitions", default=1, show_default=True)
+untimed_stats_opt = click.option("--untimed-stats", is_flag=True,
+                                 help="Exclude time of the stats collection from the timed window.")
+# Records per timed stats measurement of --untimed-stats.
+UNTIMED_STATS_CHUNK = 1024
+
+record_opt = click.option("--record", "record_dir", type=click.Path(file_okay=False),
+                          help="Save raw HTTP response bodies to the directory, to replay them later by "
+                               "ReplayHttpDataSource. Times of the recorded run include disk writes.")
+
+DEFAULT_MAX_REPETITIONS = 30
+DEFAULT_SWEEP_CHUNK_LENGTHS = (4096, 16384, 65536, 262144, 1048576)
+
+
+def benchmark_opts(f):
+    """Options of the benchmarking mode, see `_speed_test`."""
+    f = click.option("--max-repetitions", type=click.IntRange(1), default=DEFAULT_MAX_REPETITIONS, show_default=True,
+                     help="Limit of repetitions in the adaptive mode (--target-ci).")(f)
+    f = click.option("--target-ci", type=click.FloatRange(0, min_open=True),
+                     help="Repeat until the CI half-width of the median throughput is within this fraction "
+                          "of the median, e.g. 0.05. -n is the minimum number of repetitions then.")(f)
+    f = click.option("--reject-outliers", is_flag=True,
+                     help="Exclude outliers (by the median absolute deviation) from the benchmark summary.")(f)
+    f = click.option("--warmup", type=click.IntRange(0), default=0, show_default=True,
+                     help="Number of untimed warm-up repetitions.")(f)
+    return f
 
 
 def _speed_test(
@@ -21,56 +57,154 @@ def _speed_test(
         data: Data,
         urls: list[str],
         command_class_args: dict[str, object],
-        show_info_flag=True
+        show_info_flag=True,
+        untimed_stats=False,
+        warmup: int = 0,
+        reject_outliers: bool = False,
+        target_ci: Optional[float] = None,
+        max_repetitions: int = DEFAULT_MAX_REPETITIONS,
 ):
-    # TODO - build in a check that the same amount of data is received each time
-    # TODO - add average data size to output
-
+    """Iterates the data `repetitions` times and measures throughput.
+
+    Stats (items count, average size, attached items) are collected in the first
+    repetition, there is no extra pass over the data. The average size is
+    estimated by bytes of SSE event data counted on the stream by PipelineMetrics,
+    so records aren't serialized again.
+
+    Throughput of the timed repetitions is summarized by `bench_stats.summarize`
+    (median, p5/p95, stddev, bootstrap CI of the median) into results["benchmark"].
+
+    Args:
+        untimed_stats: Exclude time of the stats collection from the timed window
+            of the first repetition.
+        warmup: Number of repetitions before the timed ones. They are checked
+            for the number of data, but their time isn't used.
+        reject_outliers: Exclude outliers (by the median absolute deviation)
+            from the benchmark summary.
+        target_ci: Adaptive mode. Repeat until the relative half-width of the CI
+            of the median is not greater than target_ci (but at least
+            `repetitions` and at most `max_repetitions` times).
+        max_repetitions: Limit of timed repetitions in the adaptive mode.
+    """
     received_msgs = []
+    warmup_received_msgs = []
+    received_bytes = []
     times = []
     throughput_values: list[float] = []
     th2_2638 = False
     avg_per_second = None
     items_count, average_size, avg_attached_items = None, None, None
+    stats_time = 0.0
+    benchmark = None
     results = {}
     exit_code = 0
 
+    attached_field_name = "attachedEventIds" if rtype == "messages" else "attachedMessageIds"
+    metrics = get_pipeline_metrics(data)
+    timed_data = mark_consumer(data)
+
+    def run_repetition(collect_stats: bool):
+        nonlocal avg_attached_items, stats_time
+        decoded_bytes_before = metrics.decoded_bytes if metrics else None
+        start = time.time()
+        len_ = 0
+        if collect_stats:
+            attached_items_sum = 0
+            if untimed_stats:
+                # Stats are collected per chunk of records, so the timer isn't read for every record.
+                records = iter(timed_data)
+                while True:
+                    chunk = list(islice(records, UNTIMED_STATS_CHUNK))
+                    if not chunk:
+                        break
+                    len_ += len(chunk)
+                    stats_start = perf_counter()
+                    for msg in chunk:
+                        attached_items = msg.get(attached_field_name)
+                        if attached_items:
+                            attached_items_sum += len(attached_items)
+                    stats_time += perf_counter() - stats_start
+            else:
+                for msg in timed_data:
+                    len_ += 1
+                    attached_items = msg.get(attached_field_name)
+                    if attached_items:
+                        attached_items_sum += len(attached_items)
+            avg_attached_items = attached_items_sum / len_ if len_ else 0
+        else:
+            for _ in timed_data:
+                len_ += 1
+
+        t = time.time() - start
+        if collect_stats and untimed_stats:
+            t -= stats_time
+        if decoded_bytes_before is not None:
+            received_bytes.append(metrics.decoded_bytes - decoded_bytes_before)
+        return len_, t
+
+    def need_more_repetitions() -> bool:
+        nonlocal benchmark
+        done = len(times)
+        if done < repetitions:
+            return True
+        if target_ci is None or done >= max_repetitions:
+            return False
+        benchmark = _benchmark_summary(throughput_values, reject_outliers)
+        rel_width = benchmark.get("ci_rel_half_width")
+        return rel_width is None or rel_width > target_ci
+
     try:
-        for i in range(repetitions):
-            if i == 0 and show_info_flag:
-                show_info(ctx.extra_params, command_class_args, urls=urls)
+        if show_info_flag:
+            show_info(ctx.extra_params, command_class_args, urls=urls)
 
-            start = time.time()
-            len_ = 0
-            for _ in data:
-                len_ += 1
+        for i in range(warmup):
+            len_, t = run_repetition(collect_stats=i == 0)
+            warmup_received_msgs.append(len_)
+            if ctx.verbose_level > 0:
+                print(f"Got: {len_} {rtype} in {t:.3f} seconds (~{len_ / t:.3f} per second), warm-up: {i + 1}")
 
-            t = time.time() - start
+        while need_more_repetitions():
+            len_, t = run_repetition(collect_stats=not warmup and not times)
             received_msgs.append(len_)
             times.append(t)
             throughput_values.append(len_/t)
             if ctx.verbose_level > 0:
-                print(f"Got: {len_} {rtype} in {t:.3f} seconds (~{len_ / t:.3f} per second), loop: {i + 1}")
+                print(f"Got: {len_} {rtype} in {t:.3f} seconds (~{len_ / t:.3f} per second), loop: {len(times)}")
 
-        items_count, average_size, avg_attached_items = count_msg_stats(data, rtype)
+        items_count = (warmup_received_msgs or received_msgs)[0]
+        if received_bytes:
+            average_size = received_bytes[0] / items_count if items_count else 0
+        benchmark = _benchmark_summary(throughput_values, reject_outliers)
+        if target_ci is not None:
+            rel_width = benchmark.get("ci_rel_half_width")
+            benchmark["target_ci_reached"] = rel_width is not None and rel_width <= target_ci
 
         # Additional checks
         # [1] Check that user gets the same number of data each time (TH2-2638).
-        if len(set(received_msgs)) != 1:
-            click.secho(f"Got a different number of data each time (TH2-2638) - {received_msgs}", bg="red")
+        if len(set(warmup_received_msgs + received_msgs)) != 1:
+            click.secho(f"Got a different number of data each time (TH2-2638) - "
+                        f"{warmup_received_msgs + received_msgs}", bg="red")
             th2_2638 = True
 
         # ----------------
         if ctx.verbose_level == 0:
             msgs_got = received_msgs[0] if not th2_2638 else received_msgs
-            seconds = sum(times) / repetitions
+            seconds = sum(times) / len(times)
 
             avg_per_second = 0
             for idx in range(len(received_msgs)):
                 avg_per_second += received_msgs[idx] / times[idx]
 
-            avg_per_second /= repetitions
-            print(f"Got: {msgs_got} {rtype} in ~{seconds:.3f} seconds (AVG) (~{avg_per_second:.3f} per second), repetitions: {repetitions}. Average message size: {average_size}")
+            avg_per_second /= len(times)
+            print(f"Got: {msgs_got} {rtype} in ~{seconds:.3f} seconds (AVG) (~{avg_per_second:.3f} per second), repetitions: {len(times)}. Average message size: {average_size}")
+
+        if len(times) > 1:
+            print(f"Throughput, {rtype}/s: median {benchmark['median']}, p5 {benchmark['p5']}, p95 {benchmark['p95']}, "
+                  f"stddev {benchmark['stddev']}, {benchmark['confidence']:.0%} CI "
+                  f"[{benchmark['ci_low']}, {benchmark['ci_high']}]"
+                  + (f", outliers rejected: {len(benchmark['rejected'])}" if benchmark.get('rejected') else ""))
+        if target_ci is not None and not benchmark["target_ci_reached"]:
+            click.secho(f"The CI is still wider than ±{target_ci:.1%} after {len(times)} repetitions", fg="yellow")
 
     except Exception as e:
         results["exception"] = get_exception_info(e)
@@ -79,20 +213,33 @@ def _speed_test(
     test_params = {
         "repetitions": repetitions,
         "rtype": rtype,
+        "untimed_stats": untimed_stats,
+        "warmup": warmup,
+        "reject_outliers": reject_outliers,
+        "target_ci": target_ci,
+        "max_repetitions": max_repetitions if target_ci is not None else None,
     }
 
-    attached_field_name = "avg_attached_events" if rtype == "messages" else "avg_attached_msgs"
+    attached_result_name = "avg_attached_events" if rtype == "messages" else "avg_attached_msgs"
 
     results["th2_2638"] = th2_2638
     results["items_count"] = items_count
-    results["average_size_bytes"] = round(average_size, 1)
-    results[attached_field_name] = round(avg_attached_items, 2)
+    results["average_size_bytes"] = round(average_size, 1) if average_size is not None else None
+    results[attached_result_name] = round(avg_attached_items, 2) if avg_attached_items is not None else None
     results["received_msgs"] = received_msgs
+    if warmup_received_msgs:
+        results["warmup_received_msgs"] = warmup_received_msgs
+    if received_bytes:
+        results["received_bytes"] = received_bytes
+    if untimed_stats:
+        results["stats_time_sec"] = round(stats_time, 4)
     results["times_sec"] = [round(num, 4) for num in times]
     results[f"throughput_values_{rtype}_per_sec"] = [round(num, 1) for num in throughput_values]
 
     if avg_per_second:
         results[f"avg_throughput_{rtype}_per_sec"] = round(avg_per_second, 1)
+    if benchmark is not None:
+        results[f"benchmark_throughput_{rtype}_per_sec"] = benchmark
 
     generate_and_save_report(ctx=ctx, data=data, command_class_args=command_class_args, test_params=test_params, results=results)
 
@@ -100,29 +247,12 @@ def _speed_test(
         exit(exit_code)
 
 
-def count_msg_stats(data: Data, rtype: str) -> tuple[int, float, float]:
-    size_sum = 0
-    count = 0
-    attached_items_sum = 0
-
-    attached_field_name = None
-    if rtype == "messages":
-        attached_field_name = "attachedEventIds"
-    elif rtype == "events":
-        attached_field_name = "attachedMessageIds"
-
-    for msg in data:
-        count += 1
-        json_string = json.dumps(msg)
-        size_sum += len(json_string)
-        if attached_field_name:
-            attached_items = msg.get(attached_field_name)
-            if attached_items:
-                attached_items_sum += len(attached_items)
-
-    average_size = size_sum / count if count != 0 else 0
-    average_attached = attached_items_sum / count if count != 0 else 0
-    return count, average_size, average_attached
+def _benchmark_summary(throughput_values: list[float], reject_outliers: bool) -> dict:
+    values, rejected = bench_stats.reject_outliers(throughput_values) if reject_outliers else (throughput_values, [])
+    summary = bench_stats.summarize(values)
+    if reject_outliers:
+        summary["rejected"] = [round(v, 1) for v in rejected]
+    return summary
 
 
 @click.group()
@@ -132,27 +262,188 @@ def speed_test():
 
 @cli_command(group=speed_test, name="messages")
 @repetitions_opt
+@untimed_stats_opt
+@benchmark_opts
+@shards_opt
+@record_opt
 @http_error_wrapper
-def speed_test_messages(ctx: CliContext, repetitions):
+def speed_test_messages(ctx: CliContext, repetitions, untimed_stats, shards, record_dir, **benchmark_kwargs):
+    if record_dir and shards > 1:
+        raise click.UsageError("--record can't be used with --shards")
     data_source = get_ds_wrapper(ctx)
-    data_source.accept(Plugin(), repetitions=repetitions, rtype="messages", ctx=ctx)
+    data_source.accept(Plugin(), repetitions=repetitions, rtype="messages", ctx=ctx, untimed_stats=untimed_stats,
+                       benchmark_kwargs=benchmark_kwargs, shards=shards, record_dir=record_dir)
 
 
 @cli_command(group=speed_test, name="events")
 @repetitions_opt
+@untimed_stats_opt
+@benchmark_opts
+@shards_opt
+@record_opt
 @http_error_wrapper
-def speed_test_events(ctx: CliContext, repetitions):
+def speed_test_events(ctx: CliContext, repetitions, untimed_stats, shards, record_dir, **benchmark_kwargs):
+    if record_dir and shards > 1:
+        raise click.UsageError("--record can't be used with --shards")
     data_source = get_ds_wrapper(ctx)
-    data_source.accept(Plugin(), repetitions=repetitions, rtype="events", ctx=ctx)
+    data_source.accept(Plugin(), repetitions=repetitions, rtype="events", ctx=ctx, untimed_stats=untimed_stats,
+                       benchmark_kwargs=benchmark_kwargs, shards=shards, record_dir=record_dir)
+
+
+@cli_command(group=speed_test, name="sweep")
+@click.argument("rtype", type=click.Choice(["messages", "events"]))
+@click.option("--chunk-lengths", default=",".join(map(str, DEFAULT_SWEEP_CHUNK_LENGTHS)), show_default=True,
+              help="Comma separated grid of chunk_length values.")
+@click.option("-n", "--repetitions", type=click.IntRange(1), default=3, show_default=True,
+              help="Repetitions per chunk_length.")
+@click.option("--data-source", "data_source_names", multiple=True,
+              help="Data source from data_sources.yaml to sweep. Can be repeated. [default: default_data_source]")
+@click.option("--apply", is_flag=True, help=f"Write recommended values to {DATA_SOURCE_CONFIG_PATH}.")
+@http_error_wrapper
+def speed_test_sweep(ctx: CliContext, rtype, chunk_lengths, repetitions, data_source_names, apply):
+    """Run the same range across a grid of chunk_length values.
 
+    Repetitions of different values are interleaved, so a drift of the provider
+    load affects all of them equally.
+    """
+    try:
+        grid = sorted({int(v) for v in chunk_lengths.split(",") if v.strip()})
+    except ValueError:
+        raise click.BadParameter(f"must be comma separated integers: {chunk_lengths}", param_hint="--chunk-lengths")
+    data_source_names = data_source_names or (ctx.cfg.default_data_source,)
 
-def common_logic(data: Data, command_class_args: dict, ctx: CliContext, repetitions: int, rtype: str):
-    _speed_test(ctx, repetitions, rtype, data, data.metadata["urls"], command_class_args)
+    results = {}
+    for ds_name in data_source_names:
+        if ds_name not in ctx.cfg.data_sources:
+            raise click.BadParameter(f"unknown data source: {ds_name}", param_hint="--data-source")
+        results[ds_name] = _sweep_data_source(ctx, ds_name, rtype, grid, repetitions)
+        recommended = results[ds_name]["recommended_chunk_length"]
+        current = ctx.cfg.data_sources[ds_name].chunk_length
+        click.secho(f"[{ds_name}] recommended chunk_length: {recommended} (current: {current})", fg="green")
+        if apply and recommended != current and _set_chunk_length(DATA_SOURCE_CONFIG_PATH, ds_name, recommended):
+            click.echo(f"[{ds_name}] chunk_length is updated in {DATA_SOURCE_CONFIG_PATH}")
+
+    test_params = {"rtype": rtype, "chunk_lengths": grid, "repetitions": repetitions}
+    generate_and_save_report(ctx=ctx, test_params=test_params, results=results)
+
+
+def _sweep_data_source(ctx: CliContext, ds_name: str, rtype: str, grid: list[int], repetitions: int) -> dict:
+    ds_cfg = ctx.cfg.data_sources[ds_name]
+    datas = {}
+    for chunk_length in grid:
+        ds_wrapper = create_ds_wrapper(ctx.cli_registry, ds_cfg.copy(update={"chunk_length": chunk_length}))
+        datas[chunk_length] = Plugin()._get_common_lwdp_objects_for_common_logic(
+            ds_wrapper, ctx=ctx, rtype=rtype, repetitions=repetitions)["data"]
+
+    samples = {chunk_length: [] for chunk_length in grid}  # [(records, wall_sec, cpu_sec)]
+    for i in range(repetitions):
+        for chunk_length, data in datas.items():
+            start_wall, start_cpu = perf_counter(), time.process_time()
+            records = 0
+            for _ in data:
+                records += 1
+            wall, cpu = perf_counter() - start_wall, time.process_time() - start_cpu
+            samples[chunk_length].append((records, wall, cpu))
+            if ctx.verbose_level > 0:
+                print(f"[{ds_name}] chunk_length: {chunk_length}, got: {records} {rtype} in {wall:.3f} seconds "
+                      f"(~{records / wall:.1f} per second), CPU: {cpu:.3f} seconds, loop: {i + 1}")
+
+    table = PrettyTable(["chunk_length", f"median {rtype}/s", "95% CI", "CPU, ms per 1k records", "records"])
+    settings = {}
+    for chunk_length, runs in samples.items():
+        metrics = get_pipeline_metrics(datas[chunk_length])
+        throughput = [records / wall for records, wall, _ in runs]
+        cpu_per_1k = [cpu / records * 1000 * 1000 if records else 0.0 for records, _, cpu in runs]
+        summary = bench_stats.summarize(throughput)
+        settings[chunk_length] = dict(
+            throughput_per_sec=summary,
+            cpu_time_sec=[round(cpu, 4) for _, _, cpu in runs],
+            cpu_ms_per_1k_records=round(statistics.median(cpu_per_1k), 3),
+            received_msgs=[records for records, _, _ in runs],
+            wire_bytes_per_repetition=metrics.wire_bytes // repetitions if metrics else None,
+        )
+        table.add_row([chunk_length, summary["median"], f"[{summary['ci_low']}, {summary['ci_high']}]",
+                       settings[chunk_length]["cpu_ms_per_1k_records"], settings[chunk_length]["received_msgs"]])
+    print(f"[{ds_name}]")
+    print(table)
+
+    received = {n for runs in samples.values() for n, _, _ in runs}
+    if len(received) != 1:
+        click.secho(f"[{ds_name}] Got a different number of data each time (TH2-2638) - {sorted(received)}", bg="red")
+
+    return dict(settings=settings, th2_2638=len(received) != 1,
+                recommended_chunk_length=_recommend_chunk_length(settings))
+
+
+def _recommend_chunk_length(settings: dict) -> int:
+    """The value with the best median throughput.
+
+    Values whose median is inside the CI of the best one are indistinguishable
+    by throughput, so the one that costs the client less CPU is taken among them.
+    """
+    best = max(settings, key=lambda cl: settings[cl]["throughput_per_sec"]["median"])
+    ci_low = settings[best]["throughput_per_sec"]["ci_low"]
+    if ci_low is None:
+        return best
+    candidates = [cl for cl in settings if settings[cl]["throughput_per_sec"]["median"] >= ci_low]
+    return min(candidates, key=lambda cl: (settings[cl]["cpu_ms_per_1k_records"], -cl))
+
+
+def _set_chunk_length(path: str, ds_name: str, chunk_length: int) -> bool:
+    """Updates chunk_length of the data source in the yaml file in place, keeping its formatting.
+
+    Returns True if the file is changed.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    original = list(lines)
+
+    ds_line_idx, ds_indent = None, None
+    for idx, line in enumerate(lines):
+        if line.strip() == f"{ds_name}:":
+            ds_line_idx, ds_indent = idx, len(line) - len(line.lstrip())
+            break
+    if ds_line_idx is None:
+        raise ValueError(f"Data source '{ds_name}' isn't found in {path}")
+
+    # chunk_length is inserted after `url:` or right after the header -- before the next block anyway.
+    insert_idx, field_indent, found = ds_line_idx + 1, None, False
+    for idx in range(ds_line_idx + 1, len(lines)):
+        line = lines[idx]
+        if not line.strip():
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indent <= ds_indent:
+            break  # The next block.
+        if field_indent is None:
+            field_indent = indent
+        if indent == field_indent:
+            if line.lstrip().startswith("chunk_length:"):
+                lines[idx] = f"{' ' * indent}chunk_length: {chunk_length}\n"
+                found = True
+                break
+            if line.lstrip().startswith("url:"):
+                insert_idx = idx + 1
+    if not found:
+        field_indent = field_indent if field_indent is not None else ds_indent + 2
+        lines.insert(insert_idx, f"{' ' * field_indent}chunk_length: {chunk_length}\n")
+
+    if lines == original:
+        return False
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return True
+
+
+def common_logic(data: Data, command_class_args: dict, ctx: CliContext, repetitions: int, rtype: str,
+                 untimed_stats: bool = False, benchmark_kwargs: Optional[dict] = None):
+    _speed_test(ctx, repetitions, rtype, data, data.metadata["urls"], command_class_args,
+                untimed_stats=untimed_stats, **(benchmark_kwargs or {}))
 
 
 class Plugin(DSPlugin):
     def version(self) -> str:
-        return '1.1.0'
+        return '1.6.0'
 
     def root(self) -> click.Command:
         """The group or command to attach to ds.py cli."""
@@ -162,21 +453,28 @@ class Plugin(DSPlugin):
         ctx = kwargs['ctx']
         rtype = kwargs['rtype']
         repetitions = kwargs['repetitions']
+        record_dir = kwargs.get('record_dir')
+        recorder = ResponseRecorder(record_dir, ds_wrapper.ds_impl.url) if record_dir else None
 
         if rtype == 'events':
             get_events_cmd_obj = ds_wrapper.get_events_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_events_cmd_obj)
+            if recorder:
+                recorder.attach_command(get_events_cmd_obj)
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_events_cmd_obj, kwargs.get('shards'))
             command_class_args = get_command_class_args(ctx.cfg, type(get_events_cmd_obj))
 
         elif rtype == 'messages':
             get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+            if recorder:
+                recorder.attach_command(get_messages_cmd_obj)
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_messages_cmd_obj, kwargs.get('shards'))
             command_class_args = get_command_class_args(ctx.cfg, type(get_messages_cmd_obj))
 
         else:
             raise RuntimeError(f'Unknown Rtype: {rtype}')
 
-        return dict(data=data, command_class_args=command_class_args, ctx=ctx, repetitions=repetitions, rtype=rtype)
+        return dict(data=data, command_class_args=command_class_args, ctx=ctx, repetitions=repetitions, rtype=rtype,
+                    untimed_stats=kwargs.get('untimed_stats', False), benchmark_kwargs=kwargs.get('benchmark_kwargs'))
 
     def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
         cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
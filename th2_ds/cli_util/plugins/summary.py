@@ -1,29 +1,25 @@
-import json
-from typing import Union, List
+from typing import Union, List, Optional
 import click
 
 from th2_data_services.data import Data
+from th2_ds.cli_util import writers
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.decorators import http_error_wrapper, cli_command
 from th2_ds.cli_util.impl import data_source_wrapper as ds_w
 from th2_ds.cli_util.interfaces.plugin import DSPlugin
-from th2_ds.cli_util.utils import counter, reset_counter, setup_counter, show_info, \
-    get_command_class_args, data_counter, get_ds_wrapper
+from th2_ds.cli_util.projection import Projection, compile_getter, fields_opt
+from th2_ds.cli_util.sharded_fetch import shards_opt, fetch
+from th2_ds.cli_util.utils import show_info, get_command_class_args, data_counter, get_ds_wrapper
 from th2_ds.utils.summary import Metric, get_all_metric_combinations, SummaryCalculator, get_message_type
 
 
 def write_data_to_file(data, out_file):
-    with open(out_file, "w") as f:
-        setup_counter()
-        data = data.map(counter)
-        for m in data:
-            print(json.dumps(m, separators=(",", ":")), file=f)
-        reset_counter()
+    with data_counter(data) as data_:
+        writers.write_file(data_, out_file, 'json')
 
 
 def print_data_to_stdout(data):
-    for m in data:
-        print(json.dumps(m, separators=(",", ":")))
+    writers.print_lines(data)
 
 
 """
@@ -99,12 +95,19 @@ def summary():
     """
 
 
+def fields_metrics(fields: Projection) -> List[Metric]:
+    return [Metric(path, compile_getter(path)) for path in fields.paths]
+
+
 @cli_command(name='messages', group=summary)
+@shards_opt
+@fields_opt
 @http_error_wrapper
-def messages(ctx: CliContext):
+def messages(ctx: CliContext, shards: int, fields: Optional[Projection]):
     """Get messages from DataProvider
 
     By default, messages will be printed to stdout.
+    With --fields the summary is by values of these fields instead of session, direction and message type.
     """
 
     direction_m = Metric('direction', lambda m: m['direction'])
@@ -115,29 +118,35 @@ def messages(ctx: CliContext):
         direction_m,
         session_m,
         message_type_m,
-    ]
+    ] if fields is None else fields_metrics(fields)
 
     all_metrics_combinations = get_all_metric_combinations(metrics_list)
 
     data_source = get_ds_wrapper(ctx)
-    sc = data_source.accept(Plugin(), rtype="messages", ctx=ctx, metrics=metrics_list, combinations=all_metrics_combinations)
+    sc = data_source.accept(Plugin(), rtype="messages", ctx=ctx, metrics=metrics_list, combinations=all_metrics_combinations,
+                            shards=shards, projection=fields)
     sc.show()
 
 
 @cli_command(name='events', group=summary)
-def events(ctx: CliContext):
+@shards_opt
+@fields_opt
+def events(ctx: CliContext, shards: int, fields: Optional[Projection]):
     """..
+
+    With --fields the summary is by values of these fields instead of type and status.
     """
 
     metrics_list = [
         Metric('type', lambda m: m['eventType']),
         Metric('successful', lambda m: m['successful']),
-    ]
+    ] if fields is None else fields_metrics(fields)
 
     all_metrics_combinations = get_all_metric_combinations(metrics_list)
 
     data_source = get_ds_wrapper(ctx)
-    sc = data_source.accept(Plugin(), rtype="events", ctx=ctx, metrics=metrics_list, combinations=all_metrics_combinations)
+    sc = data_source.accept(Plugin(), rtype="events", ctx=ctx, metrics=metrics_list, combinations=all_metrics_combinations,
+                            shards=shards, projection=fields)
     sc.show()
 
 
@@ -146,8 +155,11 @@ def common_logic(data: Data,
                  command_class_args: dict,
                  ctx: CliContext,
                  metrics: Union[List[str], List[Metric]],
-                 combinations: list):
+                 combinations: list,
+                 projection: Optional[Projection] = None):
     show_info(ctx.extra_params, command_class_args, urls=data.metadata["urls"])
+    if projection is not None:
+        data = data.map(projection)
 
     sc = SummaryCalculator(metrics, combinations)
 
@@ -160,7 +172,7 @@ def common_logic(data: Data,
 
 class Plugin(DSPlugin):
     def version(self) -> str:
-        return '0.1.0'
+        return '0.3.0'
 
     def root(self) -> click.Command:
         """The group or command to attach to ds.py cli."""
@@ -175,18 +187,19 @@ class Plugin(DSPlugin):
 
         if rtype == 'events':
             get_events_cmd_obj = ds_wrapper.get_events_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_events_cmd_obj)
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_events_cmd_obj, kwargs.get('shards'))
             command_class_args = get_command_class_args(ctx.cfg, type(get_events_cmd_obj))
 
         elif rtype == 'messages':
             get_messages_cmd_obj = ds_wrapper.get_messages_obj(ctx)
-            data: Data = ds_wrapper.ds_impl.command(get_messages_cmd_obj)
+            data: Data = fetch(ds_wrapper, ctx, rtype, get_messages_cmd_obj, kwargs.get('shards'))
             command_class_args = get_command_class_args(ctx.cfg, type(get_messages_cmd_obj))
 
         else:
             raise RuntimeError(f'Unknown Rtype: {rtype}')
 
-        return dict(data=data, command_class_args=command_class_args, ctx=ctx, metrics=metrics, combinations=combinations)
+        return dict(data=data, command_class_args=command_class_args, ctx=ctx, metrics=metrics, combinations=combinations,
+                    projection=kwargs.get('projection'))
 
     def visit_lwdp1_http_data_source(self, ds_wrapper: ds_w.Lwdp1HttpDataSource, **kwargs):
         cl_kw = self._get_common_lwdp_objects_for_common_logic(ds_wrapper, **kwargs)
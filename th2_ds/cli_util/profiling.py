@@ -0,0 +1,152 @@
+"""`--profile=cpu|mem|both` for every cli_command.
+
+cpu  -- a sampling profiler: stacks of all threads are sampled every
+        SAMPLE_INTERVAL_SEC and written in the collapsed-stack format
+        (`frame;frame;frame count`), which flamegraph.pl and speedscope read.
+        Sampling doesn't slow the command down the way cProfile does, so
+        throughput numbers of the profiled run stay meaningful.
+mem  -- tracemalloc: top-N allocation sites table and collapsed stacks of
+        memory that is still allocated at the end of the command, plus the
+        peak. tracemalloc makes every allocation several times slower, so
+        throughput numbers of `mem` runs are not comparable with normal ones.
+
+Files are written next to the report file (or to the working directory if
+there is no report):
+    <report>.cpu.collapsed
+    <report>.mem.txt
+    <report>.mem.collapsed
+"""
+from __future__ import annotations
+import collections
+import contextlib
+import datetime
+import functools
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Dict, Optional
+
+import click
+
+SAMPLE_INTERVAL_SEC = 0.005
+TRACEMALLOC_FRAMES = 16
+TOP_N = 30
+
+profile_opt = click.option("--profile", type=click.Choice(['cpu', 'mem', 'both'], case_sensitive=False),
+                           help="Profile the command. Results are written next to the report file.")
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    idx = filename.rfind('site-packages' + os.sep)
+    if idx != -1:
+        filename = filename[idx + len('site-packages' + os.sep):]
+    else:
+        filename = os.path.relpath(filename) if os.path.isabs(filename) else filename
+    # ';' separates frames in the collapsed format.
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    def __init__(self, interval_sec: float = SAMPLE_INTERVAL_SEC):
+        self._interval_sec = interval_sec
+        self._stacks: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval_sec):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ds-sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def _write_mem_results(snapshot: tracemalloc.Snapshot, table_path: str, collapsed_path: str):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+    current, peak = tracemalloc.get_traced_memory()
+    stats = snapshot.statistics('lineno')
+    with open(table_path, 'w', encoding='utf-8') as f:
+        f.write(f"Allocated at the end: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+        f.write(f"Top {TOP_N} allocation sites\n")
+        f.write(f"{'#':>3} {'Size, KiB':>12} {'Count':>10}  Location\n")
+        for idx, stat in enumerate(stats[:TOP_N], 1):
+            frame = stat.traceback[0]
+            f.write(f"{idx:>3} {stat.size / 1024:>12.1f} {stat.count:>10}  {frame.filename}:{frame.lineno}\n")
+
+    with open(collapsed_path, 'w', encoding='utf-8') as f:
+        for stat in snapshot.statistics('traceback'):
+            # Traceback frames are the most recent first.
+            stack = ';'.join(f"{frame.filename}:{frame.lineno}".replace(';', ':')
+                             for frame in reversed(stat.traceback))
+            f.write(f"{stack} {stat.size}\n")
+
+
+def get_output_base(report_path: Optional[str]) -> str:
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        return os.path.splitext(report_path)[0]
+    return f"ds_profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+@contextlib.contextmanager
+def profiled(mode: Optional[str], report_path: Optional[str]):
+    """Profiles the block if mode is set. Results are written even if the block exits with an exception."""
+    if not mode:
+        yield
+        return
+
+    mode = mode.lower()
+    cpu = mode in ('cpu', 'both')
+    mem = mode in ('mem', 'both')
+    output_base = get_output_base(report_path)
+
+    sampler = SamplingProfiler() if cpu else None
+    if mem:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    if sampler:
+        sampler.start()
+    try:
+        yield
+    finally:
+        written = []
+        if sampler:
+            sampler.stop()
+            path = f"{output_base}.cpu.collapsed"
+            sampler.write_collapsed(path)
+            written.append(f"{path} ({sampler.samples} samples)")
+        if mem:
+            snapshot = tracemalloc.take_snapshot()
+            table_path, collapsed_path = f"{output_base}.mem.txt", f"{output_base}.mem.collapsed"
+            _write_mem_results(snapshot, table_path, collapsed_path)
+            tracemalloc.stop()
+            written += [table_path, collapsed_path]
+        click.secho("[profile] Written: " + ', '.join(written), fg='cyan', err=True)
@@ -0,0 +1,127 @@
+"""Field projection of records (`--fields` of `ds get`, `summary` and `density`).
+
+Fields are comma-separated dotted paths, e.g.
+`messageId,timestamp,sessionId,direction,body.metadata.messageType`.
+Paths are compiled once into nested accessor functions, so projecting a
+record doesn't parse anything.
+
+A projected record keeps the shape of the original one with only the
+requested fields: `body.metadata.messageType` gives
+`{"body": [{"metadata": {"messageType": ...}}]}`. Lists on the path are
+projected element-wise (`body` of a message is a list of its parsed
+messages). Absent fields are skipped.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import click
+
+PathTree = Dict[str, Optional['PathTree']]
+
+
+def parse_paths(value: str) -> List[str]:
+    """Paths of the comma-separated value, without repeats.
+
+    Raises:
+        ValueError: A path has an empty part.
+    """
+    paths = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        if not all(path.split('.')):
+            raise ValueError(f"Wrong field path '{path}'")
+        paths.setdefault(path, None)
+    return list(paths)
+
+
+def _path_tree(paths: Iterable[str]) -> PathTree:
+    """{key: subtree or None if the whole value is taken}."""
+    tree = {}
+    for path in paths:
+        node = tree
+        *parents, leaf = path.split('.')
+        for part in parents:
+            if part in node and node[part] is None:
+                break  # A shorter path takes the whole value.
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+def _compile(tree: PathTree) -> Callable:
+    fields = tuple((key, None if subtree is None else _compile(subtree)) for key, subtree in tree.items())
+
+    def project(value):
+        if isinstance(value, dict):
+            projected = {}
+            for key, project_field in fields:
+                if key in value:
+                    projected[key] = value[key] if project_field is None else project_field(value[key])
+            return projected
+        if isinstance(value, list):
+            return [project(item) for item in value]
+        return None
+    return project
+
+
+class Projection:
+    """Callable that returns a record with only the fields of `paths`."""
+
+    def __init__(self, paths: Iterable[str]):
+        self.paths: Tuple[str, ...] = tuple(paths)
+        self._project = _compile(_path_tree(self.paths))
+
+    def __call__(self, record: dict) -> dict:
+        return self._project(record)
+
+    def __reduce__(self):
+        # Compiled accessors are closures, so workers of `--processes` compile the paths again.
+        return Projection, (self.paths,)
+
+    def __deepcopy__(self, memo):
+        # Data copies its workflow on every iteration.
+        return self
+
+    def __repr__(self):
+        return f"Projection({','.join(self.paths)})"
+
+
+def _get(value, parts: Tuple[str, ...]):
+    for idx, part in enumerate(parts):
+        if isinstance(value, list):
+            values = [v for v in (_get(item, parts[idx:]) for item in value) if v is not None]
+            return values[0] if len(values) == 1 else tuple(values) or None
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return tuple(value) if isinstance(value, list) else value
+
+
+def compile_getter(path: str) -> Callable[[dict], object]:
+    """Function that returns the value of the path or None if it's absent.
+
+    Values of element-wise projected lists are returned as one value if
+    there is one, as a tuple otherwise. Lists are returned as tuples, so
+    values can be used as keys.
+    """
+    parts = tuple(path.split('.'))
+    return lambda record: _get(record, parts)
+
+
+def _fields_callback(ctx, param, value: Optional[str]) -> Optional[Projection]:
+    if value is None:
+        return None
+    try:
+        paths = parse_paths(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if not paths:
+        raise click.BadParameter("No field paths")
+    return Projection(paths)
+
+
+fields_opt = click.option("--fields", callback=_fields_callback, metavar="PATHS",
+                          help="Only these fields of records: comma-separated dotted paths, "
+                               "e.g. messageId,timestamp,body.metadata.messageType.")
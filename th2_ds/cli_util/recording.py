@@ -0,0 +1,129 @@
+"""Recording of raw HTTP response bodies of SSE commands (`speed-test --record DIR`).
+
+Recorded bodies are served back by the `ReplayHttpDataSource` wrapper
+(`cli_ds_class: ReplayHttpDataSource`, `url: DIR` in data_sources.yaml),
+so the client side (SSE parsing, JSON decoding, the Data map chain) can be
+benchmarked without a provider and reproducibly.
+
+Recording layout:
+    DIR/index.json        -- {"provider_url": ..., "responses": {request key: file name}}
+    DIR/<sha1>.sse        -- response body as it was read from the wire.
+
+Requests are keyed by the path and the query of the URL, so a recording
+doesn't depend on the provider host.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+from th2_ds.cli_util import cache
+
+INDEX_FILE = 'index.json'
+
+
+def request_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def _body_file_name(key: str) -> str:
+    return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.sse'
+
+
+class _RecordingSourceApi:
+    def __init__(self, api, recorder: ResponseRecorder):
+        self._api = api
+        self._recorder = recorder
+
+    def __getattr__(self, item):
+        return getattr(self._api, item)
+
+    def execute_sse_request(self, url: str):
+        yield from self._recorder.record(url, self._api.execute_sse_request(url))
+
+
+class _RecordingDataSource:
+    def __init__(self, data_source, recorder: ResponseRecorder):
+        self._data_source = data_source
+        self.source_api = _RecordingSourceApi(data_source.source_api, recorder)
+
+    def __getattr__(self, item):
+        return getattr(self._data_source, item)
+
+
+class ResponseRecorder:
+    """Writes every response once -- further requests with the same URL aren't recorded again."""
+
+    def __init__(self, record_dir: str, provider_url: str):
+        self.record_dir = record_dir
+        self._provider_url = provider_url
+        self._lock = threading.Lock()
+        self._recorded = set()
+        os.makedirs(record_dir, exist_ok=True)
+
+    def __deepcopy__(self, memo):
+        # Data deep-copies its workflow on every iteration.
+        return self
+
+    def attach_command(self, command_obj: Any) -> bool:
+        """Records responses of the SSE command. Must be called before the command is executed."""
+        bytes_stream = getattr(command_obj, '_sse_bytes_stream', None)
+        if bytes_stream is None:
+            return False
+
+        def recording_bytes_stream(data_source, *args, **kwargs):
+            yield from bytes_stream(_RecordingDataSource(data_source, self), *args, **kwargs)
+
+        # The command calls this method through `self`, so an instance attribute overrides it.
+        command_obj._sse_bytes_stream = recording_bytes_stream
+        return True
+
+    def record(self, url: str, chunks):
+        key = request_key(url)
+        with self._lock:
+            if key in self._recorded:
+                yield from chunks
+                return
+            self._recorded.add(key)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.record_dir, suffix='.tmp')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                file_name = _body_file_name(key)
+                os.replace(tmp_path, os.path.join(self.record_dir, file_name))
+                self._add_to_index(key, file_name)
+            else:
+                with self._lock:
+                    self._recorded.discard(key)
+                os.remove(tmp_path)
+
+    def _add_to_index(self, key: str, file_name: str):
+        index_path = os.path.join(self.record_dir, INDEX_FILE)
+        with self._lock:
+            index = cache.load_json(index_path, default={})
+            index['provider_url'] = self._provider_url
+            index.setdefault('responses', {})[key] = file_name
+            cache.save_json(index_path, index)
+
+
+def load_recording(record_dir: str) -> Tuple[str, Dict[str, bytes]]:
+    """Returns (provider url, {request key: response body})."""
+    index = cache.load_json(os.path.join(record_dir, INDEX_FILE))
+    if not index:
+        raise FileNotFoundError(f"No recording in '{record_dir}' ({INDEX_FILE} is absent or broken)")
+    bodies = {}
+    for key, file_name in index.get('responses', {}).items():
+        with open(os.path.join(record_dir, file_name), 'rb') as f:
+            bodies[key] = f.read()
+    return index['provider_url'], bodies
@@ -0,0 +1,89 @@
+"""JSON serializers of records in cli outputs (`ds get`, `events-tree`, `summary`).
+
+The standard json is used by default. orjson (faster) or simplejson can
+be chosen by the `DS_SERIALIZER` environment variable (`orjson`,
+`simplejson`, `json`); on message records simplejson is slower than the
+standard json even with its C speedups (see
+benchmarks/serializer_throughput.py).
+
+All of them produce compact json with the keys in the record order, but
+the output of orjson differs: it writes non-ASCII characters as UTF-8
+(the others escape them as `\\uXXXX`) and NaN/Infinity as null. Values
+orjson can't encode (e.g. integers over 64 bits) are encoded by the
+standard json.
+"""
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+SERIALIZER_ENV = 'DS_SERIALIZER'
+DEFAULT_SERIALIZER = 'json'
+
+
+def _json_encoder() -> Callable[[object], bytes]:
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+    def encode(record) -> bytes:
+        return dumps(record).encode()
+    return encode
+
+
+def _simplejson_encoder() -> Callable[[object], bytes]:
+    import simplejson
+    dumps = simplejson.JSONEncoder(separators=(",", ":")).encode
+
+    def encode(record) -> bytes:
+        return dumps(record).encode()
+    return encode
+
+
+def _orjson_encoder() -> Callable[[object], bytes]:
+    import orjson
+    dumps = orjson.dumps
+    options = orjson.OPT_NON_STR_KEYS
+    fallback = _json_encoder()
+
+    def encode(record) -> bytes:
+        try:
+            return dumps(record, option=options)
+        except TypeError:
+            return fallback(record)
+    return encode
+
+
+ENCODERS: Dict[str, Callable[[], Callable[[object], bytes]]] = {
+    'orjson': _orjson_encoder,
+    'simplejson': _simplejson_encoder,
+    'json': _json_encoder,
+}
+
+
+def resolve(name: Optional[str] = None) -> Tuple[str, Callable[[object], bytes]]:
+    """Returns (name, function that encodes a record to a json line -- bytes without the line break).
+
+    Args:
+        name: Serializer name. DEFAULT_SERIALIZER if None.
+
+    Raises:
+        ValueError: Unknown serializer.
+        ImportError: The requested serializer isn't installed.
+    """
+    name = name if name is not None else DEFAULT_SERIALIZER
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown serializer '{name}', expected one of {list(ENCODERS)}")
+    return name, ENCODERS[name]()
+
+
+def available() -> Dict[str, Callable[[object], bytes]]:
+    """{name: encoder} of the installed serializers."""
+    encoders = {}
+    for name, factory in ENCODERS.items():
+        try:
+            encoders[name] = factory()
+        except ImportError:
+            pass
+    return encoders
+
+
+# The serializer of the process.
+NAME, encode_line = resolve(os.environ.get(SERIALIZER_ENV) or None)
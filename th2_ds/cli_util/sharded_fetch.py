@@ -0,0 +1,251 @@
+"""Time-sharded parallel fetch of events/messages (`--shards N`).
+
+`[start_timestamp, end_timestamp)` of the request params is split into N
+equal shards. Every shard is requested by its own command
+(`get_messages_obj(ctx, {start_timestamp, end_timestamp})`) in its own
+thread, so the transfer goes through N HTTP streams at once.
+
+Shard threads push records to bounded queues in batches, so memory is
+bounded by `QUEUE_BATCHES * BATCH_SIZE` records per shard. The result is
+a Data that yields records either
+    unordered -- in arrival order, the fastest mode;
+    ordered   -- k-way merged by timestamp. Shards are disjoint, so while
+                 the consumer reads the first shard, the others are
+                 prefetched up to the queue limit only.
+
+A record on a shard boundary can be returned by both adjacent shards
+(depending on the provider, the end of the range can be inclusive).
+Records within BOUNDARY_WINDOW_NS of an inner boundary are de-duplicated
+by id (only between different shards); the rest are passed through
+without bookkeeping.
+"""
+from __future__ import annotations
+import heapq
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from th2_data_services.data import Data
+from th2_data_services.utils.converters import (
+    DatetimeConverter,
+    UniversalDatetimeStringConverter,
+    UnixTimestampConverter,
+)
+
+from th2_ds.cli_util.context import CliContext
+from th2_ds.cli_util.pipeline_metrics import PipelineMetrics, metered_command, register_pipeline_metrics
+from th2_ds.cli_util.stage_timing import timed_command
+
+BATCH_SIZE = 500
+QUEUE_BATCHES = 8
+BOUNDARY_WINDOW_NS = 1_000_000
+_PUT_TIMEOUT_SEC = 0.1
+
+shards_opt = click.option("--shards", type=click.IntRange(1), default=1, show_default=True,
+                          help="Split the time range into N shards and fetch them concurrently.")
+unordered_opt = click.option("--unordered", is_flag=True,
+                             help="With --shards, output records as shards return them instead of merging "
+                                  "them by timestamp. Faster, but such downloads can't be resumed.")
+
+# {rtype: (timestamp field, id field)}
+RECORD_FIELDS = {
+    'messages': ('timestamp', 'messageId'),
+    'events': ('startTimestamp', 'eventId'),
+}
+
+
+def to_nanoseconds(timestamp) -> int:
+    """The same conversion the lwdp commands do with start/end timestamps."""
+    if isinstance(timestamp, datetime):
+        return DatetimeConverter.to_nanoseconds(timestamp)
+    if isinstance(timestamp, str):
+        return UniversalDatetimeStringConverter.to_nanoseconds(timestamp)
+    return UnixTimestampConverter.to_nanoseconds(timestamp)
+
+
+def record_timestamp_ns(timestamp) -> int:
+    """Timestamp of a record, e.g. {'epochSecond': 1729691698, 'nano': 0}."""
+    if isinstance(timestamp, dict):
+        return timestamp['epochSecond'] * 1_000_000_000 + timestamp['nano']
+    return to_nanoseconds(timestamp)
+
+
+def stream_key(record: dict, rtype: str, messages_mode: str) -> str:
+    """Message group/stream (by the messages mode) or event scope of a record."""
+    if rtype == 'messages':
+        return record.get('sessionGroup' if messages_mode == 'ByGroups' else 'sessionId')
+    # Event ids are `book:scope:timestamp:id`.
+    parts = record.get('eventId', '').split(':')
+    return parts[1] if len(parts) > 3 else ''
+
+
+def split_range(start_ns: int, end_ns: int, shards: int) -> List[Tuple[int, int]]:
+    if end_ns <= start_ns:
+        raise ValueError(f"end_timestamp ({end_ns}) must be greater than start_timestamp ({start_ns})")
+    shards = min(shards, end_ns - start_ns)
+    bounds = [start_ns + (end_ns - start_ns) * i // shards for i in range(shards + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class _ShardError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_DONE = object()
+
+
+class _ShardedFetch:
+    def __init__(self, shard_datas: List[Data], rtype: str, ranges: List[Tuple[int, int]], ordered: bool):
+        self._shard_datas = shard_datas
+        self._ordered = ordered
+        self._ts_field, self._id_field = RECORD_FIELDS[rtype]
+        self._windows = boundary_windows(ranges)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @staticmethod
+    def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_PUT_TIMEOUT_SEC)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, idx: int, data: Data, q: queue.Queue, stop: threading.Event):
+        try:
+            batch = []
+            for record in data:
+                batch.append(record)
+                if len(batch) == BATCH_SIZE:
+                    if not self._put(q, (idx, batch), stop):
+                        return
+                    batch = []
+            if batch and not self._put(q, (idx, batch), stop):
+                return
+            self._put(q, (idx, _DONE), stop)
+        except BaseException as e:
+            self._put(q, (idx, _ShardError(e)), stop)
+
+    def _dedup(self, idx: int, records: Iterable[dict], seen: Dict[str, int]) -> Iterator[dict]:
+        """Drops records of the shard `idx` that were already returned by another shard."""
+        ts_field, id_field = self._ts_field, self._id_field
+        windows = self._windows
+        for record in records:
+            ts = record_timestamp_ns(record[ts_field])
+            for low, high in windows:
+                if low <= ts <= high:
+                    record_id = record[id_field]
+                    if seen.setdefault(record_id, idx) != idx:
+                        break
+                    yield record
+                    break
+            else:
+                yield record
+
+    def _records_of(self, idx: int, q: queue.Queue, seen: Dict[str, int]) -> Iterator[dict]:
+        """Records of one shard from its own queue (ordered mode)."""
+        while True:
+            _, batch = q.get()
+            if batch is _DONE:
+                return
+            if isinstance(batch, _ShardError):
+                raise batch.exc
+            yield from self._dedup(idx, batch, seen)
+
+    def _records_of_all(self, q: queue.Queue, seen: Dict[str, int]) -> Iterator[dict]:
+        """Records of all shards from the shared queue (unordered mode)."""
+        done = 0
+        while done < len(self._shard_datas):
+            idx, batch = q.get()
+            if batch is _DONE:
+                done += 1
+                continue
+            if isinstance(batch, _ShardError):
+                raise batch.exc
+            yield from self._dedup(idx, batch, seen)
+
+    def __call__(self, *args, **kwargs) -> Iterator[dict]:
+        shards = len(self._shard_datas)
+        stop = threading.Event()
+        if self._ordered:
+            queues = [queue.Queue(maxsize=QUEUE_BATCHES) for _ in range(shards)]
+        else:
+            queues = [queue.Queue(maxsize=QUEUE_BATCHES * shards)] * shards
+
+        threads = [threading.Thread(target=self._worker, args=(idx, data, queues[idx], stop),
+                                    name=f'ds-shard-{idx}', daemon=True)
+                   for idx, data in enumerate(self._shard_datas)]
+        for thread in threads:
+            thread.start()
+
+        seen = {}  # {id of a record near a boundary: shard}
+        try:
+            if self._ordered:
+                ts_field = self._ts_field
+                yield from heapq.merge(*(self._records_of(idx, q, seen) for idx, q in enumerate(queues)),
+                                       key=lambda r: record_timestamp_ns(r[ts_field]))
+            else:
+                yield from self._records_of_all(queues[0], seen)
+        finally:
+            # The consumer can stop early, workers mustn't stay blocked on full queues.
+            # A worker waiting for the network exits with the next record, it isn't waited for.
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=_PUT_TIMEOUT_SEC)
+
+
+def shard_commands(ds_wrapper, ctx: CliContext, rtype: str, shards: int) -> Tuple[List[Tuple[int, int]], list]:
+    """Splits the request params range into shards. Returns (ranges, command objects of the ranges)."""
+    if rtype == 'messages':
+        get_cmd_obj = ds_wrapper.get_messages_obj
+    elif rtype == 'events':
+        get_cmd_obj = ds_wrapper.get_events_obj
+    else:
+        raise RuntimeError(f'Unknown Rtype: {rtype}')
+
+    request_params = ctx.cfg.request_params
+    if request_params.start_timestamp is None or request_params.end_timestamp is None:
+        raise ValueError("Both start_timestamp and end_timestamp are required to split the range into shards")
+    ranges = split_range(to_nanoseconds(request_params.start_timestamp),
+                         to_nanoseconds(request_params.end_timestamp),
+                         shards)
+    commands = [get_cmd_obj(ctx, dict(start_timestamp=start_ns, end_timestamp=end_ns)) for start_ns, end_ns in ranges]
+    return ranges, commands
+
+
+def boundary_windows(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Time windows around inner shard boundaries, where records can be returned by both shards."""
+    return [(start - BOUNDARY_WINDOW_NS, start + BOUNDARY_WINDOW_NS) for start, _ in ranges[1:]]
+
+
+def sharded_command(ds_wrapper, ctx: CliContext, rtype: str, shards: int, ordered: bool = False) -> Data:
+    """Returns a Data with `rtype` ('events' or 'messages') of the request params, fetched by `shards` threads.
+
+    Wire and decoded bytes of all shards are metered by one PipelineMetrics
+    (see `get_pipeline_metrics`).
+    """
+    ranges, commands = shard_commands(ds_wrapper, ctx, rtype, shards)
+    metrics = PipelineMetrics()
+    shard_datas = []
+    for command_obj in commands:
+        metrics.meter_command(command_obj)
+        shard_datas.append(timed_command(ds_wrapper, command_obj))
+
+    data = Data(_ShardedFetch(shard_datas, rtype, ranges, ordered))
+    data.update_metadata(dict(urls=[url for d in shard_datas for url in d.metadata.get('urls', [])],
+                              shards=[list(r) for r in ranges]))
+    return register_pipeline_metrics(data, metrics)
+
+
+def fetch(ds_wrapper, ctx: CliContext, rtype: str, command_obj, shards: Optional[int] = 1,
+          ordered: bool = False) -> Data:
+    """`metered_command(ds_wrapper, command_obj)` or `sharded_command(...)` if shards > 1."""
+    if not shards or shards <= 1:
+        return metered_command(ds_wrapper, command_obj)
+    return sharded_command(ds_wrapper, ctx, rtype, shards, ordered=ordered)
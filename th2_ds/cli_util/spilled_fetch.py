@@ -0,0 +1,144 @@
+"""Range-sharded download of events/messages to a file by worker processes (`ds get -o FILE --shards N --processes`).
+
+Every shard of the request params range is downloaded by its own
+process, so not only HTTP streams but also JSON decoding and encoding
+are spread over cores (threads of `--shards` share the GIL). A worker
+writes its records as json lines to a spill file in a temporary
+directory next to the output file. The provider returns a shard ordered
+by timestamp, so spill files are sorted.
+
+Then spill files are k-way merged by (timestamp, shard, position in the
+shard) into the output file: shards are consecutive time ranges, so
+records with equal timestamps keep the order the provider returned them
+in. Lines are encoded once, by the workers, with the same encoder as the
+single-stream output, and the merge only moves bytes, so the output has
+the same lines as a single-stream download, in the same order as long as
+the provider orders records of a range alike in shard requests. Memory
+is bounded by the read and write buffers.
+
+Spill line: `<timestamp ns>\\t<id>\\t<json line>\\n`.
+"""
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import click
+
+from th2_ds.cli_util import writers
+from th2_ds.cli_util.context import CliContext
+from th2_ds.cli_util.sharded_fetch import RECORD_FIELDS, boundary_windows, record_timestamp_ns, shard_commands
+
+SPILL_BUFFER_SIZE = 1 << 20
+# Workers report the progress every this number of records.
+PROGRESS_RECORDS = 1000
+
+processes_opt = click.option("--processes", is_flag=True,
+                             help="With --shards and the out file: download shards by worker processes, "
+                                  "spilled to temporary files and merged in order.")
+
+
+def _spill_shard(data, rtype: str, path: str, counters, idx: int, projection: Optional[Callable[[dict], dict]]):
+    ts_field, id_field = RECORD_FIELDS[rtype]
+    records = 0
+    with open(path, 'wb', buffering=SPILL_BUFFER_SIZE) as f:
+        for record in data:
+            f.write(b"%d\t%s\t%s\n" % (record_timestamp_ns(record[ts_field]), str(record[id_field]).encode(),
+                                       writers.encode_line(record if projection is None else projection(record))))
+            records += 1
+            if records % PROGRESS_RECORDS == 0:
+                counters[idx] = records
+    counters[idx] = records
+
+
+def _read_spill(path: str) -> Iterator[Tuple[int, bytes, bytes]]:
+    with open(path, 'rb', buffering=SPILL_BUFFER_SIZE) as f:
+        for line in f:
+            ts, record_id, json_line = line.split(b"\t", 2)
+            yield int(ts), record_id, json_line
+
+
+def merge_spills(paths: List[str], ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+    """json lines of the spill files, merged by (timestamp, shard index, position in the shard).
+    Records near shard boundaries that were already returned by another shard are dropped."""
+    windows = boundary_windows(ranges)
+    seen = {}  # {id of a record near a boundary: shard}
+
+    def shard_lines(idx: int, path: str):
+        for seq, (ts, record_id, json_line) in enumerate(_read_spill(path)):
+            for low, high in windows:
+                if low <= ts <= high:
+                    if seen.setdefault(record_id, idx) == idx:
+                        yield ts, idx, seq, json_line
+                    break
+            else:
+                yield ts, idx, seq, json_line
+
+    # Tuples are compared by (timestamp, shard, position) -- unique, so lines are never compared.
+    for _, _, _, json_line in heapq.merge(*(shard_lines(idx, path) for idx, path in enumerate(paths))):
+        yield json_line
+
+
+def _wait(workers: List[multiprocessing.Process], counters):
+    last_print = time.time()
+    while any(w.is_alive() for w in workers):
+        failed = [idx for idx, w in enumerate(workers) if w.exitcode not in (None, 0)]
+        if failed:
+            raise RuntimeError(f"Shard worker(s) {failed} failed, see the errors above")
+        for w in workers:
+            w.join(timeout=0.1)
+        if time.time() - last_print >= 1:
+            last_print = time.time()
+            print(f"\rDownloaded: {sum(counters)}   ", end="", flush=True)
+    print(f"\rDownloaded: {sum(counters)}   ")
+    failed = [idx for idx, w in enumerate(workers) if w.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"Shard worker(s) {failed} failed, see the errors above")
+
+
+def download_to_file(ds_wrapper, ctx: CliContext, rtype: str, shards: int, out_file: str,
+                     file_format: str, projection: Optional[Callable[[dict], dict]] = None
+                     ) -> Tuple[int, List[str], list]:
+    """Downloads `rtype` ('events' or 'messages') of the request params to the json lines file.
+
+    Records are merged by their timestamps and de-duplicated by ids, so `projection` is applied
+    to them after these are spilled.
+
+    Returns:
+        (number of records, urls, command objects of shards)
+    """
+    ranges, commands = shard_commands(ds_wrapper, ctx, rtype, shards)
+    shard_datas = [ds_wrapper.ds_impl.command(command_obj) for command_obj in commands]
+    urls = [url for d in shard_datas for url in d.metadata.get('urls', [])]
+
+    spill_dir = tempfile.mkdtemp(prefix='.ds-shards-', dir=os.path.dirname(os.path.abspath(out_file)))
+    workers = []
+    try:
+        paths = [os.path.join(spill_dir, f'shard-{idx}.tsv') for idx in range(len(ranges))]
+        counters = multiprocessing.Array('q', len(ranges), lock=False)
+        workers = [multiprocessing.Process(target=_spill_shard, args=(data, rtype, path, counters, idx, projection),
+                                           name=f'ds-shard-{idx}', daemon=True)
+                   for idx, (data, path) in enumerate(zip(shard_datas, paths))]
+        for w in workers:
+            w.start()
+        _wait(workers, counters)
+
+        records = 0
+
+        def counted(lines):
+            nonlocal records
+            for line in lines:
+                records += 1
+                yield line
+
+        with writers.LineFile(out_file, file_format.lower()) as f:
+            writers.write_raw_lines(counted(merge_spills(paths, ranges)), f)
+        return records, urls, commands
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        shutil.rmtree(spill_dir, ignore_errors=True)
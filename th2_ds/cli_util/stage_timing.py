@@ -0,0 +1,254 @@
+"""Opt-in per-stage latency breakdown of data fetches (`--stage-timing`).
+
+Stages of a pipeline created by `timed_command`, from the wire to the consumer:
+    ttfb        -- from sending an HTTP request to the first chunk of the response;
+    chunk_read  -- reading the next HTTP chunk (`chunk_length`);
+    sse_decode  -- splitting chunks into SSE events;
+    json_decode -- parsing SSE events into records (and Data overhead);
+    map_chain   -- `Data.map` chain added by the plugin after the command;
+    consumer    -- the plugin's own work with records.
+
+Every stage is timed exclusively -- time of inner stages is subtracted.
+Pipelines are pull-based, so an inner stage always runs inside a `next()`
+call of the outer one.
+
+Stage time per batch of records (BATCH_SIZE) goes to a histogram, ttfb is
+recorded per HTTP request. Histograms are written to the report of
+`generate_and_save_report`.
+"""
+from __future__ import annotations
+import math
+import weakref
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from th2_data_services.data import Data
+
+BATCH_SIZE = 1000
+STAGES = ('ttfb', 'chunk_read', 'sse_decode', 'json_decode', 'map_chain', 'consumer')
+
+_enabled = False
+_timers: List[StageTimer] = []
+# StageTimer of Data objects created by `timed_command`.
+_data_timers = weakref.WeakKeyDictionary()
+
+
+def enable_stage_timing():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class LatencyHistogram:
+    """Histogram with power-of-two buckets in microseconds."""
+
+    def __init__(self):
+        self._buckets: Dict[int, int] = {}  # {upper bound, us: count}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value_sec: float):
+        value_sec = max(value_sec, 0.0)
+        value_us = value_sec * 1e6
+        upper_bound = 1 if value_us <= 1 else 2 ** math.ceil(math.log2(value_us))
+        self._buckets[upper_bound] = self._buckets.get(upper_bound, 0) + 1
+        self.count += 1
+        self.total += value_sec
+        self.min = min(self.min, value_sec)
+        self.max = max(self.max, value_sec)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Returns the upper bound (sec) of the bucket with the p-th percentile."""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for upper_bound in sorted(self._buckets):
+            seen += self._buckets[upper_bound]
+            if seen >= rank:
+                return min(upper_bound / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return dict(count=0)
+        return dict(count=self.count,
+                    total_sec=round(self.total, 6),
+                    min_sec=round(self.min, 6),
+                    mean_sec=round(self.total / self.count, 6),
+                    p50_sec=round(self.percentile(50), 6),
+                    p90_sec=round(self.percentile(90), 6),
+                    p99_sec=round(self.percentile(99), 6),
+                    max_sec=round(self.max, 6),
+                    buckets_us={str(k): v for k, v in sorted(self._buckets.items())})
+
+
+class _TimedSourceApi:
+    def __init__(self, api, timer: StageTimer):
+        self._api = api
+        self._timer = timer
+
+    def __getattr__(self, item):
+        return getattr(self._api, item)
+
+    def execute_sse_request(self, url: str):
+        timer = self._timer
+        stream = self._api.execute_sse_request(url)
+        stage = 'ttfb'
+        while True:
+            start = perf_counter()
+            try:
+                chunk = next(stream)
+            except StopIteration:
+                return
+            finally:
+                elapsed = perf_counter() - start
+                timer.inclusive['http'] += elapsed
+                if stage == 'ttfb':
+                    timer.histograms['ttfb'].add(elapsed)
+                else:
+                    timer.inclusive['chunk_read'] += elapsed
+            stage = 'chunk_read'
+            yield chunk
+
+
+class _TimedDataSource:
+    def __init__(self, data_source, timer: StageTimer):
+        self._data_source = data_source
+        self.source_api = _TimedSourceApi(data_source.source_api, timer)
+
+    def __getattr__(self, item):
+        return getattr(self._data_source, item)
+
+
+class StageTimer:
+    def __init__(self, name: str, batch_size: int = BATCH_SIZE):
+        self.name = name
+        self._batch_size = batch_size
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        # Inclusive time of `next()` calls of every level.
+        self.inclusive = dict(http=0.0, chunk_read=0.0, sse=0.0, records=0.0, chain=0.0, consumer=0.0)
+        self.records = 0
+        self._has_consumer_mark = False
+        self._last_snapshot = self._exclusive()
+
+    def __deepcopy__(self, memo):
+        # Data deep-copies its workflow (with markers bound to the timer) on every iteration.
+        return self
+
+    def _exclusive(self) -> Dict[str, float]:
+        incl = self.inclusive
+        return dict(chunk_read=incl['chunk_read'],
+                    sse_decode=incl['sse'] - incl['http'],
+                    json_decode=incl['records'] - incl['sse'],
+                    map_chain=incl['chain'] - incl['records'] if self._has_consumer_mark else 0.0,
+                    consumer=incl['consumer'])
+
+    def _flush_batch(self):
+        exclusive = self._exclusive()
+        for stage, value in exclusive.items():
+            self.histograms[stage].add(value - self._last_snapshot[stage])
+        self._last_snapshot = exclusive
+
+    def attach_command(self, command_obj: Any) -> bool:
+        """Times http and SSE stages of the command. Must be called before the command is executed."""
+        bytes_stream = getattr(command_obj, '_sse_bytes_stream', None)
+        events_stream = getattr(command_obj, '_sse_events_stream', None)
+        if bytes_stream is None or events_stream is None:
+            return False
+
+        def timed_bytes_stream(data_source, *args, **kwargs):
+            yield from bytes_stream(_TimedDataSource(data_source, self), *args, **kwargs)
+
+        def timed_events_stream(*args, **kwargs):
+            yield from self._timed(events_stream(*args, **kwargs), 'sse')
+
+        # The command calls these methods through `self`, so instance attributes override them.
+        command_obj._sse_bytes_stream = timed_bytes_stream
+        command_obj._sse_events_stream = timed_events_stream
+        return True
+
+    def _timed(self, stream, level: str, outermost: bool = False):
+        inclusive = self.inclusive
+        it = iter(stream)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            finally:
+                inclusive[level] += perf_counter() - start
+            if not outermost:
+                yield item
+                continue
+
+            self.records += 1
+            if self.records % self._batch_size == 0:
+                self._flush_batch()
+            start = perf_counter()
+            yield item
+            inclusive['consumer'] += perf_counter() - start
+
+        if outermost and self.records % self._batch_size:
+            self._flush_batch()
+
+    def _records_marker(self, stream):
+        yield from self._timed(stream, 'records', outermost=not self._has_consumer_mark)
+
+    def _chain_marker(self, stream):
+        yield from self._timed(stream, 'chain', outermost=True)
+
+    def mark_records(self, data: Data) -> Data:
+        """Marks the end of the json_decode stage. Called right after the command."""
+        return data.map_stream(self._records_marker)
+
+    def mark_consumer(self, data: Data) -> Data:
+        """Marks the end of the map_chain stage. Called right before the data is consumed."""
+        self._has_consumer_mark = True
+        return data.map_stream(self._chain_marker)
+
+    def to_dict(self) -> dict:
+        return dict(name=self.name,
+                    records=self.records,
+                    batch_size=self._batch_size,
+                    stages={stage: self.histograms[stage].to_dict() for stage in STAGES})
+
+
+def timed_command(ds_wrapper, command_obj: Any) -> Data:
+    """The same as `ds_wrapper.ds_impl.command(command_obj)`, but times stages if stage timing is enabled."""
+    if not _enabled:
+        return ds_wrapper.ds_impl.command(command_obj)
+
+    timer = StageTimer(f"{type(command_obj).__name__}#{len(_timers) + 1}")
+    if not timer.attach_command(command_obj):
+        return ds_wrapper.ds_impl.command(command_obj)
+
+    data = ds_wrapper.ds_impl.command(command_obj)
+    if not isinstance(data, Data):
+        return data
+
+    _timers.append(timer)
+    data = timer.mark_records(data)
+    _data_timers[data] = timer
+    return data
+
+
+def mark_consumer(data: Data) -> Data:
+    """Lets the timer of the Data (if any) separate map_chain and consumer stages."""
+    try:
+        timer = _data_timers.get(data)
+    except TypeError:
+        timer = None
+    if timer is None:
+        return data
+    return timer.mark_consumer(data)
+
+
+def get_report() -> List[dict]:
+    return [timer.to_dict() for timer in _timers if timer.records]
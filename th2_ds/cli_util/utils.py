@@ -2,12 +2,10 @@ import datetime
 import inspect
 import json
 import re
-import sys
-import time
 import traceback
 import contextlib
 from importlib import import_module
-from typing import List, Type
+from typing import List, Optional, Type
 import click
 from prettytable import PrettyTable
 import threading
@@ -17,19 +15,14 @@ from th2_data_services.data import Data
 from th2_data_services.data_source.lwdp.interfaces.command import ICommand, IHTTPCommand
 # from th2_data_services.provider.interfaces.data_source import IProviderDataSource, IGRPCProviderDataSource, IHTTPProviderDataSource
 from th2_data_services.data_source.lwdp.interfaces.data_source import IHTTPDataSource
+from th2_ds.cli_util import stage_timing
 from th2_ds.cli_util.cli_regestry import CliRegistry
 ###from th2_data_services.data_source.lwdp.data_source.http import DataSource, HTTPDataSource
 # from th2_data_services.data_source.lwdp.data_source.http import DataSource, HTTPDataSource
 from th2_ds.cli_util.config import CliConfig, DataSource
 from th2_ds.cli_util.context import CliContext
 from th2_ds.cli_util.interfaces.data_source_wrapper import IDataSourceWrapper
-
-_received_counter = 0
-_last_cnt = 0
-_total_sec = 1
-_total_size = 0
-_last_size_fmted = 0
-_avg_size_fmted = 0
+from th2_ds.cli_util.pipeline_metrics import PipelineMetrics, get_pipeline_metrics
 
 
 class StoppableThread(threading.Thread):
@@ -47,104 +40,22 @@ class StoppableThread(threading.Thread):
         return self._stop_event.is_set()
 
 
-_counter_thread: threading.Thread = None
-
-
-def _sizeof_fmt(num, suffix="B"):
-    for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
-        if abs(num) < 1024.0:
-            return f"{num:3.1f}{unit}{suffix}"
-        num /= 1024.0
-    return f"{num:.1f}Yi{suffix}"
-
-
-def _print_recv_state(recv, last_recv, total_sec, total_size_bytes, **kwargs):
-    # size = _sizeof_fmt(total_size_bytes)
-    # if recv > 0:
-    #     avg_size = _sizeof_fmt(total_size_bytes / recv)
-    # else:
-    #     avg_size = _sizeof_fmt(0)
-    print(
-        f"\rRecv: {recv}, speed: {recv - last_recv}/s, avg: {recv / total_sec:.0f}/s, "
-        f"time: {datetime.timedelta(seconds=total_sec)}         ",
-        # f"size: {size}, avg size: {avg_size}, time: {datetime.timedelta(seconds=total_sec)}         ",
-        **kwargs)
-
-
-def count_printer_thread():
-    global _received_counter
-    global _total_sec
-    global _last_cnt
-
-    t = threading.currentThread()
-    while getattr(t, "do_run", True):
-        time.sleep(1)
-        _print_recv_state(recv=_received_counter,
-                          last_recv=_last_cnt,
-                          total_sec=_total_sec,
-                          total_size_bytes=_total_size,
-                          end="", flush=True
-                          )
-        _last_cnt = _received_counter
-        _total_sec += 1
-
-
-def setup_counter():
-    global _received_counter
-    global _last_cnt
-    global _total_sec
-    global _counter_thread
-    global _total_size
-    _total_size = 0
-    _received_counter = 0
-    _last_cnt = 0
-    _total_sec = 1
-    # _counter_thread = StoppableThread(target=count_printer_thread)
-    _counter_thread = threading.Thread(target=count_printer_thread, daemon=True)
-    _counter_thread.start()
-
-
-def counter(r):
-    global _received_counter
-    # global _batch_size
-    global _total_size
-    _received_counter += 1
-    _total_size += sys.getsizeof(r)
-    return r
-
-
-def reset_counter():
-    global _received_counter
-    global _last_cnt
-    global _total_sec
-    global _counter_thread
-    global _last_size_fmted
-    global _avg_size_fmted
-    global _total_size
-    _counter_thread.do_run = False
-    _counter_thread.join()
-    _print_recv_state(recv=_received_counter, last_recv=_last_cnt,
-                      total_sec=_total_sec, total_size_bytes=_total_size)
-    _counter_thread = None
-
-    _last_size_fmted = _sizeof_fmt(_total_size)
-    if _received_counter > 0:
-        _avg_size_fmted = _sizeof_fmt(_total_size / _received_counter)
-    else:
-        _avg_size_fmted = _sizeof_fmt(0)
-
-    return dict(last_size_fmted=_last_size_fmted, avg_size_fmted=_avg_size_fmted)
+# DataSourceWrapper objects are kept between commands by `ds serve`, see enable_ds_wrappers_cache.
+_ds_wrappers_cache: Optional[dict] = None
 
 
 @contextlib.contextmanager
-def data_counter(d: Data):
-    new_d = d.map(counter)
+def data_counter(d: Data, metrics: Optional[PipelineMetrics] = None):
+    """Counts records of the Data and prints the progress every second.
 
-    try:
-        setup_counter()
-        yield new_d
-    finally:
-        reset_counter()
+    Args:
+        d: Data to count.
+        metrics: Metrics to update. By default, metrics of the Data created by
+            `metered_command` or new PipelineMetrics.
+    """
+    metrics = metrics or get_pipeline_metrics(d) or PipelineMetrics()
+    with metrics.progress():
+        yield metrics.count(stage_timing.mark_consumer(d))
 
 
 def not_implemented_err():
@@ -434,6 +345,15 @@ def get_ds_wrapper(ctx: CliContext) -> IDataSourceWrapper:
     return create_ds_wrapper(ctx.cli_registry, ds_cfg)
 
 
+def enable_ds_wrappers_cache():
+    """Makes create_ds_wrapper reuse DataSourceWrapper objects with the same config.
+
+    It saves the connection check that data source does on creation.
+    """
+    global _ds_wrappers_cache
+    _ds_wrappers_cache = {}
+
+
 def create_ds_wrapper(cli_registry: CliRegistry, ds_cfg: DataSource) -> IDataSourceWrapper:
     # FixME:
     #   That works until I provide DataSourceWrapper with another __init__
@@ -443,7 +363,14 @@ def create_ds_wrapper(cli_registry: CliRegistry, ds_cfg: DataSource) -> IDataSou
         if k not in ('version', 'ds_impl', 'cli_ds_class'):
             body[k] = v
 
-    return cli_registry.get_ds_by_cfg_name(ds_cfg.cli_ds_class)(**body)
+    if _ds_wrappers_cache is None:
+        return cli_registry.get_ds_by_cfg_name(ds_cfg.cli_ds_class)(**body)
+
+    key = (ds_cfg.cli_ds_class, tuple(sorted(body.items())))
+    ds_wrapper = _ds_wrappers_cache.get(key)
+    if ds_wrapper is None:
+        ds_wrapper = _ds_wrappers_cache[key] = cli_registry.get_ds_by_cfg_name(ds_cfg.cli_ds_class)(**body)
+    return ds_wrapper
 
 
 def truncate_timestamp(obj):
@@ -480,6 +407,9 @@ def generate_and_save_report(
     if data:
         report["ds_metadata"] = data.metadata
 
+    if stage_timing.is_enabled():
+        report["stage_timing"] = stage_timing.get_report()
+
     def serializer(o):
         if isinstance(o, datetime.datetime):
             return o.isoformat()
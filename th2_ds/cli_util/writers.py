@@ -0,0 +1,324 @@
+"""Streaming writers of `ds get` output files.
+
+Memory is bounded in all of them: records are encoded in batches and
+written with large buffered writes, nothing is kept for the whole file.
+
+Formats:
+    json, jsonl  -- json line per record (`json` is the old name).
+    jsonl.gz     -- gzip-compressed json lines.
+    jsonl.zst    -- zstd-compressed json lines (requires `zstandard`).
+    arrow        -- Arrow IPC stream (requires `pyarrow`).
+    parquet      -- Parquet (requires `pyarrow`).
+
+Columnar formats have a column per flat header field (strings, numbers,
+booleans; timestamps become `timestamp[ns, UTC]`), the other fields
+(message body, attached ids, ...) are kept in the `body_json` column as
+a JSON object. The columns are taken from the first batch; later values
+that don't fit their column are kept in `body_json` as well.
+"""
+import gzip
+import importlib
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import click
+
+# The json line format of all outputs (bytes without the line break).
+from th2_ds.cli_util.serializers import encode_line
+
+WRITE_BUFFER_SIZE = 1 << 20
+# Smaller, so the output of a slow stream isn't delayed much.
+STDOUT_BUFFER_SIZE = 64 * 1024
+COLUMNAR_BATCH_RECORDS = 10_000
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BODY_COLUMN = 'body_json'
+
+FORMATS = ('json', 'jsonl', 'jsonl.gz', 'jsonl.zst', 'arrow', 'parquet')
+# Formats that need packages which aren't in the requirements.
+OPTIONAL_DEPENDENCIES = {'jsonl.zst': 'zstandard', 'arrow': 'pyarrow', 'parquet': 'pyarrow'}
+
+
+def _import_optional(file_format: str):
+    module = OPTIONAL_DEPENDENCIES[file_format]
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise click.UsageError(f"'{file_format}' format requires the '{module}' package: pip install {module}")
+
+
+def check_format(file_format: str):
+    """Raises UsageError if the format can't be written in this environment."""
+    if file_format in OPTIONAL_DEPENDENCIES:
+        _import_optional(file_format)
+
+
+LINE_FORMATS = ('json', 'jsonl', 'jsonl.gz', 'jsonl.zst')
+
+
+class LineFile:
+    """Binary output file of json line formats.
+
+    `sync()` makes everything written so far a complete file: the gzip
+    member or the zstd frame is finished (readers read concatenated
+    members/frames as one stream), so the file can be truncated at the
+    returned offset and appended later (`ds get --resume`).
+
+    Args:
+        out_file: File path.
+        file_format: One of LINE_FORMATS.
+        offset: Append at this offset, the rest of the file is truncated.
+            The file is created from scratch if None.
+    """
+
+    def __init__(self, out_file: str, file_format: str, offset: Optional[int] = None):
+        self.file_format = file_format
+        self._zstandard = _import_optional(file_format) if file_format == 'jsonl.zst' else None
+        if offset is None:
+            self._raw = open(out_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+        else:
+            self._raw = open(out_file, 'r+b', buffering=WRITE_BUFFER_SIZE)
+            if self._raw.seek(0, os.SEEK_END) < offset:
+                self._raw.close()
+                raise ValueError(f"'{out_file}' is shorter than the resume offset {offset}")
+            self._raw.truncate(offset)
+            self._raw.seek(offset)
+        self._f = self._open_stream()
+
+    def _open_stream(self):
+        if self.file_format == 'jsonl.gz':
+            return gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=GZIP_LEVEL)
+        if self.file_format == 'jsonl.zst':
+            return self._zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._raw, closefd=False)
+        return self._raw
+
+    def write(self, data: bytes):
+        self._f.write(data)
+
+    def sync(self) -> int:
+        """Finishes the current gzip member/zstd frame, flushes it to the disk and returns the file size."""
+        if self.file_format == 'jsonl.gz':
+            self._f.close()  # Writes the member trailer, the raw file stays open.
+        elif self.file_format == 'jsonl.zst':
+            self._f.flush(self._zstandard.FLUSH_FRAME)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        offset = self._raw.tell()
+        if self.file_format == 'jsonl.gz':
+            # The header of the next member is written right away, it must be after the offset.
+            self._f = self._open_stream()
+        return offset
+
+    def close(self):
+        if self._f is not self._raw:
+            self._f.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_lines(records: Iterable[Any], f, on_chunk: Optional[Callable[[Any, bool], None]] = None,
+                buffer_size: int = WRITE_BUFFER_SIZE):
+    """Writes json lines to the binary file object in chunks of ~buffer_size bytes.
+
+    Args:
+        records: Records to write.
+        f: Binary file object.
+        on_chunk: Called as on_chunk(f, final) after every written chunk.
+            The last call (final=True) is done even if `records` raised,
+            records consumed before the error are written.
+        buffer_size: Chunk size, bytes.
+    """
+    chunk: List[bytes] = []
+    size = 0
+
+    def flush(final: bool):
+        nonlocal chunk, size
+        if chunk:
+            chunk.append(b"")
+            f.write(b"\n".join(chunk))
+            chunk, size = [], 0
+        if on_chunk is not None:
+            on_chunk(f, final)
+
+    try:
+        for record in records:
+            line = encode_line(record)
+            chunk.append(line)
+            size += len(line) + 1
+            if size >= buffer_size:
+                flush(final=False)
+    finally:
+        flush(final=True)
+
+
+def print_lines(records: Iterable[Any]):
+    """Writes json lines to stdout, bypassing the text layer."""
+    sys.stdout.flush()
+    out = sys.stdout.buffer
+    try:
+        write_lines(records, out, buffer_size=STDOUT_BUFFER_SIZE)
+    finally:
+        out.flush()
+
+
+def write_raw_lines(lines: Iterable[bytes], f):
+    """Writes encoded lines (with line breaks) to the binary file object in chunks of ~WRITE_BUFFER_SIZE bytes."""
+    chunk: List[bytes] = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= WRITE_BUFFER_SIZE:
+            f.write(b"".join(chunk))
+            chunk, size = [], 0
+    if chunk:
+        f.write(b"".join(chunk))
+
+
+def _is_timestamp(value) -> bool:
+    return isinstance(value, dict) and value.keys() == {'epochSecond', 'nano'}
+
+
+def _value_kind(value) -> Optional[str]:
+    if _is_timestamp(value):
+        return 'timestamp'
+    # bool is checked first, it's a subclass of int.
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int' if -2 ** 63 <= value < 2 ** 63 else None
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'string'
+    return None
+
+
+def _fits(kind: str, value) -> bool:
+    """The value can be stored in the column of the kind without a loss."""
+    value_kind = _value_kind(value)
+    # float64 keeps integers up to 2**53 exactly.
+    return value_kind == kind or kind == 'float' and value_kind == 'int' and abs(value) <= 2 ** 53
+
+
+class _ColumnarEncoder:
+    """Converts records to Arrow record batches with the schema of the first batch.
+
+    A field gets a column if all its values in the first batch are of one kind (ints and floats make a float
+    column). Values that don't fit the column in later batches are kept in the body json, never cast.
+    """
+
+    def __init__(self, pa):
+        self._pa = pa
+        self.schema = None
+        self._columns: Optional[List[str]] = None
+        self._kinds: Optional[List[str]] = None
+
+    def _build_schema(self, records: List[dict]):
+        pa = self._pa
+        kinds: Dict[str, Optional[str]] = {}
+        for record in records:
+            for key, value in record.items():
+                if key == BODY_COLUMN or value is None:
+                    continue
+                kind = _value_kind(value)
+                current = kinds.setdefault(key, kind)
+                if current != kind:
+                    kinds[key] = 'float' if {current, kind} == {'int', 'float'} else None
+        columns = {k: kind for k, kind in kinds.items() if kind is not None}
+        types = dict(timestamp=pa.timestamp('ns', tz='UTC'), bool=pa.bool_(), int=pa.int64(), float=pa.float64(),
+                     string=pa.string())
+        self._columns = list(columns)
+        self._kinds = list(columns.values())
+        self.schema = pa.schema([*(pa.field(k, types[kind]) for k, kind in columns.items()),
+                                 pa.field(BODY_COLUMN, pa.binary())])
+
+    def _split(self, record: dict) -> tuple:
+        flat, rest = [], {}
+        in_columns = set()
+        for key, kind in zip(self._columns, self._kinds):
+            value = record.get(key)
+            if value is None or not _fits(kind, value):
+                flat.append(None)
+            else:
+                in_columns.add(key)
+                flat.append(value['epochSecond'] * 1_000_000_000 + value['nano'] if kind == 'timestamp' else value)
+        for key, value in record.items():
+            if key not in in_columns and (value is not None or key not in self._columns):
+                rest[key] = value
+        return flat, encode_line(rest)
+
+    def encode(self, records: List[dict]):
+        if self.schema is None:
+            self._build_schema(records)
+        pa = self._pa
+        columns = [[] for _ in range(len(self._columns) + 1)]
+        for record in records:
+            flat, body = self._split(record)
+            for column, value in zip(columns, flat):
+                column.append(value)
+            columns[-1].append(body)
+        return pa.record_batch([pa.array(c, type=f.type) for c, f in zip(columns, self.schema)], schema=self.schema)
+
+
+def _batches(records: Iterable[Any], size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_columnar(records: Iterable[dict], out_file: str, file_format: str):
+    pa = _import_optional(file_format)
+    encoder = _ColumnarEncoder(pa)
+    writer = sink = None
+
+    def open_writer(schema):
+        nonlocal writer, sink
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(out_file, schema, compression='zstd')
+        else:
+            sink = pa.OSFile(out_file, 'wb')
+            writer = pa.ipc.new_stream(sink, schema)
+
+    try:
+        for batch in _batches(records, COLUMNAR_BATCH_RECORDS):
+            record_batch = encoder.encode(batch)
+            if writer is None:
+                open_writer(encoder.schema)
+            writer.write_batch(record_batch)
+        if writer is None:
+            # No records -- a readable file without rows is still created, as with json formats.
+            open_writer(pa.schema([pa.field(BODY_COLUMN, pa.binary())]))
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+
+
+def write_file(records: Iterable[Any], out_file: str, file_format: str, offset: Optional[int] = None,
+               on_chunk: Optional[Callable[[LineFile, bool], None]] = None):
+    """Writes records to the file.
+
+    `offset` and `on_chunk` are applicable to LINE_FORMATS only, see `LineFile` and `write_lines`.
+    """
+    file_format = file_format.lower()
+    if file_format in LINE_FORMATS:
+        with LineFile(out_file, file_format, offset) as f:
+            write_lines(records, f, on_chunk)
+    elif file_format in ('arrow', 'parquet'):
+        write_columnar(records, out_file, file_format)
+    else:
+        raise ValueError(f"Unknown file format: {file_format}")